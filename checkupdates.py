@@ -2,17 +2,16 @@
 
 # Check the NotEnoughMods mod list to compare the latest versions of mods with your versions
 
-MC_VERSION = "1.5.2"
 BOT_URL = "http://bot.notenoughmods.com/%s.json"
 ALL_MODS_DIR = "allmods"
 
 import os
-import urllib2
 import json
-import sys
+import argparse
 
 import modanalyzer
 import mcmodfixes
+import moddownload
 
 def compareName2ModID(name, modid):
     print "compare",name,modid,
@@ -61,16 +60,18 @@ def compareLocalMods(remoteMods, localRoots):
             print FORMAT % (tag, remoteVersion, version, path, modid)
 
 def main():
-    if len(sys.argv) == 1:
-        localRoots = [ALL_MODS_DIR]
-    else:
-        localRoots = sys.argv[1:]
+    parser = argparse.ArgumentParser(description="Compare the versions of your mods with the latest on NotEnoughMods")
+    parser.add_argument("localRoots", nargs="*", metavar="FOLDER", default=[ALL_MODS_DIR], help="folders of mods to check (default %s)" % (ALL_MODS_DIR,))
+    modanalyzer.addVersionArgument(parser)
+    args = parser.parse_args()
+    analyzer = modanalyzer.useVersionArgument(args)
 
+    print "Checking the NotEnoughMods list for Minecraft %s" % (analyzer.mcVersion,)
     #data = file("/Users/admin/Downloads/1.5.1.json").read()
-    data = urllib2.urlopen(BOT_URL % (MC_VERSION,)).read()
+    data = file(moddownload.download(BOT_URL % (analyzer.mcVersion,), useCache=False)).read()
     remoteMods = json.loads(data)
 
-    compareLocalMods(remoteMods, localRoots)
+    compareLocalMods(remoteMods, args.localRoots)
 
 if __name__ == "__main__":
     main()
@@ -1,119 +1,130 @@
 #!/usr/bin/python
 
 # Fixes and mod-specific data for various mods' mcmod.info files
-
-import fnmatch
-
-DEP_BLACKLIST = set((
-    "mod_MinecraftForge",   # we always have Forge
-    "Forge", # typo(?) for mod_MinecraftForge
-    "FML", # we always have FML
-    "MinecraftForge", # another typo for mod_MinecraftForge
-    "MinecraftForge, CodeChickenCore", # typo for CodeChickenCore, broken string instead of a real list
-    "MinecraftForge,CoFHCore", # typo for ["MinecraftForge","CoFHCore"]
-    "Industrialcraft", # typo for IC2
-    "GUI_Api", # typo for GuiAPI and not needed on server
-    "EurysCore", # replaced by SlimevoidLib?
-    "Modular Powersuits", # mmmPowersuits
-    "mod_NotEnoughItems", # chargepads
-    "mod_IC2", # MFFS
-    ))
-
-
-DEP_ADDITIONS = {
-    "MFFS": ["IC2"],
-    "gregtech": ["IC2"],
-    "dimensional-anchor": ["IC2"],
-    "MineFactoryReloaded": ["PowerCrystalsCore"],
-    "NetherOres": ["PowerCrystalsCore"],
-    "PowerConverters": ["PowerCrystalsCore"],
-    "FlatBedrock": ["PowerCrystalsCore"],
-    "immibis-microblocks": ["ImmibisCore"],
-    "SlopesAndCorners": ["SlimevoidLib"],
-    "ChickenChunks": ["CodeChickenCore"],
-    "EnderStorage": ["CodeChickenCore"],
-    "TrailMix": ["iChunUtil"],
-    "Torched": ["iChunUtil"],
-    "MPSA": ["mmmPowersuits"],
-    "ThermalExpansion": ["CoFHCore"],
-    "OmniTools": ["CoFHCore"],
-    "ElectricExpansion": ["BasicComponents"],
-    "OpenCCSensors": ["ComputerCraft"],
-    "Translocator": ["CodeChickenCore"],
-    "miscperipherals": ["ComputerCraft"],
-    "chargepads": ["NotEnoughItems"],
-    "MekanismGenerators": ["Mekanism"],
-    "MekanismTools": ["Mekanism"],
-    "thaumicbees": ["Forestry"],
-    "Galacticraft": ["IC2"], # requires IC2, UE, or TE - picked one: <strong><h1>Galacticraft Requires Basic Components, IndustrialCraft 2, or Thermal Expansion!</h1></strong><br /><h3>You can enable Basic Components loader in the Galacticraft config or install IndustrialCraft 2/Thermal Expansion manually</h3>
-    "extra-bees": ["Forestry"],
-    "PluginsforForestry": ["denLib", "Forestry", "ThermalExpansion"],
-    "DartCraft": ["IC2"],
-    }
-
-MOD_IDS = {
-    "PowerCrystalsCore*": ["PowerCrystalsCore"],
-    "*bspkrsCore*": ["mod_bspkrsCore"], # newline in json, can't parse
-    "BasicComponents*": ["BasicComponents"], # no mcmod.info
-    "denLib*": ["denLib"], # no mcmod.info
-    "DartCraft*": ["DartCraft"], # no mcmod.info
-    }
-
-FILENAME_HAS_NO_VERSION = [
-    "gregtechmod.zip", # "If you are unsure about your Version, look at the "mcmod.info" inside the zip, just open it with Notepad."
-    "WeaponMod.zip",
-    "Barrels 1.5+.jar",
-    "ArchimedesShips.zip",
-    ]
-
-REQUIRES_EXTRACTION = {
-    # mod name : extracted from this folder
-    "Millenaire": "Put in mods folder", 
-    "BattleTowers": "mods",
-    "KenshiroMod": "mods",
-    "MagicYarn": "mods",
-    "Ruins": "mods",
-    #"RopePlus": "mods", # not
-    "BetterDungeons": "mods", # but also requires extra files .minecraft..
-    "Dynmap": "mods",
-    }
-
-USES_UNSHIFTED_ITEM_IDS = [
-    "immibis-*",
-    ]
-
-# convert "name" on http://bot.notenoughmods.com/1.5.1.html to internal mod ID, when they don't match
-NEM_TO_MODID = {
-    "bau5_ProjectBench": "ProjectBench",
-    "TheBarrelsMod": "barrels",
-    "Buildcraft": "BuildCraft|Core",
-    "CustomMobSpawner": "CustomSpawner",
-    "Mo'Creatures": "MoCreatures",
-    "EquivalentExchange3": "EE3",
-    "GravityGun": "GraviGun",
-    "GregTech": "GregTech_Addon",
-    "NuclearControl": "IC2NuclearControl",
-    "Immibis'sMicroblocks": "ImmibisMicroblocks",
-    "Immibis'sPeripherals": "u'ImmibisPeripherals",
-    "IndustrialCraft2": "IC2",
-    "IronChests": "IronChest",
-    "AdvancedSolarPanels": "AdvancedSolarPanel",
-    "ModularPowersuits": "mmmPowersuits",
-    "ModularPowersuits-Addons": "u'PowersuitAddons",
-    "NEIMystcraftPlugin": "NEI-Mystcraft-Plugin",
-    "TinkersConstruct": "TConstruct",
-    "EnchantingPlus": "eplus",
-    }
+#
+# The rules are loaded from mcmodfixes.json, and can be overridden per pack by an
+# mcmodfixes-local.json in the working directory (its entries take precedence). Keys
+# starting with "#" are comments. Each table is compiled once into a single matcher,
+# with results memoized per filename.
+
+import os, json, fnmatch, re, collections
+
+RULES_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcmodfixes.json")
+LOCAL_RULES_FILENAME = "mcmodfixes-local.json"
+
+MAX_GROUPS_PER_REGEX = 99 # Python's re supports at most 100 groups
+GLOB_REGEX_SUFFIX = "\\Z(?ms)" # what fnmatch.translate() ends each regex with
+
+"""Translate a glob pattern to a regular expression without fnmatch's flags and end anchor, to combine with others."""
+def translateGlob(pattern):
+    regex = fnmatch.translate(pattern)
+    assert regex.endswith(GLOB_REGEX_SUFFIX), "unexpected fnmatch translation %r of %r" % (regex, pattern)
+    return regex[:-len(GLOB_REGEX_SUFFIX)]
+
+"""A table of (pattern, value) rules compiled for fast lookup of the first rule matching a name.
+
+Literal patterns go in a prefix trie (or a dict, for whole-name matches), patterns with
+wildcards are combined into a few regular expressions."""
+class Matcher(object):
+    def __init__(self, rules, prefix):
+        self.prefix = prefix
+        self.values = []
+        self.exact = {}     # whole-name literal -> rule index
+        self.trie = {}      # char -> node, None -> rule index at end of a prefix literal
+        self.regexes = []   # (combined regex, rule indexes of its groups)
+        self.cache = {}
+
+        globs = []
+        for pattern, value in rules:
+            n = len(self.values)
+            self.values.append(value)
+
+            if any(c in pattern for c in "*?["):
+                globs.append((pattern, n))
+            elif prefix:
+                node = self.trie
+                for c in pattern:
+                    node = node.setdefault(c, {})
+                node.setdefault(None, n)
+            else:
+                self.exact.setdefault(pattern, n)
+
+        for i in range(0, len(globs), MAX_GROUPS_PER_REGEX):
+            chunk = globs[i:i + MAX_GROUPS_PER_REGEX]
+            alternatives = []
+            for pattern, n in chunk:
+                if prefix: pattern += "*"
+                alternatives.append("(%s)" % (translateGlob(pattern),))
+            self.regexes.append((re.compile("(?:%s)\\Z" % ("|".join(alternatives),), re.S), [n for pattern, n in chunk]))
+
+    """Get the index of the first rule matching name, or None."""
+    def match(self, name):
+        found = self.exact.get(name)
+
+        node = self.trie
+        for c in name:
+            if node.has_key(None) and (found is None or node[None] < found):
+                found = node[None]
+            node = node.get(c)
+            if node is None: break
+        if node is not None and node.has_key(None) and (found is None or node[None] < found):
+            found = node[None]
+
+        for regex, indexes in self.regexes:
+            m = regex.match(name)
+            if m is not None:
+                n = indexes[m.lastindex - 1]
+                if found is None or n < found:
+                    found = n
+
+        return found
+
+    """Get the value of the first rule matching name, or default."""
+    def get(self, name, default=None):
+        if not self.cache.has_key(name):
+            self.cache[name] = self.match(name)
+        n = self.cache[name]
+        if n is None:
+            return default
+        return self.values[n]
+
+"""Load rule tables from JSON files, earlier files taking precedence. Returns table name -> ordered list of (key, value)."""
+def loadRules(filenames):
+    tables = collections.OrderedDict()
+    for filename in reversed(filenames):
+        if not os.path.exists(filename): continue
+
+        data = json.loads(file(filename).read(), object_pairs_hook=collections.OrderedDict)
+        for name, table in data.iteritems():
+            rules = [(str(k), v) for k, v in table.iteritems() if not k.startswith("#")]
+            overridden = set(k for k, v in rules)
+            tables[name] = rules + [(k, v) for k, v in tables.get(name, []) if k not in overridden]
+    return tables
+
+rules = None
+
+"""Get the compiled rules, loading them on first use."""
+def getRules():
+    global rules
+    if rules is None:
+        tables = loadRules([LOCAL_RULES_FILENAME, RULES_FILENAME])
+        rules = {
+            "DEP_BLACKLIST": set(k for k, v in tables["DEP_BLACKLIST"]),
+            "DEP_ADDITIONS": Matcher(tables["DEP_ADDITIONS"], prefix=True),
+            "MOD_IDS": Matcher(tables["MOD_IDS"], prefix=False),
+            "FILENAME_HAS_NO_VERSION": Matcher(tables["FILENAME_HAS_NO_VERSION"], prefix=True),
+            "REQUIRES_EXTRACTION": Matcher(tables["REQUIRES_EXTRACTION"], prefix=True),
+            "USES_UNSHIFTED_ITEM_IDS": Matcher(tables["USES_UNSHIFTED_ITEM_IDS"], prefix=True),
+            "NEM_TO_MODID": dict(tables["NEM_TO_MODID"]),   # convert "name" on http://bot.notenoughmods.com/1.5.1.html to internal mod ID, when they don't match
+            }
+    return rules
 
 def getExtraDeps(mod):
-    for k, v in DEP_ADDITIONS.iteritems():
-        if mod.startswith(k):
-            return set(v)
-    return set()
+    return set(getRules()["DEP_ADDITIONS"].get(mod, []))
 
 def fixDeps(mod, deps):
     deps = set(deps)
-    deps -= DEP_BLACKLIST
+    deps -= getRules()["DEP_BLACKLIST"]
     deps |= getExtraDeps(mod)
 
     deps = [dep.split("@")[0] for dep in deps]  # remove version constraints
@@ -122,32 +133,18 @@ def fixDeps(mod, deps):
 
 
 def fixModIDs(mod, ids):
-    for k, v in MOD_IDS.iteritems():
-        if fnmatch.fnmatch(mod, k):
-            return v 
-
-    return ids
+    return getRules()["MOD_IDS"].get(mod, ids)
 
 def modNeedsRename(fn):
-    for k in FILENAME_HAS_NO_VERSION:
-        if fn.startswith(k):
-            return True
-    return False
+    return getRules()["FILENAME_HAS_NO_VERSION"].get(fn) is not None
 
 """Get the folder name in a mod zip which tells you to install it into the mod folders."""
 def getInstructionFolder(fn):
-    for k, v in REQUIRES_EXTRACTION.iteritems():
-        if fn.startswith(k):
-            return v
-    return None
+    return getRules()["REQUIRES_EXTRACTION"].get(fn)
 
 
 def usesUnshiftedItemIDs(fn):
-    for k in USES_UNSHIFTED_ITEM_IDS:
-        if fn.startswith(k):
-            return True
-    return False
+    return getRules()["USES_UNSHIFTED_ITEM_IDS"].get(os.path.basename(fn)) is not None
 
 def fixNotEnoughModsName(name):
-    return NEM_TO_MODID.get(name, name)
-
+    return getRules()["NEM_TO_MODID"].get(name, name)
@@ -3,25 +3,74 @@
 MC_VERSION = "1.5.1"
 FORGE_VERSION = "7.8.0.712"
 
+# other versions to analyze with --version, each in its own namespace of VERSIONS_DIR
+VERSIONS_DIR = "versions"
+FORGE_VERSIONS = {      # Minecraft version -> default Forge version
+    "1.5.1": "7.8.0.712",
+    "1.5.2": "7.8.1.737",
+    }
+
+# sha256 of the Minecraft server and Forge downloads setupServer() verifies, by URL. Add each artifact's from a
+# download checked against the official release; until then a URL is pinned to the hash of its first download
+SERVER_SHA256 = {
+    }
+
 TEST_SERVER_ROOT = "temp-server"
+SERVER_POLL_INTERVAL = 0.1  # seconds between checks whether the server quit
+SERVER_LOGS = ("*.log", "crash-reports/*")  # where the server reports errors such as running out of memory
 TEST_SERVER_FILE = "minecraft_server+forge.jar"
-TEST_SERVER_CMD = "java -mx2G -jar %s nogui"
+TEST_SERVER_CMD = "java -mx%sM -jar %s nogui"
+SLOT_SERVER_ROOT = "temp-server-%s"    # for concurrent analysis runs after the first
 ANALYZER_FILENAME = "ModAnalyzer-1.0-SNAPSHOT.jar"
 
 ALL_MODS_DIR = "allmods"
 DATA_DIR = "data"
 CONFIGS_DIR = "configs"
-
-import os, urllib, zipfile, urllib2, tempfile, shutil, json, hashlib, types, pprint, sys, re
+CONFIG_OBJECTS_DIR = "configs/objects"   # config contents by hash, shared by the mods' config manifests
+EXTRACTED_CACHE_DIR = "cache/extracted"
+LINKED_EXTENSIONS = (".jar", ".zip", ".class")  # never written by mods, safe to share with the cache
+MEASURED_KINDS = ("profile",)  # per mod container measurements, see modprofile
+SECTIONS_DIR = "sections"     # sections dumped in each mod's analysis, all of them if missing (analyzed before they were selectable)
+
+# sections of the analysis ModAnalyzer.java can dump, and profiles of them to analyze with
+ANALYSIS_SECTIONS = ("profile", "block", "item", "biome", "enchantment", "entity", "smelting", "oredict", "crafting")
+ANALYSIS_PROFILES = {
+    "full": ANALYSIS_SECTIONS,
+    "ids": ("block", "item", "biome"),  # enough for modresolve's ID conflicts, without the large recipe and ore dictionary dumps
+    }
+DEFAULT_PROFILE = "full"
+
+# heap sizing from the peak memory use measured in earlier runs
+MEMORY_HISTORY_FILE = "memory-history.json"
+DEFAULT_HEAP_MB = 2048      # until the vanilla server was measured
+MIN_HEAP_MB = 256
+MAX_HEAP_MB = 4096          # also used to retry runs which ran out of memory with less
+HEAP_HEADROOM = 1.5         # heap given per MB of heap expected to be used
+JVM_OVERHEAD_MB = 200       # resident memory beyond the heap: permgen, code cache, thread stacks
+UNKNOWN_MOD_MB = 128        # expected memory growth of a mod not measured yet
+
+# durations, exit status and output size of each mod's analysis runs, for scheduling and progress
+RUN_HISTORY_FILE = "run-history.json"
+RUN_HISTORY_LENGTH = 20     # runs kept per mod
+DEFAULT_RUN_SECONDS = 60    # expected duration of a run while none was recorded
+PROGRESS_INTERVAL = 30      # seconds between progress lines while waiting for running servers
+
+import os, urllib, zipfile, urllib2, tempfile, shutil, json, hashlib, types, pprint, sys, re, time, subprocess, threading, Queue, argparse, glob
 
 import mcmodfixes
+import modcontents
+import moddownload
 
-def setupServer(serverFilename):
-    mcZip = getURLZip("http://assets.minecraft.net/%s/minecraft_server.jar" % (MC_VERSION.replace(".", "_"),))
-    if MC_VERSION == "1.5.1" and FORGE_VERSION == "7.8.0.712":
-        forgeZip = getURLZip("https://bitbucket.org/agaricusb/minecraftforge/downloads/minecraftforge-universal-1.5.1-7.8.0.712-1.5.1-dev-MCPC-R3.zip")
+def setupServer(serverFilename, mcVersion=MC_VERSION, forgeVersion=FORGE_VERSION):
+    mcURL = "http://assets.minecraft.net/%s/minecraft_server.jar" % (mcVersion.replace(".", "_"),)
+    if mcVersion == "1.5.1" and forgeVersion == "7.8.0.712":
+        forgeURL = "https://bitbucket.org/agaricusb/minecraftforge/downloads/minecraftforge-universal-1.5.1-7.8.0.712-1.5.1-dev-MCPC-R3.zip"
     else:
-        forgeZip = getURLZip("http://files.minecraftforge.net/minecraftforge/minecraftforge-universal-%s-%s.zip" % (MC_VERSION, FORGE_VERSION))
+        forgeURL = "http://files.minecraftforge.net/minecraftforge/minecraftforge-universal-%s-%s.zip" % (mcVersion, forgeVersion)
+
+    paths = moddownload.downloadAll([(url, SERVER_SHA256.get(url)) for url in (mcURL, forgeURL)])
+    mcZip = zipfile.ZipFile(paths[mcURL], 'r')
+    forgeZip = zipfile.ZipFile(paths[forgeURL], 'r')
 
     with zipfile.ZipFile(serverFilename, "w") as serverZip:
         for member in set(mcZip.namelist()) - set(forgeZip.namelist()):
@@ -40,19 +89,67 @@ def setupServer(serverFilename):
             print "O",member
     print "Server setup at",serverFilename
 
-def getURLZip(url):
-    f = tempfile.mktemp()
-    print "Retrieving %s..." % (url,)
-    urllib.urlretrieve(url, f)
-    return zipfile.ZipFile(f, 'r')
-
-def runServer():
-    print "Starting server..."
-    d = os.getcwd()
-    os.chdir(TEST_SERVER_ROOT)
-    os.system(TEST_SERVER_CMD % (TEST_SERVER_FILE,))
-    os.chdir(d)
-    print "Server terminated"
+def getURLZip(url, sha256=None):
+    return zipfile.ZipFile(moddownload.download(url, sha256), 'r')
+
+"""Run the server in serverRoot until it quits, or is killed after timeout seconds. Returns (peak resident memory in MB, or None if it can't be measured here,
+exit status, negative for the signal it was killed with).
+
+If sections is given, the analyzer dumps only those of ANALYSIS_SECTIONS."""
+def runServer(serverRoot=TEST_SERVER_ROOT, heapMB=DEFAULT_HEAP_MB, timeout=None, sections=None):
+    print "Starting server in %s with %s MB heap..." % (serverRoot, heapMB)
+    command = (TEST_SERVER_CMD % (heapMB, TEST_SERVER_FILE)).split()
+    if sections is not None:
+        command.insert(1, "-Dmodanalyzer.sections=%s" % (",".join(sections),))
+    process = subprocess.Popen(command, cwd=serverRoot)
+
+    # poll instead of a timer thread, so the server is only ever killed before it is reaped, never a reused pid
+    deadline = None
+    if timeout is not None:
+        deadline = time.time() + timeout
+    killed = False
+    while True:
+        if hasattr(os, "wait4"):
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+        elif process.poll() is not None:
+            break
+
+        if deadline is not None and not killed and time.time() >= deadline:
+            process.kill()
+            killed = True
+        time.sleep(SERVER_POLL_INTERVAL)
+
+    if not hasattr(os, "wait4"):
+        print "Server terminated"
+        return None, process.returncode
+
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    peakMB = usage.ru_maxrss / 1024
+    if sys.platform == "darwin": peakMB /= 1024  # bytes instead of KB
+    print "Server terminated, peak memory %s MB" % (peakMB,)
+    return peakMB, process.returncode
+
+"""Get the sizes of the server's log files and crash reports, to look only at what a run adds to them."""
+def getLogSizes(serverRoot):
+    sizes = {}
+    for pattern in SERVER_LOGS:
+        for path in glob.glob(os.path.join(serverRoot, pattern)):
+            sizes[path] = os.path.getsize(path)
+    return sizes
+
+"""Get whether text was logged by the server since the log sizes were taken with getLogSizes()."""
+def isLoggedSince(serverRoot, sizes, text):
+    for path in getLogSizes(serverRoot):
+        with open(path, "rb") as f:
+            f.seek(sizes.get(path, 0))
+            if text in f.read():
+                return True
+    return False
 
 def prepareCleanServerFolders(serverRoot):
     modsFolder = os.path.join(serverRoot, "mods")
@@ -71,30 +168,13 @@ def prepareCleanServerFolders(serverRoot):
 
     return modsFolder, coremodsFolder, configFolder
 
-def analyzeMod(fn, others=[]):
-    print "Analyzing %s... (deps=%s)" % (getModName(fn), others)
-    # clean
-    modsFolder, coremodsFolder, configFolder = prepareCleanServerFolders(TEST_SERVER_ROOT)
-
-    # install analyzer
-    shutil.copyfile(os.path.join("target", ANALYZER_FILENAME), os.path.join(modsFolder, ANALYZER_FILENAME))
-
-    # install mod
-    installMod(fn, modsFolder, coremodsFolder)
-
-    # install deps
-    for other in others:
-        installMod(other, modsFolder, coremodsFolder)
-
-    # running the server will load the analyzer, then quit
-    runServer()
-
 def isCoremod(fn):
     return readMcmodInfo(fn)["isCoremod"]
 
+"""Install a mod into the mods or coremods folder as appropriate. Returns list of installed file paths."""
 def installMod(fn, modsFolder, coremodsFolder):
     if fn is None: 
-        return
+        return []
 
     if isCoremod(fn):
         dest = coremodsFolder
@@ -104,32 +184,79 @@ def installMod(fn, modsFolder, coremodsFolder):
     instructionFolder = mcmodfixes.getInstructionFolder(os.path.basename(fn))
     if instructionFolder is not None:
         # we're not done yet..
-        hoopJumper(fn, instructionFolder, dest)
+        return hoopJumper(fn, instructionFolder, dest)
     else:
         # simple and easy file copy
-        shutil.copyfile(fn, os.path.join(dest, getModName(fn)))
+        path = os.path.join(dest, getModName(fn))
+        shutil.copyfile(fn, path)
+        return [path]
 
 """Jump through extra hoops required to install a mod, such as extracting a specific folder in a specific location."""
 def hoopJumper(fn, instructionFolder, dest):
+    extracted = getExtractedTree(fn, instructionFolder)
+
+    print "Installing double-zipped mod",fn,"from",extracted
+    installed = []
+    for path, dirs, files in os.walk(extracted):
+        relative = os.path.relpath(path, extracted)
+        targetDir = os.path.normpath(os.path.join(dest, relative))
+        _mkdir(targetDir)
+
+        for f in files:
+            target = os.path.join(targetDir, f)
+            linkOrCopy(os.path.join(path, f), target)
+            installed.append(target)
+
+    return installed
+
+"""Get a folder with the instruction folder contents of a double-zipped mod extracted, cached by the container's hash."""
+def getExtractedTree(fn, instructionFolder):
+    extracted = os.path.join(EXTRACTED_CACHE_DIR, getFileHash(fn))
+    if os.path.exists(extracted):
+        return extracted
+
     print "Extracting double-zipped mod",fn
+    _mkdir(EXTRACTED_CACHE_DIR)
+    tmp = tempfile.mkdtemp(dir=EXTRACTED_CACHE_DIR)
     with zipfile.ZipFile(fn) as containerZip:
         for name in containerZip.namelist():
-            parts = name.split(os.path.sep)
+            parts = name.split("/")  # zip paths always use /
             if instructionFolder not in parts:
                 # other documentation, etc.
                 continue
 
             # cut path at the "Put in mods folder" folder
             n = parts.index(instructionFolder)
-            path = os.path.sep.join(parts[n + 1:])
-            if path.endswith("/") or len(path) == 0:
-                #print "Creating",path
-                _mkdir(os.path.join(dest, path))
+            path = os.path.join(tmp, *parts[n + 1:])
+            if name.endswith("/"):
+                _mkdir(path)
                 continue
 
-            #print "Extracting",path
-            data = containerZip.read(name)
-            file(os.path.join(dest, path), "w").write(data)
+            mkdirContaining(path)
+            with open(path, "wb") as f:
+                shutil.copyfileobj(containerZip.open(name), f)
+
+    os.chmod(tmp, 0o755)
+    try:
+        os.rename(tmp, extracted)
+    except OSError:
+        if not os.path.exists(extracted): raise
+        shutil.rmtree(tmp)  # extracted concurrently by another analysis run
+    return extracted
+
+"""Hard link a code file to target, or copy it if it is data the mod might change (or hard links are unavailable)."""
+def linkOrCopy(source, target):
+    if os.path.exists(target):
+        os.remove(target)
+
+    if os.path.splitext(source)[1].lower() in LINKED_EXTENSIONS:
+        try:
+            os.link(source, target)
+            return
+        except (AttributeError, OSError):
+            pass  # other filesystem, or no hard links
+
+    shutil.copyfile(source, target)
 
 """Make the directory containing the given filename, if needed."""
 def mkdirContaining(filename):
@@ -158,39 +285,10 @@ def _mkdir(newdir):
             _mkdir(head)
         #print "_mkdir %s" % repr(newdir)
         if tail:
-            os.mkdir(newdir)
-
-def getModName(fn):
-    if fn is None:
-        return "Minecraft-%s" % (MC_VERSION,)
-    else:
-        return os.path.basename(fn)
-
-def getMods():
-    if not os.path.exists(ALL_MODS_DIR):
-        os.mkdir(ALL_MODS_DIR)
-    mods = []
-    for m in sorted(os.listdir(ALL_MODS_DIR)):
-        if m.startswith("."): continue
-
-        if mcmodfixes.modNeedsRename(m):
-            newName = uniquelyRenameMod(m)
-            print "Renaming non-unique mod filename %s -> %s" % (m, newName)
-            os.rename(os.path.join(ALL_MODS_DIR, m), os.path.join(ALL_MODS_DIR, newName))
-            m = newName
-
-        mods.append(os.path.join(ALL_MODS_DIR, m))
-    return mods
-
-"""Get a new hopefully more unique filename for mods named without their versions."""
-def uniquelyRenameMod(fn):
-    print "Getting unique filename for",fn
-    info = readMcmodInfo(os.path.join(ALL_MODS_DIR, fn))
-    version = getModVersion(fn, info)
-
-    original, ext = os.path.splitext(fn)
-
-    return "%s-%s%s" % (original, version, ext)
+            try:
+                os.mkdir(newdir)
+            except OSError:
+                if not os.path.isdir(newdir): raise  # else made concurrently by another process
 
 """Get version of mod."""
 def getModVersion(fn, info):
@@ -214,7 +312,17 @@ def getModVersion(fn, info):
 
     return "UNKNOWN" # sorry :(
 
+mcmodInfoCache = {}
+
+"""Read a mod's mcmod.info and other metadata. Remembered while the file is unchanged."""
 def readMcmodInfo(fn):
+    st = os.stat(fn)
+    key = (fn, st.st_size, st.st_mtime)
+    if not mcmodInfoCache.has_key(key):
+        mcmodInfoCache[key] = parseMcmodInfo(fn)
+    return mcmodInfoCache[key]
+
+def parseMcmodInfo(fn):
     if not fn.endswith(".jar") and not fn.endswith(".zip"): print "WARNING: non-zip/jar mod in",fn
     with zipfile.ZipFile(fn) as modZip:
         if "mcmod.info" in modZip.namelist():
@@ -235,10 +343,29 @@ def readMcmodInfo(fn):
             isCoremod = False
 
         # Filename and hash is essential
-        h = hashlib.sha256(file(fn).read()).hexdigest()
+        h = getFileHash(fn)
         mod = {"filename":fn, "sha256":h, "info":mcmod, "isCoremod": isCoremod}
     return mod
 
+fileHashCache = {}
+
+"""Get the SHA-256 hex digest of a file, reading it in chunks. Remembered while the file is unchanged."""
+def getFileHash(fn):
+    st = os.stat(fn)
+    key = (os.path.abspath(fn), st.st_size, st.st_mtime)
+    if not fileHashCache.has_key(key):
+        fileHashCache[key] = hashFile(fn)
+    return fileHashCache[key]
+
+def hashFile(fn):
+    h = hashlib.sha256()
+    with open(fn, "rb") as f:
+        while True:
+            data = f.read(64 * 1024)
+            if not data: break
+            h.update(data)
+    return h.hexdigest()
+
 """Get submod dict from a top-level mod info dict from readMcmodInfo()."""
 def getSubInfo(info):
     if isinstance(info["info"], types.DictType):
@@ -274,70 +401,10 @@ def getModIDs(fn, info):
             ids.add(sub["modid"])
     return mcmodfixes.fixModIDs(getModName(fn), ids)
 
-def getInfoFilename(mod):
-    return os.path.join(DATA_DIR, getModName(mod) + ".csv")
-
-def getConfigsDir(mod):
-    return os.path.join(CONFIGS_DIR, getModName(mod))
-
-"""Read the most recent analyzed mod unfiltered content lines."""
-def readModInfo():
-    return file(os.path.join(TEST_SERVER_ROOT, "mod-analysis.csv")).readlines()
-
-"""Write mod info to disk given unfiltered readModInfo() and list of other mod info lines (deps) to exclude."""
-def saveModInfo(mod, modLines, skip, allDeps):
-    lines = []
-    with file(getInfoFilename(mod), "w") as f:
-        for line in modLines:
-            notUs = False
-            for s in skip:
-                if line in s:
-                    notUs = True
-                    break
-
-            if notUs:
-                # skip content added by our dependencies
-                continue
-
-            f.write(line)
-            lines.append(line)
-
-    if len(lines) == 0:
-        print "*" * 70
-        print "WARNING: No content found in mod",mod  # maybe a non-content mod.. or maybe improperly installed?
-        print "*" * 70
-
-    # save default config
-    if os.path.exists(getConfigsDir(mod)): 
-        shutil.rmtree(getConfigsDir(mod))
-    os.mkdir(getConfigsDir(mod))
-
-    # filter deps configs
-    ignoreConfigs = []
-    for dep in allDeps:
-        depConfigs = os.listdir(getConfigsDir(dep))
-        print mod,dep,"DEPCONFIG",depConfigs
-        ignoreConfigs += depConfigs
-
-    for name in recursiveListdir(os.path.join(TEST_SERVER_ROOT, "config")):
-        sourcePath = os.path.join(TEST_SERVER_ROOT, "config", name)
-        targetPath = os.path.join(getConfigsDir(mod), name)
-
-        if os.path.isdir(sourcePath):
-            continue
-
-        if name in ignoreConfigs:
-            print "@ Ignoring dependency config",name
-            continue
-        else:
-            print "@ Copying config",name
-
-        mkdirContaining(targetPath)
-        shutil.copyfile(sourcePath, targetPath)
-
-    #shutil.copytree(os.path.join(TEST_SERVER_ROOT, "config"), getConfigsDir(mod))
-
-    return lines
+"""Read a config file without what changes on every run (Forge's "# Generated on" date). Returns (contents, hash)."""
+def readConfig(path):
+    data = re.sub(r"(?m)^# Generated on [^\r\n]*\r?\n", "", file(path, "rb").read())
+    return data, hashlib.sha256(data).hexdigest()
 
 """Get all files in a directory, including subdirectories."""
 def recursiveListdir(d):
@@ -352,136 +419,789 @@ def recursiveListdir(d):
             output.append(os.path.join(lastPath, f))
     return output
 
-"""Get all dependencies filenames of a mod given its filename, including subdependencies, ad infinitum, as a set."""
-def getRecursiveDepsFilenames(mod):
-    global fn2depsfn
-    
-    allDeps = set()
-
-    for dep in fn2depsfn[mod]:
-        allDeps.add(dep)
-        allDeps |= getRecursiveDepsFilenames(dep)
-
-    return allDeps
-
-"""Get analyzed mod content lines, possibly cached."""
-def getModAnalysis(mod):
-    global fn2depsfn, forceRescan
-
-    infoFile = getInfoFilename(mod) 
-    if not forceRescan and os.path.exists(infoFile):
-        print "Reusing cached",getModName(mod)
-        return file(infoFile).readlines()
-
-    # analyze dependencies first, recursively if needed
-    deps = getRecursiveDepsFilenames(mod)
+"""Load one mod's analysis file into dict keyed kind -> id -> key/value, as modcontents.KindTable's of typed values."""
+def loadMod(path):
+    content = {}
+    for line in file(path):
+        tokens = line.replace("\n", "").split("\t")
+        kind, id, key, value = tokens
+
+        table = content.get(kind)
+        if table is None:
+            table = content[kind] = modcontents.KindTable(kind)
+
+        table.put(id, key, value)
+
+    for table in content.itervalues():
+        table.freeze()
+
+    return content
+
+def median(values):
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+    middle = len(values) / 2
+    if len(values) % 2 == 0:
+        return (values[middle - 1] + values[middle]) / 2.0
+    return values[middle]
+
+def formatDuration(seconds):
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return "%dh%02dm" % (seconds / 3600, seconds % 3600 / 60)
+    if seconds >= 60:
+        return "%dm%02ds" % (seconds / 60, seconds % 60)
+    return "%ds" % (seconds,)
+
+"""Get memory in MB currently available for servers, or None if unknown."""
+def getAvailableMemoryMB():
+    try:
+        for line in file("/proc/meminfo"):
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) / 1024
+    except IOError:
+        pass
+    return None
+
+"""Raised by analyzeAll() when the mods left to analyze all wait on each other."""
+class CircularDependencyError(Exception):
+    def __init__(self, mods):
+        Exception.__init__(self, "Mods with circular dependencies, cannot continue: %s" % (" ".join(mods),))
+        self.mods = mods
+
+"""Progress of analyzeAll(), with the time left estimated from the expected run durations, corrected by how long the runs so far took."""
+class Progress(object):
+    def __init__(self, analyzer, total, jobs, expected, critical):
+        self.analyzer = analyzer
+        self.total = total
+        self.jobs = jobs
+        self.expected = expected    # mod -> expected seconds of its run
+        self.critical = critical    # mod -> expected seconds until it and the mods waiting on it are done
+        self.started = {}           # mod -> time started, while running
+        self.done = 0
+        self.actualSeconds = 0.0
+        self.expectedSeconds = 0.0
+        self.lastShown = time.time()
+
+    def start(self, mod):
+        self.started[mod] = time.time()
+
+    """Get how much longer runs take than expected in this session."""
+    def getScale(self):
+        if self.expectedSeconds == 0:
+            return 1.0
+        return self.actualSeconds / self.expectedSeconds
+
+    """Estimate seconds until all mods are analyzed: the remaining work spread over the jobs, but no less than the longest chain left."""
+    def getRemainingSeconds(self, pending):
+        now = time.time()
+        work = sum(self.expected[mod] for mod in pending)
+        chain = max([self.critical[mod] for mod in pending] or [0])
+        for mod, started in self.started.iteritems():
+            work += max(0, self.expected[mod] - (now - started))
+            chain = max(chain, self.critical[mod] - (now - started))
+
+        remaining = len(pending) + len(self.started)
+        if remaining == 0:
+            return 0
+        return self.getScale() * max(work / min(self.jobs, remaining), chain)
+
+    def finish(self, mod, pending):
+        seconds = time.time() - self.started.pop(mod)
+        self.done += 1
+        self.actualSeconds += seconds
+        self.expectedSeconds += self.expected[mod]
+        print "Analyzed %s in %s (%s/%s done, %s left)" % (self.analyzer.getModName(mod), formatDuration(seconds), self.done, self.total, formatDuration(self.getRemainingSeconds(pending)))
+        self.lastShown = time.time()
+
+    """Show the running mods every PROGRESS_INTERVAL seconds."""
+    def showRunning(self, pending):
+        now = time.time()
+        if now - self.lastShown < PROGRESS_INTERVAL:
+            return
+        self.lastShown = now
+
+        running = ", ".join("%s (%s)" % (self.analyzer.getModName(mod), formatDuration(now - started)) for mod, started in sorted(self.started.iteritems(), key=lambda entry: entry[1]))
+        print "Running %s; %s/%s done, %s left" % (running, self.done, self.total, formatDuration(self.getRemainingSeconds(pending)))
+
+def analysisWorker(analyzer, mod, serverRoot, heapMB, results):
+    try:
+        results.put((mod, analyzer.runAnalysis(mod, analyzer.getRecursiveDepsFilenames(mod), serverRoot, heapMB), None))
+    except Exception:
+        results.put((mod, None, sys.exc_info()))
+
+"""An analysis session: the Minecraft and Forge version, the folders it works in, its options and the dependency graph of its mods.
+
+Folders are relative to root, so sessions with different roots run at once in one process
+without sharing state, except for allModsDir and configObjectsDir if given. Parsed mcmod.info,
+file hashes and extracted mods are cached by file contents, so those caches are shared by all sessions."""
+class Analyzer(object):
+    def __init__(self, root="", forceRescan=False, analyzerPath=os.path.join("target", ANALYZER_FILENAME), profile=DEFAULT_PROFILE,
+            mcVersion=MC_VERSION, forgeVersion=FORGE_VERSION, allModsDir=None, configObjectsDir=None):
+        self.root = root
+        self.mcVersion = mcVersion
+        self.forgeVersion = forgeVersion
+        self.allModsDir = allModsDir or os.path.join(root, ALL_MODS_DIR)
+        self.dataDir = os.path.join(root, DATA_DIR)
+        self.sectionsDir = os.path.join(root, SECTIONS_DIR)
+        self.configsDir = os.path.join(root, CONFIGS_DIR)
+        self.configObjectsDir = configObjectsDir or os.path.join(root, CONFIG_OBJECTS_DIR)
+        self.serverRoot = os.path.join(root, TEST_SERVER_ROOT)
+        self.memoryHistoryFile = os.path.join(root, MEMORY_HISTORY_FILE)
+        self.runHistoryFile = os.path.join(root, RUN_HISTORY_FILE)
+        self.analyzerPath = analyzerPath
+        self.forceRescan = forceRescan
+        self.setProfile(profile)
+
+        self.fn2deps = {}           # mod filename -> dependency mod IDs, set by loadDependencies()
+        self.fn2depsfn = {None: []} # mod filename -> dependency filenames
+
+    """Get the name of a mod's analysis, or of vanilla Minecraft for None."""
+    def getModName(self, fn):
+        if fn is None:
+            return "Minecraft-%s" % (self.mcVersion,)
+        else:
+            return os.path.basename(fn)
+
+    def getMods(self):
+        if not os.path.exists(self.allModsDir):
+            os.mkdir(self.allModsDir)
+        mods = []
+        for m in sorted(os.listdir(self.allModsDir)):
+            if m.startswith("."): continue
+
+            if mcmodfixes.modNeedsRename(m):
+                newName = self.uniquelyRenameMod(m)
+                print "Renaming non-unique mod filename %s -> %s" % (m, newName)
+                os.rename(os.path.join(self.allModsDir, m), os.path.join(self.allModsDir, newName))
+                m = newName
+
+            mods.append(os.path.join(self.allModsDir, m))
+        return mods
+
+    """Get a new hopefully more unique filename for mods named without their versions."""
+    def uniquelyRenameMod(self, fn):
+        print "Getting unique filename for",fn
+        info = readMcmodInfo(os.path.join(self.allModsDir, fn))
+        version = getModVersion(fn, info)
+
+        original, ext = os.path.splitext(fn)
+
+        return "%s-%s%s" % (original, version, ext)
+
+    def getInfoFilename(self, mod):
+        return os.path.join(self.dataDir, self.getModName(mod) + ".csv")
+
+    """Analyze with the sections of one of ANALYSIS_PROFILES."""
+    def setProfile(self, profile):
+        self.sections = ANALYSIS_PROFILES[profile]
+
+    def getSectionsFilename(self, mod):
+        return os.path.join(self.sectionsDir, self.getModName(mod) + ".txt")
+
+    """Get the set of sections a mod's saved analysis has, or None if it wasn't analyzed."""
+    def getAnalyzedSections(self, mod):
+        if not os.path.exists(self.getInfoFilename(mod)):
+            return None
+
+        filename = self.getSectionsFilename(mod)
+        if not os.path.exists(filename):
+            return set(ANALYSIS_SECTIONS)
+        return set(section for section in file(filename).read().strip().split(",") if section != "")
+
+    """Check if a mod's saved analysis has all the sections to analyze (default: those of the session's profile)."""
+    def isAnalyzed(self, mod, sections=None):
+        if sections is None: sections = self.sections
+        analyzed = self.getAnalyzedSections(mod)
+        return analyzed is not None and set(sections) <= analyzed
+
+    """Get the folder of a mod's default configs, as saved before the config store."""
+    def getConfigsDir(self, mod):
+        return os.path.join(self.configsDir, self.getModName(mod))
+
+    def getConfigManifestFilename(self, mod):
+        return os.path.join(self.configsDir, self.getModName(mod) + ".json")
+
+    def getConfigObjectPath(self, h):
+        return os.path.join(self.configObjectsDir, h[:2], h)
+
+    """Store config contents under their hash, unless already stored."""
+    def storeConfig(self, data, h):
+        objectPath = self.getConfigObjectPath(h)
+        if os.path.exists(objectPath):
+            return
+
+        mkdirContaining(objectPath)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(objectPath))  # unique, other processes might be storing it too
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, objectPath)
+
+    """Get a mod's default config manifest: config name -> hash of contents in the store, or None if not saved in the store."""
+    def loadConfigManifest(self, mod):
+        filename = self.getConfigManifestFilename(mod)
+        if not os.path.exists(filename):
+            return None
+        return json.loads(file(filename).read())
+
+    """Get list of config name and path to read it from, for a mod's default configs."""
+    def getConfigEntries(self, mod):
+        manifest = self.loadConfigManifest(mod)
+        if manifest is not None:
+            return [(name, self.getConfigObjectPath(h)) for name, h in sorted(manifest.iteritems())]
+
+        configDir = self.getConfigsDir(mod)
+        return [(name, os.path.join(configDir, name)) for name in sorted(recursiveListdir(configDir))]
+
+    """Read the most recent analyzed mod unfiltered content lines."""
+    def readModInfo(self, serverRoot=None):
+        if serverRoot is None: serverRoot = self.serverRoot
+        return file(os.path.join(serverRoot, "mod-analysis.csv")).readlines()
+
+    """Write mod info to disk given unfiltered readModInfo() and list of other mod info lines (deps) to exclude."""
+    def saveModInfo(self, mod, modLines, skip, allDeps, serverRoot=None):
+        if serverRoot is None: serverRoot = self.serverRoot
+
+        # measurements differ between runs, so skip those of the mod containers our dependencies had instead of identical lines
+        depMeasured = set()
+        for s in skip:
+            for line in s:
+                kind, id = line.split("\t")[:2]
+                if kind in MEASURED_KINDS:
+                    depMeasured.add((kind, id))
+
+        lines = []
+        with file(self.getInfoFilename(mod), "w") as f:
+            for line in modLines:
+                notUs = tuple(line.split("\t")[:2]) in depMeasured
+                for s in skip:
+                    if line in s:
+                        notUs = True
+                        break
+
+                if notUs:
+                    # skip content added by our dependencies
+                    continue
+
+                f.write(line)
+                lines.append(line)
+
+        if len(lines) == 0:
+            print "*" * 70
+            print "WARNING: No content found in mod",mod  # maybe a non-content mod.. or maybe improperly installed?
+            print "*" * 70
+
+        # filter deps configs by name: a dependency's config is installed with the dependency, even if this mod changed it
+        depConfigs = {}  # name -> hash, None for deps saved before the config store
+        for dep in allDeps:
+            depManifest = self.loadConfigManifest(dep)
+            if depManifest is not None:
+                depConfigs.update(depManifest)
+            else:
+                depConfigs.update((name, None) for name, path in self.getConfigEntries(dep))
+
+        # save default config, each file once in the store
+        manifest = {}
+        for name in recursiveListdir(os.path.join(serverRoot, "config")):
+            sourcePath = os.path.join(serverRoot, "config", name)
+
+            if os.path.isdir(sourcePath):
+                continue
 
-    # everything depends on vanilla ("None"), except vanilla
-    if mod is not None:
-        allDeps = set([None]) | deps
+            data, h = readConfig(sourcePath)
+            if name in depConfigs:
+                if depConfigs[name] not in (None, h):
+                    print "@ Ignoring dependency config %s, changed by this mod" % (name,)
+                else:
+                    print "@ Ignoring dependency config",name
+                continue
+            else:
+                print "@ Storing config",name
+
+            self.storeConfig(data, h)
+            manifest[name] = h
+
+        if os.path.exists(self.getConfigsDir(mod)):
+            shutil.rmtree(self.getConfigsDir(mod))
+        file(self.getConfigManifestFilename(mod), "w").write(json.dumps(manifest, sort_keys=True, indent=1))
+
+        # record the sections dumped, unless all were by an analyzer predating them
+        sectionsFile = os.path.join(serverRoot, "mod-analysis.sections")
+        if os.path.exists(sectionsFile):
+            mkdirContaining(self.getSectionsFilename(mod))
+            shutil.copyfile(sectionsFile, self.getSectionsFilename(mod))
+        elif os.path.exists(self.getSectionsFilename(mod)):
+            os.remove(self.getSectionsFilename(mod))
+
+        return lines
+
+    """Get all dependencies filenames of a mod given its filename, including subdependencies, ad infinitum, as a set."""
+    def getRecursiveDepsFilenames(self, mod):
+        allDeps = set()
+
+        for dep in self.fn2depsfn[mod]:
+            allDeps.add(dep)
+            allDeps |= self.getRecursiveDepsFilenames(dep)
+
+        return allDeps
+
+    """Get all dependencies filenames of a mod, including vanilla ("None"), which everything except vanilla depends on."""
+    def getAllDepsFilenames(self, mod):
+        deps = self.getRecursiveDepsFilenames(mod)
+        if mod is not None:
+            return set([None]) | deps
+        return deps
+
+    """Get analyzed mod content lines, possibly cached."""
+    def getModAnalysis(self, mod):
+        infoFile = self.getInfoFilename(mod)
+        if not self.forceRescan and self.isAnalyzed(mod):
+            print "Reusing cached",self.getModName(mod)
+            return file(infoFile).readlines()
+
+        # analyze dependencies first, recursively if needed
+        deps = self.getRecursiveDepsFilenames(mod)
+        allDeps = self.getAllDepsFilenames(mod)
+
+        depsAnalyzed = []
+        for dep in allDeps:
+            depsAnalyzed.append(self.getModAnalysis(dep))
+
+        # grab the content
+        history = self.loadMemoryHistory()
+        heapMB = self.getHeapMB(mod, history)
+        unfilteredInfo, peakMB, heapMB, runs = self.runAnalysis(mod, deps, self.serverRoot, heapMB)
+        self.recordMemory(history, mod, peakMB, heapMB)
+        self.saveMemoryHistory(history)
+        runHistory = self.loadRunHistory()
+        self.recordRuns(runHistory, mod, runs)
+        self.saveRunHistory(runHistory)
+
+        # save filter through dependencies
+        return self.saveModInfo(mod, unfilteredInfo, depsAnalyzed, allDeps)
+
+    """Run the analyzer on a mod and its dependencies in serverRoot, dumping sections (default: those of the session's profile).
+
+    Returns (peak memory of the server in MB or None, the run for recordRuns())."""
+    def analyzeMod(self, fn, others=[], serverRoot=None, heapMB=DEFAULT_HEAP_MB, timeout=None, sections=None):
+        if serverRoot is None: serverRoot = self.serverRoot
+        if sections is None: sections = self.sections
+
+        print "Analyzing %s... (deps=%s)" % (self.getModName(fn), others)
+        # clean
+        modsFolder, coremodsFolder, configFolder = prepareCleanServerFolders(serverRoot)
+        for name in ("mod-analysis.csv", "mod-analysis.sections"):
+            if os.path.exists(os.path.join(serverRoot, name)):
+                os.remove(os.path.join(serverRoot, name))  # don't mistake a previous run's results for this one's
+        analysisFile = os.path.join(serverRoot, "mod-analysis.csv")
+
+        # install analyzer
+        shutil.copyfile(self.analyzerPath, os.path.join(modsFolder, ANALYZER_FILENAME))
+
+        # install mod
+        installMod(fn, modsFolder, coremodsFolder)
+
+        # install deps
+        for other in others:
+            installMod(other, modsFolder, coremodsFolder)
+
+        # running the server will load the analyzer, then quit
+        started = time.time()
+        logSizes = getLogSizes(serverRoot)
+        peakMB, exitStatus = runServer(serverRoot, heapMB, timeout, sections)
+
+        outputBytes = 0
+        if os.path.exists(analysisFile):
+            outputBytes = os.path.getsize(analysisFile)
+        # out of heap if it said so, or if its resident memory grew to the whole heap
+        outOfMemory = isLoggedSince(serverRoot, logSizes, "OutOfMemoryError") or (peakMB is not None and peakMB >= heapMB + JVM_OVERHEAD_MB)
+        run = {"started": started, "seconds": round(time.time() - started, 1), "exitStatus": exitStatus, "outputBytes": outputBytes,
+            "heapMB": heapMB, "sections": list(sections), "outOfMemory": outOfMemory}
+        return peakMB, run
+
+    """Analyze a mod in serverRoot, retrying with the most heap if it ran out of memory. Returns (unfiltered content lines, peak memory MB or None, heap MB, runs)."""
+    def runAnalysis(self, mod, deps, serverRoot, heapMB, sections=None):
+        peakMB, run = self.analyzeMod(mod, deps, serverRoot, heapMB, sections=sections)
+        runs = [run]
+        if not os.path.exists(os.path.join(serverRoot, "mod-analysis.csv")) and run["outOfMemory"] and heapMB < MAX_HEAP_MB:
+            print "Analysis of %s failed with %s MB heap, retrying with %s MB" % (self.getModName(mod), heapMB, MAX_HEAP_MB)
+            heapMB = MAX_HEAP_MB
+            peakMB, run = self.analyzeMod(mod, deps, serverRoot, heapMB, sections=sections)
+            runs.append(run)
+        return self.readModInfo(serverRoot), peakMB, heapMB, runs
+
+    def loadMemoryHistory(self):
+        if not os.path.exists(self.memoryHistoryFile):
+            return {}
+        return json.loads(file(self.memoryHistoryFile).read())
+
+    def saveMemoryHistory(self, history):
+        file(self.memoryHistoryFile, "w").write(json.dumps(history, sort_keys=True, indent=1))
+
+    """Estimate peak memory in MB of a server with the given mods added to vanilla, or None if vanilla wasn't measured yet."""
+    def estimatePeakMB(self, mods, history):
+        baseline = history.get(self.getModName(None))
+        if baseline is None:
+            return None
+
+        peakMB = baseline["peakMB"]
+        for mod in mods:
+            if mod is None: continue
+            peakMB += history.get(self.getModName(mod), {}).get("growthMB", UNKNOWN_MOD_MB)
+        return peakMB
+
+    """Remember the peak memory of a mod's analysis run, and how much the mod added over its dependencies."""
+    def recordMemory(self, history, mod, peakMB, heapMB):
+        if peakMB is None:
+            return
+
+        growthMB = 0
+        if mod is not None:
+            expectedMB = self.estimatePeakMB(self.getRecursiveDepsFilenames(mod), history)
+            if expectedMB is not None:
+                growthMB = max(0, peakMB - expectedMB)
+
+        history[self.getModName(mod)] = {"peakMB": peakMB, "growthMB": growthMB, "heapMB": heapMB}
+
+    """Get the heap size in MB to analyze a mod with, from its measured peak memory, or else estimated from its dependencies'."""
+    def getHeapMB(self, mod, history):
+        entry = history.get(self.getModName(mod))
+        if entry is not None:
+            peakMB = entry["peakMB"]
+        else:
+            peakMB = self.estimatePeakMB(self.getRecursiveDepsFilenames(mod) | set([mod]), history)
+
+        if peakMB is None:
+            return DEFAULT_HEAP_MB
+
+        heapMB = int((peakMB - JVM_OVERHEAD_MB) * HEAP_HEADROOM)
+        heapMB = (heapMB + 63) / 64 * 64
+        return max(MIN_HEAP_MB, min(MAX_HEAP_MB, heapMB))
+
+    def loadRunHistory(self):
+        if not os.path.exists(self.runHistoryFile):
+            return {}
+        return json.loads(file(self.runHistoryFile).read())
+
+    def saveRunHistory(self, history):
+        file(self.runHistoryFile, "w").write(json.dumps(history, sort_keys=True, indent=1))
+
+    """Add analysis runs of a mod to the run history, except those already in it, keeping the last RUN_HISTORY_LENGTH."""
+    def recordRuns(self, history, mod, runs):
+        modRuns = history.setdefault(self.getModName(mod), [])
+        recorded = set(run["started"] for run in modRuns)
+        modRuns.extend(run for run in runs if run["started"] not in recorded)
+        modRuns.sort(key=lambda run: run["started"])
+        del modRuns[:-RUN_HISTORY_LENGTH]
+
+    """Get the expected seconds to analyze a mod, from its recorded successful runs, or else the median of all mods'."""
+    def getExpectedSeconds(self, mod, history):
+        seconds = median([run["seconds"] for run in history.get(self.getModName(mod), []) if run["outputBytes"] > 0])
+        if seconds is not None:
+            return seconds
+
+        seconds = median([median([run["seconds"] for run in modRuns]) for modRuns in history.itervalues() if len(modRuns) > 0])
+        if seconds is not None:
+            return seconds
+        return DEFAULT_RUN_SECONDS
+
+    """Get the expected seconds from starting each mod until all mods waiting on it are done: its own run plus the longest chain of its dependents."""
+    def getCriticalPathSeconds(self, mods, expected):
+        dependents = dict((mod, []) for mod in mods)
+        for mod in mods:
+            for dep in self.getAllDepsFilenames(mod):
+                if dependents.has_key(dep):
+                    dependents[dep].append(mod)
+
+        critical = {}
+        def getCritical(mod):
+            if not critical.has_key(mod):
+                critical[mod] = expected[mod] + max([getCritical(other) for other in dependents[mod]] or [0])
+            return critical[mod]
+
+        for mod in mods:
+            getCritical(mod)
+        return critical
+
+    """Get the server folder of a concurrent analysis slot, setting it up from the test server if needed."""
+    def getSlotServerRoot(self, slot):
+        if slot == 0:
+            return self.serverRoot
+
+        serverRoot = os.path.join(self.root, SLOT_SERVER_ROOT % (slot,))
+        self.prepareServerCopy(serverRoot)
+        return serverRoot
+
+    """Set up another server folder like the test server, to run servers in without touching it."""
+    def prepareServerCopy(self, serverRoot):
+        _mkdir(serverRoot)
+        server = os.path.join(serverRoot, TEST_SERVER_FILE)
+        if not os.path.exists(server):
+            linkOrCopy(os.path.join(self.serverRoot, TEST_SERVER_FILE), server)
+
+        # libraries downloaded by FML on first start
+        lib = os.path.join(self.serverRoot, "lib")
+        if os.path.exists(lib) and not os.path.exists(os.path.join(serverRoot, "lib")):
+            shutil.copytree(lib, os.path.join(serverRoot, "lib"))
+
+    """Analyze all mods not analyzed yet, dependencies first, running up to 'jobs' servers at once within memoryMB.
+
+    Mods ready to analyze are started longest first, by their recorded run durations and those of the
+    mods waiting on them, then largest expected heap first. Each is started if it fits in the memory
+    left, so small boots fill in around the large ones."""
+    def analyzeAll(self, mods, jobs=1, memoryMB=None, rescan=False):
+        pending = []
+        for mod in mods:
+            if not (self.forceRescan or rescan) and self.isAnalyzed(mod):
+                print "Reusing cached",self.getModName(mod)
+            else:
+                pending.append(mod)
+
+        history = self.loadMemoryHistory()
+        runHistory = self.loadRunHistory()
+        expected = dict((mod, self.getExpectedSeconds(mod, runHistory)) for mod in pending)
+        critical = self.getCriticalPathSeconds(pending, expected)
+        progress = Progress(self, len(pending), jobs, expected, critical)
+
+        running = {}    # slot -> (mod, reserved MB)
+        results = Queue.Queue()
+        while len(pending) > 0 or len(running) > 0:
+            busy = set(pending) | set(mod for mod, reservedMB in running.itervalues())
+            ready = [mod for mod in pending if len(self.getAllDepsFilenames(mod) & busy) == 0]
+            ready.sort(key=lambda mod: (critical[mod], self.getHeapMB(mod, history)), reverse=True)
+
+            for mod in ready:
+                freeSlots = [slot for slot in range(jobs) if not running.has_key(slot)]
+                if len(freeSlots) == 0: break
+
+                heapMB = self.getHeapMB(mod, history)
+                reservedMB = heapMB + JVM_OVERHEAD_MB
+                usedMB = sum(reserved for other, reserved in running.itervalues())
+                if memoryMB is not None and len(running) > 0 and usedMB + reservedMB > memoryMB:
+                    continue
+
+                slot = freeSlots[0]
+                pending.remove(mod)
+                running[slot] = (mod, reservedMB)
+                progress.start(mod)
+                thread = threading.Thread(target=analysisWorker, args=(self, mod, self.getSlotServerRoot(slot), heapMB, results))
+                thread.daemon = True
+                thread.start()
+
+            if len(running) == 0:
+                raise CircularDependencyError(sorted(self.getModName(mod) for mod in pending))
+
+            while True:
+                try:
+                    mod, result, error = results.get(True, 1)
+                    break
+                except Queue.Empty:
+                    pass  # waiting with a timeout keeps Ctrl-C working
+                progress.showRunning(pending)
+
+            slot = [slot for slot, (other, reservedMB) in running.iteritems() if other == mod][0]
+            del running[slot]
+            if error is not None:
+                raise error[0], error[1], error[2]
+
+            # save filter through dependencies, before the slot is reused
+            unfilteredInfo, peakMB, heapMB, runs = result
+            allDeps = self.getAllDepsFilenames(mod)
+            depsAnalyzed = [file(self.getInfoFilename(dep)).readlines() for dep in allDeps]
+            self.saveModInfo(mod, unfilteredInfo, depsAnalyzed, allDeps, self.getSlotServerRoot(slot))
+
+            self.recordMemory(history, mod, peakMB, heapMB)
+            self.saveMemoryHistory(history)
+            self.recordRuns(runHistory, mod, runs)
+            self.saveRunHistory(runHistory)
+            progress.finish(mod, pending)
+
+    """Load content into dict keyed mod name -> kind -> id -> key/value."""
+    def load(self):
+        contents = {}
+        for filename in os.listdir(self.dataDir):
+            if filename.startswith("."): continue
+
+            contents[filename] = loadMod(os.path.join(self.dataDir, filename))
+
+        return contents
+
+    """Read the dependencies of mods (default: all in allmods), into fn2deps (mod filename -> dependency mod IDs) and fn2depsfn (-> dependency filenames).
+
+    Returns mod filename -> dependency mod IDs not found, which are left out of fn2depsfn."""
+    def loadDependencies(self, mods=None):
+        if mods is None:
+            mods = self.getMods()
+
+        # gather dependencies
+        modid2fn = {}
+        fn2deps = {}
+        for fn in mods:
+            info = readMcmodInfo(fn)
+            deps = getDeps(fn, info)
+
+            for modid in getModIDs(fn, info):
+                modid2fn[modid] = fn
+
+            fn2deps[fn] = mcmodfixes.fixDeps(fn, deps)
+            if len(deps) != 0:
+                print fn,deps
+
+        # build mod filename -> dependency filenames
+        fn2depsfn = {None: []}
+        missing = {}
+        for fn, deps in fn2deps.iteritems():
+            for dep in deps:
+                if not modid2fn.has_key(dep):
+                    missing.setdefault(fn, []).append(dep)
+
+            fn2depsfn[fn] = [modid2fn[dep] for dep in deps if modid2fn.has_key(dep) and modid2fn[dep] != fn]
+
+        self.fn2deps = fn2deps
+        self.fn2depsfn = fn2depsfn
+        return missing
+
+    """Read the dependencies of all mods, exiting if any are missing."""
+    def requireDependencies(self):
+        missing = self.loadDependencies()
+        for fn, deps in sorted(missing.iteritems()):
+            print "Mod %s is missing dependency: %s. Cannot continue" % (fn, ", ".join(deps))
+        if len(missing) > 0:
+            sys.exit(-1)
+
+    """Build the analyzer mod and set up the test server, if not done yet."""
+    def setupTestServer(self):
+        # setup analyzer
+        if not os.path.exists(self.analyzerPath):
+            os.system("mvn initialize -P -built")
+            os.system("mvn package")
+
+        # setup server
+        server = os.path.join(self.serverRoot, TEST_SERVER_FILE)
+        if not os.path.exists(server):
+            _mkdir(self.serverRoot)
+            setupServer(server, self.mcVersion, self.forgeVersion)
+        print "Using server at:",server
+
+    """Get ready to analyze: read the dependencies, set up the server and make the folders for the results."""
+    def prepare(self):
+        self.requireDependencies()
+        self.setupTestServer()
+
+        _mkdir(self.dataDir)
+        _mkdir(self.configsDir)
+
+    """Analyze the mods in allmods not analyzed yet, and vanilla for reference."""
+    def run(self, jobs=1, memoryMB=None):
+        self.prepare()
+        if memoryMB is None:
+            memoryMB = getAvailableMemoryMB()
+        self.analyzeAll([None] + self.getMods(), jobs, memoryMB)
+
+"""Parse a "MC" or "MC/Forge" version, such as "1.5.2/7.8.1.737", into (MC version, Forge version)."""
+def parseVersion(version):
+    if "/" in version:
+        mcVersion, forgeVersion = version.split("/", 1)
     else:
-        allDeps = deps
-
-    depsAnalyzed = []
-    for dep in allDeps:
-        depsAnalyzed.append(getModAnalysis(dep))
-
-    # grab the content
-    analyzeMod(mod, deps)
-    unfilteredInfo = readModInfo()
-
-    # save filter through dependencies
-    info = saveModInfo(mod, unfilteredInfo, depsAnalyzed, allDeps)
-
-
-    return info
-
-"""Load content into dict keyed mod name -> kind -> id -> key/value."""
-def load():
-    contents = {}
-    for filename in os.listdir(DATA_DIR):
-        if filename.startswith("."): continue
-
-        path = os.path.join(DATA_DIR, filename)
-
-        content = {}
-        for line in file(path).readlines():
-            tokens = line.replace("\n", "").split("\t")
-            kind, id, key, value = tokens
-
-            # how I miss autovivification..
-            if not content.has_key(kind):
-                content[kind] = {}
-
-            if not content[kind].has_key(id):
-                content[kind][id] = {}
-
-            content[kind][id][key] = value
-
-        contents[filename] = content
+        mcVersion = version
+        if not FORGE_VERSIONS.has_key(mcVersion):
+            raise ValueError("No default Forge version for Minecraft %s, give it as %s/FORGE" % (mcVersion, mcVersion))
+        forgeVersion = FORGE_VERSIONS[mcVersion]
+    return mcVersion, forgeVersion
+
+"""Get a session analyzing the mods in allmods for a Minecraft and Forge version.
+
+The default version works in the current directory, others in their own namespace in VERSIONS_DIR,
+with their own server, results and histories. Config contents are stored once for all versions."""
+def getVersionSession(mcVersion=MC_VERSION, forgeVersion=FORGE_VERSION, **options):
+    root = ""
+    if (mcVersion, forgeVersion) != (MC_VERSION, FORGE_VERSION):
+        root = os.path.join(VERSIONS_DIR, "%s-%s" % (mcVersion, forgeVersion))
+    return Analyzer(root, mcVersion=mcVersion, forgeVersion=forgeVersion, allModsDir=ALL_MODS_DIR, configObjectsDir=CONFIG_OBJECTS_DIR, **options)
+
+"""Analyze the mods for several versions at once, sharing the jobs and memory between them.
+
+With fewer jobs than versions, the versions are analyzed one after another instead, each with all of them."""
+def runVersions(analyzers, jobs=1, memoryMB=None):
+    for analyzer in analyzers:
+        print "Preparing Minecraft %s with Forge %s in %s" % (analyzer.mcVersion, analyzer.forgeVersion, analyzer.serverRoot)
+        analyzer.prepare()
+
+    if memoryMB is None:
+        memoryMB = getAvailableMemoryMB()
+
+    if jobs < len(analyzers):
+        for analyzer in analyzers:
+            analyzer.analyzeAll([None] + analyzer.getMods(), jobs, memoryMB)
+        return
 
-    return contents
+    if memoryMB is not None:
+        memoryMB /= len(analyzers)
+    # split the jobs exactly, the first versions getting any left over
+    share, extra = divmod(jobs, len(analyzers))
+    versionJobs = [share + (1 if i < extra else 0) for i in range(len(analyzers))]
+
+    errors = []
+    def analyzeVersion(analyzer, jobs):
+        try:
+            analyzer.analyzeAll([None] + analyzer.getMods(), jobs, memoryMB)
+        except BaseException:
+            errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=analyzeVersion, args=(analyzer, versionJobs[i])) for i, analyzer in enumerate(analyzers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        while thread.isAlive():
+            thread.join(1)  # waiting with a timeout keeps Ctrl-C working
+
+    if len(errors) > 0:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+# module-level functions working in the default session
+SESSION_FUNCTIONS = ("getModName", "getMods", "getInfoFilename", "getSectionsFilename", "getAnalyzedSections", "isAnalyzed",
+    "getConfigsDir", "getConfigManifestFilename", "getConfigObjectPath", "storeConfig", "loadConfigManifest", "getConfigEntries",
+    "readModInfo", "saveModInfo", "getRecursiveDepsFilenames", "getAllDepsFilenames", "getModAnalysis", "analyzeMod", "runAnalysis",
+    "loadMemoryHistory", "saveMemoryHistory", "loadRunHistory", "saveRunHistory", "recordRuns", "getExpectedSeconds",
+    "estimatePeakMB", "recordMemory", "getHeapMB", "getSlotServerRoot", "prepareServerCopy", "analyzeAll", "load",
+    "loadDependencies", "requireDependencies", "setupTestServer")
+
+# the session in the current directory, for the default version, never replaced: other versions get their own Analyzer
+session = Analyzer()
+globals().update((name, getattr(session, name)) for name in SESSION_FUNCTIONS)
+
+"""Add a --version option to a script's parser, to work on the results of another version than MC_VERSION."""
+def addVersionArgument(parser):
+    parser.add_argument("--version", help="Minecraft version, or MC/Forge version, analyzed with modanalyzer.py --version (default %s/%s)" % (MC_VERSION, FORGE_VERSION))
+
+"""Get the session of the version given with --version, or the default session."""
+def useVersionArgument(args):
+    if args.version is None:
+        return session
+    return getVersionSession(*parseVersion(args.version))
 
 def main():
-    global fn2depsfn, fn2deps, forceRescan
-
-    forceRescan = False
-
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--force-rescan":
-            forceRescan = True # TODO: proper argument parsing
-        else:
-            print "Usage: %s [--force-rescan]" % (sys.argv[0],)
-            raise SystemExit
-
-    # gather dependencies
-    modid2fn = {}
-    fn2deps = {}
-    for fn in getMods():
-        info = readMcmodInfo(fn)
-        deps = getDeps(fn, info)
-
-        for modid in getModIDs(fn, info):
-            modid2fn[modid] = fn
-
-        fn2deps[fn] = mcmodfixes.fixDeps(fn, deps)
-        if len(deps) != 0:
-            print fn,deps
-
-    # build mod filename -> dependency filenames
-    fn2depsfn = {None: []}
-    for fn, deps in fn2deps.iteritems():
-        for dep in deps:
-            if not modid2fn.has_key(dep):
-                print "Mod %s is missing dependency: %s. Cannot continue" % (fn, dep)
-                sys.exit(-1)
-
-            fn2depsfn[fn] = modid2fn[dep]
-
-        fn2depsfn[fn] = [modid2fn[dep] for dep in deps if modid2fn[dep] != fn]
-
-
-    # setup analyzer
-    if not os.path.exists(os.path.join("target", ANALYZER_FILENAME)):
-        os.system("mvn initialize -P -built")
-        os.system("mvn package")
-
-    # setup server
-    server = os.path.join(TEST_SERVER_ROOT, TEST_SERVER_FILE)
-    if not os.path.exists(server):
-        if not os.path.exists(TEST_SERVER_ROOT):
-            os.mkdir(TEST_SERVER_ROOT)
-        setupServer(server)
-    print "Using server at:",server
-
-    # analyze vanilla for reference
-    if not os.path.exists(DATA_DIR): os.mkdir(DATA_DIR)
-    if not os.path.exists(CONFIGS_DIR): os.mkdir(CONFIGS_DIR)
-    vanilla = getModAnalysis(None)
-    analyzedMods = {None: vanilla}
-
-    for mod in getMods():
-        getModAnalysis(mod)
+    parser = argparse.ArgumentParser(description="Analyze the mods in %s" % (ALL_MODS_DIR,))
+    parser.add_argument("--force-rescan", action="store_true", help="analyze all mods again, even if analyzed before")
+    parser.add_argument("--jobs", type=int, default=1, help="servers to run at once, each in its own folder")
+    parser.add_argument("--memory", type=int, help="MB of memory for the servers running at once (default: currently available)")
+    parser.add_argument("--profile", choices=sorted(ANALYSIS_PROFILES.keys()), default=DEFAULT_PROFILE, help="sections to analyze: ids for only what modresolve.py needs, full for everything")
+    parser.add_argument("--version", action="append", help="Minecraft version, or MC/Forge version, to analyze for (default %s/%s), repeat to analyze for several at once" % (MC_VERSION, FORGE_VERSION))
+    args = parser.parse_args()
+
+    versions = [parseVersion(version) for version in args.version or []]
+    if len(versions) == 0:
+        versions = [(MC_VERSION, FORGE_VERSION)]
+
+    analyzers = [getVersionSession(mcVersion, forgeVersion, forceRescan=args.force_rescan, profile=args.profile) for mcVersion, forgeVersion in versions]
+    try:
+        runVersions(analyzers, args.jobs, args.memory)
+    except CircularDependencyError as e:
+        print e
+        sys.exit(-1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+
+# Find a minimal set of mods which breaks server boot, by delta debugging
+#
+# Boots the server with subsets of a failing mod set, narrowing it down to a set where
+# every mod is needed for the failure (ddmin). Each subset is booted together with its
+# dependencies, so every tested set is loadable, and results are remembered per set.
+# A single culprit takes O(log n) boots. A boot passes if the analyzer got to run.
+
+BISECT_SERVER_ROOT = "temp-bisect"
+BOOT_TIMEOUT = 600  # seconds before a hanging server counts as failed
+
+import os, sys, shutil, argparse
+
+import modanalyzer
+import modresolve
+
+"""Boots the server with sets of mods and their dependencies, remembering the results."""
+class BootTester(object):
+    def __init__(self, configsDir=None, timeout=BOOT_TIMEOUT):
+        self.configsDir = configsDir
+        self.timeout = timeout
+        self.results = {}   # frozenset of mods with dependencies -> True if boot failed
+        self.boots = 0
+        self.lastBooted = None
+
+    def getClosure(self, mods):
+        closure = set(mods)
+        for mod in mods:
+            closure |= modanalyzer.getRecursiveDepsFilenames(mod)
+        return frozenset(closure)
+
+    """Boot the server with mods and their dependencies. Returns True if it failed."""
+    def fails(self, mods):
+        closure = self.getClosure(mods)
+        if not self.results.has_key(closure):
+            self.results[closure] = not self.boot(closure)
+            print "Boot %s with %s mods: %s" % (self.boots, len(closure), "FAILED" if self.results[closure] else "passed")
+        return self.results[closure]
+
+    """Boot the server with exactly these mods, and the analyzer. Returns True if it got to run."""
+    def boot(self, mods):
+        self.boots += 1
+        self.lastBooted = frozenset(mods)
+
+        modanalyzer.prepareServerCopy(BISECT_SERVER_ROOT)
+        modsFolder, coremodsFolder, configFolder = modanalyzer.prepareCleanServerFolders(BISECT_SERVER_ROOT)
+        analysisFile = os.path.join(BISECT_SERVER_ROOT, "mod-analysis.csv")
+        if os.path.exists(analysisFile):
+            os.remove(analysisFile)
+
+        shutil.copyfile(os.path.join("target", modanalyzer.ANALYZER_FILENAME), os.path.join(modsFolder, modanalyzer.ANALYZER_FILENAME))
+        for mod in sorted(mods):
+            modanalyzer.installMod(mod, modsFolder, coremodsFolder)
+        if self.configsDir is not None:
+            shutil.copytree(self.configsDir, configFolder)
+
+        # plenty of heap, so running out of memory isn't mistaken for the failure
+        modanalyzer.runServer(BISECT_SERVER_ROOT, modanalyzer.MAX_HEAP_MB, self.timeout)
+        return os.path.exists(analysisFile)
+
+def split(items, n):
+    size, extra = divmod(len(items), n)
+    chunks = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+"""Reduce a failing list of mods to a minimal one for which fails() is still true (Zeller's ddmin)."""
+def ddmin(mods, fails):
+    n = 2
+    while len(mods) >= 2:
+        chunks = split(mods, n)
+
+        reduced = False
+        for chunk in chunks:
+            if fails(chunk):
+                mods = chunk
+                n = 2
+                reduced = True
+                break
+
+        if not reduced and n > 2:
+            for chunk in chunks:
+                complement = [mod for mod in mods if mod not in chunk]
+                if fails(complement):
+                    mods = complement
+                    n -= 1
+                    reduced = True
+                    break
+
+        if not reduced:
+            if n >= len(mods):
+                break
+            n = min(len(mods), n * 2)
+
+    return mods
+
+def main():
+    parser = argparse.ArgumentParser(description="Find a minimal set of mods which breaks server boot")
+    parser.add_argument("mods", nargs="*", help="failing mods in %s, with their dependencies (default: the wanted mods of modresolve.py)" % (modanalyzer.ALL_MODS_DIR,))
+    parser.add_argument("--configs", metavar="DIR", help="configs to boot with, e.g. the resolved %s/config" % (modanalyzer.TEST_SERVER_ROOT,))
+    parser.add_argument("--timeout", type=int, default=BOOT_TIMEOUT, help="seconds before a hanging server counts as failed")
+    args = parser.parse_args()
+
+    names = args.mods
+    if len(names) == 0:
+        names = modresolve.readWantedMods()
+        if names is None:
+            names = sorted(name for name in os.listdir(modanalyzer.ALL_MODS_DIR) if not name.startswith("."))
+
+    missing = [name for name in names if name.strip() == "" or not os.path.isfile(os.path.join(modanalyzer.ALL_MODS_DIR, name))]
+    for name in missing:
+        print "NOTICE: Skipping %r, not a mod in %s" % (name, modanalyzer.ALL_MODS_DIR)
+    names = [name for name in names if name not in missing]
+    if len(names) == 0:
+        print "No mods to bisect"
+        raise SystemExit
+
+    modanalyzer.requireDependencies()
+    modanalyzer.setupTestServer()
+
+    tester = BootTester(args.configs, args.timeout)
+    mods = sorted(tester.getClosure([os.path.join(modanalyzer.ALL_MODS_DIR, name) for name in names]))
+    print "Bisecting %s mods" % (len(mods),)
+
+    if tester.fails([]):
+        print "The server fails to boot without any mods, nothing to bisect"
+        raise SystemExit
+    if not tester.fails(mods):
+        print "The server boots fine with all %s mods, nothing to bisect" % (len(mods),)
+        raise SystemExit
+
+    culprits = ddmin(mods, tester.fails)
+    closure = tester.getClosure(culprits)
+    if tester.lastBooted != closure:
+        tester.boot(closure)  # leave its logs behind
+
+    print "=" * 70
+    print "Minimal failing set, found in %s boots:" % (tester.boots,)
+    for mod in sorted(culprits):
+        print "\t%s" % (modanalyzer.getModName(mod),)
+    deps = closure - set(culprits)
+    if len(deps) > 0:
+        print "with dependencies:"
+        for mod in sorted(deps):
+            print "\t%s" % (modanalyzer.getModName(mod),)
+    print "See the server logs in %s" % (BISECT_SERVER_ROOT,)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+# Compact in-memory model of loaded analysis contents
+#
+# modanalyzer.load() returns mod name -> kind -> KindTable. A KindTable maps id -> Record like
+# a read-only dict, but stores each record as a tuple of typed values aligned to a key schema
+# shared by all mods for that kind, instead of a dict repeating every key as a string.
+# Filtering (such as skipping itemblocks) gives a view over the same rows instead of a copy.
+
+import re
+
+INT_RE = re.compile(r"^-?(0|[1-9]\d*)$")  # as Java prints ints, so "007" or " 5" stay strings
+FLOAT_RE = re.compile(r"^-?\d+\.\d+(E-?\d+)?$")
+
+"""Convert an analysis value to its type: bool, int, float, or interned string."""
+def parseValue(value):
+    if value == "true": return True
+    if value == "false": return False
+    if INT_RE.match(value):
+        return int(value)
+    if FLOAT_RE.match(value):
+        return float(value)
+    return intern(value)
+
+"""Ordered record keys for a kind, shared across all mods."""
+class Schema(object):
+    __slots__ = ("keys", "index")
+
+    def __init__(self):
+        self.keys = []
+        self.index = {}
+
+    def getIndex(self, key):
+        n = self.index.get(key)
+        if n is None:
+            n = len(self.keys)
+            key = intern(key)
+            self.keys.append(key)
+            self.index[key] = n
+        return n
+
+SCHEMAS = {}
+
+def getSchema(kind):
+    if not SCHEMAS.has_key(kind):
+        SCHEMAS[kind] = Schema()
+    return SCHEMAS[kind]
+
+"""One record, a read-only key -> value mapping over a row of its table."""
+class Record(object):
+    __slots__ = ("schema", "values")
+
+    def __init__(self, schema, values):
+        self.schema = schema
+        self.values = values
+
+    def get(self, key, default=None):
+        n = self.schema.index.get(key)
+        if n is None or n >= len(self.values) or self.values[n] is None:
+            return default
+        return self.values[n]
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def has_key(self, key):
+        return self.get(key) is not None
+
+    __contains__ = has_key
+
+    def iteritems(self):
+        for key, value in zip(self.schema.keys, self.values):
+            if value is not None:
+                yield key, value
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iterkeys(self):
+        for key, value in self.iteritems():
+            yield key
+
+    __iter__ = iterkeys
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def __len__(self):
+        return len(self.values) - self.values.count(None)
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+"""All records of one kind in one mod, id -> Record, in insertion order."""
+class KindTable(object):
+    __slots__ = ("schema", "ids", "rows", "idIndex")
+
+    def __init__(self, kind):
+        self.schema = getSchema(kind)
+        self.ids = []
+        self.rows = []
+        self.idIndex = {}
+
+    """Set a value while loading, parsing it to its type."""
+    def put(self, id, key, value):
+        row = self.idIndex.get(id)
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(intern(id))
+            self.rows.append([])
+            self.idIndex[id] = row
+
+        values = self.rows[row]
+        n = self.schema.getIndex(key)
+        if n >= len(values):
+            values.extend([None] * (n + 1 - len(values)))
+        values[n] = parseValue(value)
+
+    """Finish loading, making rows compact and immutable."""
+    def freeze(self):
+        self.rows = [tuple(values) for values in self.rows]
+
+    def getRows(self):
+        return xrange(len(self.ids))
+
+    def __getitem__(self, id):
+        return Record(self.schema, self.rows[self.idIndex[id]])
+
+    def get(self, id, default=None):
+        row = self.idIndex.get(id)
+        if row is None:
+            return default
+        return Record(self.schema, self.rows[row])
+
+    def has_key(self, id):
+        return self.idIndex.has_key(id)
+
+    __contains__ = has_key
+
+    def iterkeys(self):
+        for row in self.getRows():
+            yield self.ids[row]
+
+    __iter__ = iterkeys
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def iteritems(self):
+        for row in self.getRows():
+            yield self.ids[row], Record(self.schema, self.rows[row])
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itervalues(self):
+        for id, record in self.iteritems():
+            yield record
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __len__(self):
+        return len(self.ids)
+
+    """Get a view of only the records whose 'key' value is not 'value'."""
+    def without(self, key, value):
+        return FilteredTable(self, key, value)
+
+"""View over a KindTable skipping some records, sharing its rows."""
+class FilteredTable(KindTable):
+    __slots__ = ("table", "included")
+
+    def __init__(self, table, key, value):
+        self.table = table
+        self.schema = table.schema
+        self.ids = table.ids
+        self.rows = table.rows
+
+        n = self.schema.index.get(key)
+        if n is None:
+            included = table.getRows()
+        else:
+            included = [row for row in table.getRows() if n >= len(table.rows[row]) or table.rows[row][n] != value]
+        self.included = included
+        self.idIndex = dict((self.ids[row], row) for row in included)
+
+    def getRows(self):
+        return self.included
+
+    def put(self, id, key, value):
+        raise TypeError("filtered views are read-only")
+
+    def __len__(self):
+        return len(self.idIndex)
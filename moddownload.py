@@ -0,0 +1,230 @@
+#!/usr/bin/python
+
+# Parallel, resumable downloads into a content-addressed cache
+#
+# Downloaded files are stored as cache/<sha256>, with cache/index.json remembering which URL
+# gave which hash. Interrupted transfers resume from cache/partial/ with HTTP range requests.
+# Set MODANALYZER_MIRROR to a directory or http://localhost:port/ to fetch files by name from
+# there instead of the internet, for offline use, testing or benchmarking.
+
+CACHE_DIR = "cache"
+RETRIES = 3
+WORKERS = 4
+CHUNK_SIZE = 64 * 1024
+
+import os, sys, urllib, urllib2, urlparse, hashlib, json, time, threading, Queue, socket, argparse
+
+MIRROR = os.environ.get("MODANALYZER_MIRROR")
+
+indexLock = threading.Lock()
+
+def getIndexFilename():
+    return os.path.join(CACHE_DIR, "index.json")
+
+def loadIndex():
+    if not os.path.exists(getIndexFilename()):
+        return {}
+    return json.loads(file(getIndexFilename()).read())
+
+"""Remember the hash of a URL's content."""
+def saveIndexEntry(url, h):
+    with indexLock:
+        index = loadIndex()
+        index[url] = h
+        tmp = getIndexFilename() + ".tmp"
+        file(tmp, "w").write(json.dumps(index, sort_keys=True, indent=1))
+        os.rename(tmp, getIndexFilename())
+
+def getCachePath(h):
+    return os.path.join(CACHE_DIR, h)
+
+"""Get the URL to actually fetch, from the mirror if one is configured."""
+def getMirrorURL(url):
+    if MIRROR is None:
+        return url
+
+    name = urllib.unquote(os.path.basename(urlparse.urlparse(url).path))
+    if MIRROR.startswith("http://") or MIRROR.startswith("https://"):
+        return MIRROR.rstrip("/") + "/" + urllib.quote(name)
+    return "file:" + urllib.pathname2url(os.path.abspath(os.path.join(MIRROR, name)))
+
+"""Get the sha256 hex digest of a file, read in chunks."""
+def hashFile(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data: break
+            h.update(data)
+    return h.hexdigest()
+
+"""Get the validator saved for a partial download: the ETag, or else Last-Modified, of the response it was started from."""
+def loadValidator(path):
+    if not os.path.exists(path + ".validator"):
+        return None
+    return file(path + ".validator").read()
+
+def removePartial(path):
+    for name in (path, path + ".validator"):
+        if os.path.exists(name):
+            os.remove(name)
+
+"""Fetch a URL into path, resuming from its existing length if the server supports it and the file didn't change since."""
+def fetchTo(url, path):
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    validator = loadValidator(path)
+    if offset > 0 and validator is None:
+        offset = 0  # can't tell if the remote file changed since, start over
+
+    request = urllib2.Request(url)
+    if offset > 0:
+        request.add_header("Range", "bytes=%s-" % (offset,))
+        request.add_header("If-Range", validator)  # the whole file instead if it changed
+
+    try:
+        response = urllib2.urlopen(request, timeout=60)
+    except urllib2.HTTPError as e:
+        if e.code == 416 and offset > 0:
+            # range not satisfiable: the remote file is no longer than the partial, which may be stale
+            print "Restarting %s, can't resume at %s bytes" % (url, offset)
+            removePartial(path)
+            return fetchTo(url, path)
+        raise
+    if offset > 0 and getattr(response, "code", None) == 206:
+        print "Resuming %s at %s bytes" % (url, offset)
+        mode = "ab"
+    else:
+        mode = "wb"  # no partial file, no range support, or changed - start over
+        removePartial(path)
+        validator = response.info().getheader("ETag") or response.info().getheader("Last-Modified")
+        if validator is not None:
+            file(path + ".validator", "w").write(validator)
+
+    with open(path, mode) as f:
+        while True:
+            data = response.read(CHUNK_SIZE)
+            if not data: break
+            f.write(data)
+    response.close()
+
+"""Download a URL to the cache, retrying and resuming, verifying its sha256. Returns the cached file path.
+
+The expected sha256 is the one given, or else the one the URL had when first downloaded, so a cached file
+which went missing or bad is only replaced by the same content."""
+def download(url, sha256=None, useCache=True):
+    if useCache:
+        if sha256 is None:
+            sha256 = loadIndex().get(url)
+        if sha256 is not None and os.path.exists(getCachePath(sha256)):
+            if hashFile(getCachePath(sha256)) == sha256:
+                print "Using cached %s" % (url,)
+                return getCachePath(sha256)
+            print "Cached %s is corrupt, downloading again" % (url,)
+            os.remove(getCachePath(sha256))
+
+    partialDir = os.path.join(CACHE_DIR, "partial")
+    if not os.path.exists(partialDir):
+        os.makedirs(partialDir)
+    partial = os.path.join(partialDir, hashlib.sha1(url).hexdigest())
+    if not useCache:
+        removePartial(partial)  # fresh content wanted, not the rest of an earlier response
+
+    source = getMirrorURL(url)
+    print "Retrieving %s..." % (source,)
+    for attempt in range(RETRIES):
+        try:
+            fetchTo(source, partial)
+            break
+        except (urllib2.URLError, IOError, socket.error) as e:
+            if isinstance(e, urllib2.HTTPError) and 400 <= e.code < 500:
+                raise  # not found, forbidden, etc. won't change by retrying (416 when resuming is handled by fetchTo)
+            if attempt == RETRIES - 1:
+                raise
+            print "Retrying %s after error: %s" % (source, e)
+            time.sleep(2 ** attempt)
+
+    h = hashFile(partial)
+    if sha256 is not None and h != sha256:
+        removePartial(partial)
+        raise IOError("Hash mismatch for %s: expected %s, got %s" % (url, sha256, h))
+
+    path = getCachePath(h)
+    if os.path.exists(path):
+        removePartial(partial)  # same content already cached
+    else:
+        os.rename(partial, path)
+        removePartial(partial)
+    saveIndexEntry(url, h)
+
+    return path
+
+"""Download many URLs concurrently. Takes a list of URLs or (url, sha256) pairs, returns dict url -> cached file path."""
+def downloadAll(urls, workers=WORKERS, useCache=True):
+    queue = Queue.Queue()
+    for url in urls:
+        if isinstance(url, tuple):
+            queue.put(url)
+        else:
+            queue.put((url, None))
+
+    paths = {}
+    errors = []
+    def worker():
+        while True:
+            try:
+                url, sha256 = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                paths[url] = download(url, sha256, useCache)
+            except Exception as e:
+                errors.append((url, e))
+
+    threads = [threading.Thread(target=worker) for i in range(min(workers, len(urls)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if len(errors) > 0:
+        for url, e in errors:
+            print "Failed to download %s: %s" % (url, e)
+        raise errors[0][1]
+
+    return paths
+
+"""Serve a mirror directory on localhost, as a stand-in for the real download sites."""
+def serveMirror(directory, port):
+    import SimpleHTTPServer, SocketServer
+    os.chdir(directory)
+    httpd = SocketServer.TCPServer(("127.0.0.1", port), SimpleHTTPServer.SimpleHTTPRequestHandler)
+    print "Serving mirror %s at http://127.0.0.1:%s/" % (directory, port)
+    httpd.serve_forever()
+
+def main():
+    global MIRROR
+
+    parser = argparse.ArgumentParser(description="Download files into the %s cache" % (CACHE_DIR,))
+    parser.add_argument("urls", nargs="*", help="URLs to download")
+    parser.add_argument("--mirror", help="directory or http://localhost:port/ to fetch from instead")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="concurrent downloads")
+    parser.add_argument("--no-cache", action="store_true", help="download even if already cached")
+    parser.add_argument("--serve", metavar="DIR", help="serve a mirror directory on localhost instead")
+    parser.add_argument("--port", type=int, default=8000, help="port for --serve")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serveMirror(args.serve, args.port)
+        return
+
+    if args.mirror is not None:
+        MIRROR = args.mirror
+
+    start = time.time()
+    paths = downloadAll(args.urls, args.workers, not args.no_cache)
+    for url in args.urls:
+        print paths[url], url
+    print "Downloaded %s files in %.2f seconds" % (len(paths), time.time() - start)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+# Pack manifests and deltas between successive server packs
+#
+# A manifest maps each file of a resolved pack (mods, coremods and configs, as named in a
+# modpack archive) to its SHA-256 and size. Diffing two manifests gives the files added,
+# removed and changed, and a delta archive holds only the added and changed files, plus
+# the list of removed ones, so rollouts transfer only what changed.
+
+DELTA_INFO = ".delta.json"
+
+import os, sys, json, zipfile, hashlib, tempfile, shutil
+
+import modanalyzer
+import modpack
+
+"""Get manifest of a server folder: archive name -> {sha256, size, mtime}, reusing hashes of unchanged files from a previous manifest."""
+def getFolderManifest(serverRoot, previous={}):
+    manifest = {}
+    for arcname, path in modpack.getPackEntries(serverRoot):
+        st = os.stat(path)
+        old = previous.get(arcname)
+        if old is not None and old.get("size") == st.st_size and old.get("mtime") == int(st.st_mtime):
+            manifest[arcname] = old
+            continue
+
+        manifest[arcname] = {"sha256": modanalyzer.getFileHash(path), "size": st.st_size, "mtime": int(st.st_mtime)}
+    return manifest
+
+"""Get manifest of a pack archive: archive name -> {sha256, size}."""
+def getArchiveManifest(filename):
+    manifest = {}
+    with zipfile.ZipFile(filename) as zf:
+        for zinfo in zf.infolist():
+            if zinfo.filename.endswith("/") or zinfo.filename == DELTA_INFO: continue
+            h = hashlib.sha256()
+            f = zf.open(zinfo)
+            while True:
+                data = f.read(modpack.CHUNK_SIZE)
+                if not data: break
+                h.update(data)
+            manifest[zinfo.filename] = {"sha256": h.hexdigest(), "size": zinfo.file_size}
+    return manifest
+
+"""Get manifest of a server folder, pack archive, or saved manifest .json."""
+def getManifest(source):
+    if os.path.isdir(source):
+        return getFolderManifest(source)
+    elif source.endswith(".json"):
+        return loadManifest(source)
+    else:
+        return getArchiveManifest(source)
+
+def loadManifest(filename):
+    return json.loads(file(filename).read())
+
+def saveManifest(manifest, filename):
+    file(filename, "w").write(json.dumps(manifest, sort_keys=True, indent=1))
+
+"""Get the files added, removed and changed between two manifests, as a dict of sorted lists."""
+def diffManifests(old, new):
+    oldNames = set(old.keys())
+    newNames = set(new.keys())
+    return {
+        "added": sorted(newNames - oldNames),
+        "removed": sorted(oldNames - newNames),
+        "changed": sorted(name for name in oldNames & newNames if old[name]["sha256"] != new[name]["sha256"]),
+        }
+
+def showDelta(delta):
+    for tag, kind in (("+", "added"), ("-", "removed"), ("*", "changed")):
+        for name in delta[kind]:
+            print tag, name
+    print "%s added, %s removed, %s changed" % (len(delta["added"]), len(delta["removed"]), len(delta["changed"]))
+
+"""Write a delta archive with the added and changed files from a server folder, and the list of removed files."""
+def writeDeltaArchive(serverRoot, delta, filename):
+    paths = dict(modpack.getPackEntries(serverRoot))
+    entries = [(name, paths[name]) for name in delta["added"] + delta["changed"]]
+
+    infoDir = tempfile.mkdtemp()
+    try:
+        infoPath = os.path.join(infoDir, DELTA_INFO)
+        file(infoPath, "w").write(json.dumps(delta, sort_keys=True, indent=1))
+        entries.append((DELTA_INFO, infoPath))
+        modpack.writeArchive(entries, filename)
+    finally:
+        shutil.rmtree(infoDir)
+
+"""Get the path in a server folder of a file named in a delta archive, refusing names which would be outside of it."""
+def getDeltaTarget(serverRoot, name):
+    parts = name.split("/")
+    if name == "" or name.startswith("/") or os.path.isabs(name) or ".." in parts or ".." in name.split("\\"):
+        raise ValueError("unsafe file name in delta archive: %r" % (name,))
+
+    root = os.path.abspath(serverRoot)
+    target = os.path.normpath(os.path.join(root, *parts))
+    if not target.startswith(root + os.sep):
+        raise ValueError("file name in delta archive outside the server folder: %r" % (name,))
+    return target
+
+"""Apply a delta archive to a server folder: extract added and changed files, delete removed ones."""
+def applyDeltaArchive(filename, serverRoot):
+    with zipfile.ZipFile(filename) as zf:
+        delta = json.loads(zf.read(DELTA_INFO))
+
+        # check every name before changing anything
+        targets = dict((name, getDeltaTarget(serverRoot, name)) for name in delta["added"] + delta["changed"] + delta["removed"])
+
+        for name in delta["added"] + delta["changed"]:
+            target = targets[name]
+            modanalyzer.mkdirContaining(target)
+            with open(target, "wb") as f:
+                shutil.copyfileobj(zf.open(name), f)
+            print "Updated",target
+
+    for name in delta["removed"]:
+        target = targets[name]
+        if os.path.exists(target):
+            os.remove(target)
+            print "Removed",target
+
+def main():
+    usage = """Usage:
+    %s manifest SERVER-FOLDER|PACK.zip OUT.json
+    %s diff OLD NEW [DELTA.zip]     (OLD/NEW: server folder, pack .zip or manifest .json; DELTA.zip needs NEW to be a folder)
+    %s apply DELTA.zip SERVER-FOLDER""" % (sys.argv[0], sys.argv[0], sys.argv[0])
+
+    if len(sys.argv) < 2:
+        print usage
+        raise SystemExit
+
+    command = sys.argv[1]
+    if command == "manifest" and len(sys.argv) == 4:
+        saveManifest(getManifest(sys.argv[2]), sys.argv[3])
+    elif command == "diff" and len(sys.argv) in (4, 5):
+        delta = diffManifests(getManifest(sys.argv[2]), getManifest(sys.argv[3]))
+        showDelta(delta)
+        if len(sys.argv) == 5:
+            writeDeltaArchive(sys.argv[3], delta, sys.argv[4])
+    elif command == "apply" and len(sys.argv) == 4:
+        try:
+            applyDeltaArchive(sys.argv[2], sys.argv[3])
+        except ValueError as e:
+            print "Not applying %s: %s" % (sys.argv[2], e)
+            sys.exit(-1)
+    else:
+        print usage
+        raise SystemExit
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/python
+
+# Deterministic server pack archives
+#
+# The pack is written as a zip with entries in sorted order, fixed timestamps and permissions,
+# so the same installed mods and configs always give a byte-identical archive. Entries are
+# compressed in parallel; jars and zips are already compressed, so they are stored as-is and
+# streamed from disk rather than recompressed.
+
+PACK_FOLDERS = ("mods", "coremods", "config")
+STORED_EXTENSIONS = (".jar", ".zip", ".png", ".ogg")   # already compressed
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)                 # earliest a zip can represent
+WORKERS = 4
+CHUNK_SIZE = 64 * 1024
+
+import os, sys, zipfile, zlib
+from multiprocessing.pool import ThreadPool
+
+import modanalyzer
+
+"""Get sorted list of (archive name, source path) for the pack contents of a server folder."""
+def getPackEntries(serverRoot, folders=PACK_FOLDERS):
+    entries = []
+    for folder in folders:
+        root = os.path.join(serverRoot, folder)
+        for name in modanalyzer.recursiveListdir(root):
+            arcname = "/".join([folder] + name.split(os.path.sep))
+            entries.append((arcname, os.path.join(root, name)))
+    return sorted(entries)
+
+def isStored(arcname):
+    return os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS
+
+"""Prepare one entry: (arcname, path, crc, size, compressed data or None if to be streamed stored)."""
+def prepareEntry(entry):
+    arcname, path = entry
+    crc = 0
+    size = 0
+    if isStored(arcname):
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data: break
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+        return arcname, path, crc & 0xffffffff, size, None
+
+    # zlib releases the GIL, so threads compress in parallel
+    co = zlib.compressobj(zlib.Z_BEST_COMPRESSION, zlib.DEFLATED, -15)
+    chunks = []
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data: break
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            chunks.append(co.compress(data))
+    chunks.append(co.flush())
+    return arcname, path, crc & 0xffffffff, size, "".join(chunks)
+
+"""Get the ZipInfo of an entry, with a fixed timestamp and permissions."""
+def getZipInfo(arcname, compressed):
+    zinfo = zipfile.ZipInfo(arcname, FIXED_DATE_TIME)
+    zinfo.external_attr = 0o644 << 16
+    zinfo.create_system = 3  # unix, regardless of where the pack is built
+    if compressed is None:
+        zinfo.compress_type = zipfile.ZIP_STORED
+    else:
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+# Writing entries compressed beforehand, and streaming stored ones from disk, goes through the
+# internals of the Python 2.7 zipfile module (fp, _writecheck, _didModify, FileHeader, filelist,
+# NameToInfo), as its public API only writes data it compresses itself. This assumes the pinned
+# 2.7 interpreter; where they are missing, entries are written with writestr() instead, which
+# recompresses serially and reads stored entries into memory, but is as deterministic.
+ZIPFILE_INTERNALS = hasattr(zipfile.ZipFile, "_writecheck") and hasattr(zipfile.ZipInfo, "FileHeader")
+
+"""Append a prepared entry to the zip, with a fixed timestamp and permissions."""
+def writeEntry(zf, arcname, path, crc, size, compressed):
+    zinfo = getZipInfo(arcname, compressed)
+    if not ZIPFILE_INTERNALS:
+        zf.writestr(zinfo, file(path, "rb").read())
+        return
+
+    zinfo.file_size = size
+    zinfo.CRC = crc
+    if compressed is None:
+        zinfo.compress_size = size
+    else:
+        zinfo.compress_size = len(compressed)
+
+    zinfo.header_offset = zf.fp.tell()
+    zf._writecheck(zinfo)
+    zf._didModify = True
+    zf.fp.write(zinfo.FileHeader(zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT))
+
+    if compressed is None:
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data: break
+                zf.fp.write(data)
+    else:
+        zf.fp.write(compressed)
+
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[arcname] = zinfo
+
+"""Write the mods, coremods and configs installed in serverRoot to a deterministic zip archive."""
+def buildPackArchive(serverRoot, filename, workers=WORKERS):
+    entries = getPackEntries(serverRoot)
+    print "Building pack %s from %s files in %s" % (filename, len(entries), serverRoot)
+    writeArchive(entries, filename, workers)
+
+"""Write (archive name, source path) entries to a deterministic zip archive, in sorted order."""
+def writeArchive(entries, filename, workers=WORKERS):
+    entries = sorted(entries)
+    tmp = filename + ".tmp"
+    pool = ThreadPool(workers)
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            # imap keeps the sorted order, while later entries are prepared in the background
+            for arcname, path, crc, size, compressed in pool.imap(prepareEntry, entries):
+                writeEntry(zf, arcname, path, crc, size, compressed)
+    finally:
+        pool.close()
+        pool.join()
+    os.rename(tmp, filename)
+
+    print "Wrote %s" % (filename,)
+
+def main():
+    if len(sys.argv) != 2:
+        print "Usage: %s pack.zip" % (sys.argv[0],)
+        raise SystemExit
+
+    buildPackArchive(modanalyzer.TEST_SERVER_ROOT, sys.argv[1])
+
+if __name__ == "__main__":
+    main()
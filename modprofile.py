@@ -0,0 +1,94 @@
+#!/usr/bin/python
+
+# Startup cost report from the load profiles ModAnalyzer.java records
+#
+# Each analysis run records, per mod container, the time spent and heap grown while FML
+# sent it each loading phase event ("profile" records), and the totals per phase of the
+# whole server ("profile/phase" records). A mod's analysis keeps only its own containers,
+# so summing them over a pack, on top of the vanilla run, estimates the pack's startup cost.
+
+import sys
+
+import modanalyzer
+
+PHASES = ("construct", "preInit", "init", "postInit", "serverStart")
+
+"""Get startup cost of a mod from its analysis content: {"ms": phase -> ms, "totalMs", "heapGrowthKB", "containers"}, or None if not profiled."""
+def getModCost(content):
+    table = content.get("profile")
+    if table is None:
+        return None
+
+    cost = {"ms": dict((phase, 0.0) for phase in PHASES), "totalMs": 0.0, "heapGrowthKB": 0, "containers": []}
+    for container, record in table.iteritems():
+        cost["containers"].append(container)
+        for phase in PHASES:
+            ms = record.get(phase + ".ms", 0.0)
+            cost["ms"][phase] += ms
+            cost["totalMs"] += ms
+            cost["heapGrowthKB"] += record.get(phase + ".heapGrowthKB", 0)
+    cost["containers"].sort()
+    return cost
+
+"""Get the whole server startup of a mod's own analysis run (with its dependencies): {"ms", "heapUsedKB", "heapMaxKB"}, or None."""
+def getRunCost(content):
+    total = content.get("profile/phase", {}).get("total")
+    if total is None:
+        return None
+    return {"ms": total.get("ms", 0.0), "heapUsedKB": total.get("heapUsedKB", 0), "heapMaxKB": total.get("heapMaxKB", 0)}
+
+"""Estimate startup cost of a pack of analyzed mods, as the vanilla server plus each mod's own containers."""
+def getPackCost(contents):
+    pack = {"ms": 0.0, "heapKB": 0, "mods": 0, "unprofiled": []}
+    for mod, content in contents.iteritems():
+        if mod.startswith("Minecraft"):
+            run = getRunCost(content)
+            if run is not None:
+                pack["ms"] += run["ms"]
+                pack["heapKB"] += run["heapUsedKB"]
+            continue
+
+        cost = getModCost(content)
+        if cost is None:
+            pack["unprofiled"].append(mod)
+            continue
+        pack["ms"] += cost["totalMs"]
+        pack["heapKB"] += cost["heapGrowthKB"]
+        pack["mods"] += 1
+    pack["unprofiled"].sort()
+    return pack
+
+def showPackCost(contents):
+    pack = getPackCost(contents)
+    print "Estimated startup: %.1f s, %s MB heap for %s profiled mods" % (pack["ms"] / 1000.0, pack["heapKB"] / 1024, pack["mods"])
+    if len(pack["unprofiled"]) > 0:
+        print "NOTICE: no load profile for %s mods, re-analyze with a newer ModAnalyzer: %s" % (len(pack["unprofiled"]), " ".join(pack["unprofiled"]))
+
+"""Show mods slowest first, with their time per phase and heap growth."""
+def showModCosts(contents):
+    costs = []
+    for mod, content in contents.iteritems():
+        cost = getModCost(content)
+        if cost is not None:
+            costs.append((cost["totalMs"], mod, cost))
+    costs.sort(reverse=True)
+
+    print "\t".join(["total ms"] + [phase + " ms" for phase in PHASES] + ["heap MB", "mod (containers)"])
+    for totalMs, mod, cost in costs:
+        row = ["%.1f" % (totalMs,)]
+        row += ["%.1f" % (cost["ms"][phase],) for phase in PHASES]
+        row.append("%.1f" % (cost["heapGrowthKB"] / 1024.0,))
+        row.append("%s (%s)" % (mod, " ".join(cost["containers"])))
+        print "\t".join(row)
+
+def main():
+    contents = modanalyzer.load()
+    if len(sys.argv) > 1:
+        wanted = set(name + ".csv" for name in sys.argv[1:])
+        contents = dict((mod, content) for mod, content in contents.iteritems() if mod in wanted or mod.startswith("Minecraft"))
+
+    showModCosts(contents)
+    showPackCost(contents)
+
+if __name__ == "__main__":
+    main()
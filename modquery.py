@@ -0,0 +1,206 @@
+#!/usr/bin/python
+
+# Local query service over analysis data
+#
+# Loads the analysis results in data/ once, indexes them, and answers queries as JSON over
+# HTTP on localhost, reloading only mods whose analysis file changed. For example:
+#
+#   /mods                                   all analyzed mods
+#   /query?kind=block&material=rock         filtered records (any attribute=value)
+#   /query?kind=item&mod=IC2.jar.csv&hasContainerItem=true
+#   /conflicts?kind=block                   IDs used by more than one mod
+#   /conflicts?kind=block&id=600            mods using one ID
+#   /search?q=copper+ore                    ranked name search, see modsearch
+
+PORT = 8080
+RELOAD_INTERVAL = 1.0   # seconds between checks of data/ for changes
+
+# string attributes to index, in addition to all boolean attributes
+INDEXED_KEYS = ("material", "unlocalizedName", "name", "stepSound", "itemUseAction")
+
+import os, sys, json, time, urlparse, BaseHTTPServer
+
+import modanalyzer
+import modcontents
+import modsearch
+
+"""Analysis contents with indexes, updated per mod."""
+class QueryIndex(object):
+    def __init__(self, dataDir):
+        self.dataDir = dataDir
+        self.contents = {}      # mod -> kind -> id -> record
+        self.mtimes = {}        # mod -> analysis file mtime
+        self.byKindId = {}      # (kind, id) -> set of mods
+        self.byAttribute = {}   # (kind, key, value) -> set of (mod, id)
+        self.lastCheck = 0
+
+        self.search = modsearch.SearchIndex()
+        self.search.load()
+
+    def isIndexed(self, key, value):
+        return isinstance(value, bool) or key in INDEXED_KEYS
+
+    def addMod(self, mod, content):
+        self.contents[mod] = content
+        for kind, table in content.iteritems():
+            for id, record in table.iteritems():
+                self.byKindId.setdefault((kind, id), set()).add(mod)
+                for key, value in record.iteritems():
+                    if self.isIndexed(key, value):
+                        self.byAttribute.setdefault((kind, key, value), set()).add((mod, id))
+
+    def removeMod(self, mod):
+        content = self.contents.pop(mod)
+        for kind, table in content.iteritems():
+            for id, record in table.iteritems():
+                self.byKindId[(kind, id)].discard(mod)
+                for key, value in record.iteritems():
+                    if self.isIndexed(key, value):
+                        self.byAttribute[(kind, key, value)].discard((mod, id))
+
+    """Reload mods whose analysis files were added, changed or removed since last time. Returns number of mods updated."""
+    def refresh(self):
+        self.lastCheck = time.time()
+
+        mtimes = {}
+        for filename in os.listdir(self.dataDir):
+            if filename.startswith("."): continue
+            mtimes[filename] = os.path.getmtime(os.path.join(self.dataDir, filename))
+
+        updated = 0
+        for mod in set(self.mtimes.keys()) - set(mtimes.keys()):
+            self.removeMod(mod)
+            del self.mtimes[mod]
+            updated += 1
+
+        for mod in set(self.search.mods.keys()) - set(mtimes.keys()):
+            self.search.removeMod(mod)
+
+        for mod, mtime in mtimes.iteritems():
+            if self.mtimes.get(mod) == mtime:
+                continue
+            if self.contents.has_key(mod):
+                self.removeMod(mod)
+            self.addMod(mod, modanalyzer.loadMod(os.path.join(self.dataDir, mod)))
+            self.mtimes[mod] = mtime
+            updated += 1
+
+            if self.search.mods.get(mod, {}).get("mtime") != mtime:
+                self.search.setMod(mod, mtime, modsearch.getDocuments(self.contents[mod]))
+
+        if updated > 0:
+            print "Loaded %s changed mods, %s total" % (updated, len(self.contents))
+            self.search.save()
+        return updated
+
+    def refreshIfDue(self):
+        if time.time() - self.lastCheck >= RELOAD_INTERVAL:
+            self.refresh()
+
+    """Get (mod, id) of records of a kind matching all filters {key: value}, using indexes where possible."""
+    def query(self, kind, mod=None, id=None, filters={}):
+        candidates = None
+        if id is not None:
+            candidates = set((m, id) for m in self.byKindId.get((kind, id), []))
+
+        unindexed = {}
+        for key, value in filters.iteritems():
+            if self.isIndexed(key, value):
+                matching = self.byAttribute.get((kind, key, value), set())
+                if candidates is None:
+                    candidates = matching
+                else:
+                    candidates = candidates & matching
+            else:
+                unindexed[key] = value
+
+        if candidates is None:
+            # no index to go by, scan the kind
+            mods = [mod] if mod is not None else self.contents.keys()
+            candidates = [(m, i) for m in mods for i in self.contents.get(m, {}).get(kind, {}).iterkeys()]
+
+        results = []
+        for m, i in candidates:
+            if mod is not None and m != mod: continue
+            record = self.contents[m][kind][i]
+            if all(record.get(key) == value for key, value in unindexed.iteritems()):
+                results.append((m, i))
+        return sorted(results)
+
+    """Get id -> sorted mods for IDs of a kind used by more than one mod, or just the given id. Itemblocks aren't conflicts."""
+    def conflicts(self, kind, id=None):
+        if id is not None:
+            keys = [(kind, id)]
+        else:
+            keys = [key for key in self.byKindId.iterkeys() if key[0] == kind]
+
+        conflicts = {}
+        for key in keys:
+            mods = [m for m in self.byKindId.get(key, []) if not self.contents[m][kind][key[1]].get("isItemBlock", False)]
+            if len(mods) > 1 or id is not None:
+                conflicts[key[1]] = sorted(mods)
+        return conflicts
+
+    def getRecord(self, mod, kind, id):
+        record = dict(self.contents[mod][kind][id].iteritems())
+        record["mod"] = mod
+        record["kind"] = kind
+        record["id"] = id
+        return record
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    index = None
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict((k, v[-1]) for k, v in urlparse.parse_qs(url.query).iteritems())
+
+        start = time.time()
+        self.index.refreshIfDue()
+        try:
+            result = self.answer(url.path, params)
+        except KeyError as e:
+            self.reply(400, {"error": "missing or unknown %s" % (e,)})
+            return
+        self.reply(200, {"result": result, "ms": round((time.time() - start) * 1000, 3)})
+
+    def answer(self, path, params):
+        index = self.index
+        if path == "/mods":
+            return sorted(index.contents.keys())
+        elif path == "/search":
+            results = index.search.search(params["q"], int(params.get("limit", 20)))
+            return [dict(zip(("score", "mod", "kind", "id", "field", "text"), result)) for result in results]
+
+        kind = params.pop("kind")
+        mod = params.pop("mod", None)
+        id = params.pop("id", None)
+        if path == "/query":
+            filters = dict((key, modcontents.parseValue(value)) for key, value in params.iteritems())
+            return [index.getRecord(m, kind, i) for m, i in index.query(kind, mod, id, filters)]
+        elif path == "/conflicts":
+            return index.conflicts(kind, id)
+        raise KeyError(path)
+
+    def reply(self, code, data):
+        body = json.dumps(data, sort_keys=True)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def main():
+    port = PORT
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+
+    QueryHandler.index = QueryIndex(modanalyzer.DATA_DIR)
+    QueryHandler.index.refresh()
+
+    httpd = BaseHTTPServer.HTTPServer(("127.0.0.1", port), QueryHandler)
+    print "Serving queries at http://127.0.0.1:%s/" % (port,)
+    httpd.serve_forever()
+
+if __name__ == "__main__":
+    main()
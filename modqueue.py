@@ -0,0 +1,317 @@
+#!/usr/bin/python
+
+# Distribute mod analysis over machines sharing a directory
+#
+# Run in a working directory shared by all machines (allmods/, data/, configs/, target/ and
+# temp-server/ are read and written there). The coordinator publishes a job per mod to
+# analyze, with its dependencies from the dependency graph, and workers on any host claim
+# jobs whose dependencies are done by creating lock files with O_EXCL, which only one can.
+# Each worker analyzes in its own local server folder and publishes the results into data/
+# and configs/, then marks the job done. Workers touch the locks of their jobs while running,
+# so locks nobody touched for LOCK_TIMEOUT are of dead workers, and their jobs are requeued.
+#
+# Usage:
+#   modqueue.py publish [--force-rescan] [--profile ids]    queue jobs for mods not analyzed yet
+#   modqueue.py work [--processes N]                        analyze queued jobs until none are left
+#   modqueue.py status                                      show progress, and collect measured memory
+
+QUEUE_DIR = "queue"
+LOCK_TIMEOUT = 300          # seconds without a heartbeat before a job is requeued
+HEARTBEAT_INTERVAL = 30
+IDLE_INTERVAL = 5           # seconds between looks for claimable jobs
+
+import os, sys, errno, json, time, socket, shutil, tempfile, threading, subprocess, argparse
+
+import modanalyzer
+
+def getJobName(mod):
+    return modanalyzer.getModName(mod)
+
+def getQueuePath(queueDir, folder, name, ext):
+    return os.path.join(queueDir, folder, name + ext)
+
+"""Write a JSON file so readers never see it partially written, also on other hosts."""
+def writeJSON(path, data):
+    modanalyzer.mkdirContaining(path)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        f.write(json.dumps(data, sort_keys=True, indent=1))
+    os.chmod(tmp, 0o644)
+    os.rename(tmp, path)
+
+def readJSON(path):
+    return json.loads(file(path).read())
+
+"""Get the current time of the shared filesystem, to compare with lock times regardless of clock differences between hosts."""
+def getSharedTime(queueDir):
+    clock = os.path.join(queueDir, ".clock")
+    with open(clock, "a"):
+        os.utime(clock, None)
+    return os.path.getmtime(clock)
+
+"""Jobs in a shared queue directory: jobs/NAME.json to do, locks/NAME.lock while claimed, done/ or failed/NAME.json after."""
+class WorkQueue(object):
+    def __init__(self, queueDir=QUEUE_DIR):
+        self.queueDir = queueDir
+        for folder in ("jobs", "locks", "done", "failed"):
+            modanalyzer._mkdir(os.path.join(queueDir, folder))
+
+    def path(self, folder, name, ext=".json"):
+        return getQueuePath(self.queueDir, folder, name, ext)
+
+    def getJobNames(self):
+        return sorted(name[:-len(".json")] for name in os.listdir(os.path.join(self.queueDir, "jobs")) if name.endswith(".json"))
+
+    def isDone(self, name):
+        return os.path.exists(self.path("done", name))
+
+    def isFailed(self, name):
+        return os.path.exists(self.path("failed", name))
+
+    def isLocked(self, name):
+        return os.path.exists(self.path("locks", name, ".lock"))
+
+    """Queue a job to analyze a mod after its dependencies, replacing any earlier result."""
+    def publish(self, mod, deps, allDeps, heapMB, sections, criticalSeconds):
+        name = getJobName(mod)
+        for folder in ("done", "failed"):
+            if os.path.exists(self.path(folder, name)):
+                os.remove(self.path(folder, name))
+        writeJSON(self.path("jobs", name), {"mod": mod, "deps": sorted(deps), "allDeps": sorted(allDeps), "heapMB": heapMB, "sections": list(sections), "criticalSeconds": criticalSeconds})
+
+    """Check if all dependencies of a job are analyzed: either done, or not queued at all."""
+    def isReady(self, job):
+        for dep in job["allDeps"]:
+            name = getJobName(dep)
+            if os.path.exists(self.path("jobs", name)) and not self.isDone(name):
+                return False
+        return True
+
+    """Claim a job with an atomically created lock file. Returns True if this worker got it."""
+    def claim(self, name, worker):
+        try:
+            fd = os.open(self.path("locks", name, ".lock"), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except OSError:
+            return False
+        os.write(fd, json.dumps({"worker": worker, "claimed": time.time()}))
+        os.close(fd)
+
+        if self.isDone(name) or self.isFailed(name):
+            self.release(name, worker)  # finished or given up on by another worker since we looked
+            return False
+        return True
+
+    def heartbeat(self, name):
+        os.utime(self.path("locks", name, ".lock"), None)
+
+    """Remove the lock of a job claimed by worker. A lock already requeued, or claimed again by another worker since, is left alone."""
+    def release(self, name, worker):
+        path = self.path("locks", name, ".lock")
+        try:
+            if readJSON(path).get("worker") != worker:
+                return
+            os.remove(path)
+        except ValueError:
+            return  # just claimed by another worker, not written yet
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def finish(self, name, result, worker):
+        writeJSON(self.path("done", name), result)
+        self.release(name, worker)
+
+    def fail(self, name, result, worker):
+        writeJSON(self.path("failed", name), result)
+        self.release(name, worker)
+
+    """Requeue jobs whose lock wasn't touched for LOCK_TIMEOUT. Returns their names."""
+    def requeueStale(self):
+        now = getSharedTime(self.queueDir)
+        requeued = []
+        for filename in os.listdir(os.path.join(self.queueDir, "locks")):
+            if not filename.endswith(".lock"): continue
+            path = os.path.join(self.queueDir, "locks", filename)
+            try:
+                if now - os.path.getmtime(path) < LOCK_TIMEOUT:
+                    continue
+                # renaming is atomic, so only one of the workers noticing removes it
+                stale = "%s.stale.%s.%s" % (path, socket.gethostname(), os.getpid())
+                os.rename(path, stale)
+            except OSError:
+                continue  # released or requeued meanwhile
+            os.remove(stale)
+            requeued.append(filename[:-len(".lock")])
+        return requeued
+
+    """Get (name, job) of the jobs which can run now, longest (with the jobs waiting on them) first, then largest heap first."""
+    def getClaimable(self):
+        jobs = []
+        for name in self.getJobNames():
+            if self.isDone(name) or self.isFailed(name) or self.isLocked(name):
+                continue
+            job = readJSON(self.path("jobs", name))
+            if self.isReady(job):
+                jobs.append((job.get("criticalSeconds", 0), job["heapMB"], name, job))
+        jobs.sort(reverse=True)
+        return [(name, job) for criticalSeconds, heapMB, name, job in jobs]
+
+    """Get job name -> state: pending, blocked (by a failed dependency), running, done or failed."""
+    def getStates(self):
+        states = {}
+        for name in self.getJobNames():
+            if self.isDone(name):
+                states[name] = "done"
+            elif self.isFailed(name):
+                states[name] = "failed"
+            elif self.isLocked(name):
+                states[name] = "running"
+            else:
+                states[name] = "pending"
+
+        for name, state in states.items():
+            if state != "pending": continue
+            job = readJSON(self.path("jobs", name))
+            if any(states.get(getJobName(dep)) == "failed" for dep in job["allDeps"]):
+                states[name] = "blocked"
+        return states
+
+def publish(queue, forceRescan, profile):
+    modanalyzer.session.setProfile(profile)
+    modanalyzer.requireDependencies()
+    modanalyzer.setupTestServer()
+    if not os.path.exists(modanalyzer.DATA_DIR): os.mkdir(modanalyzer.DATA_DIR)
+    if not os.path.exists(modanalyzer.CONFIGS_DIR): os.mkdir(modanalyzer.CONFIGS_DIR)
+
+    history = modanalyzer.loadMemoryHistory()
+    runHistory = modanalyzer.loadRunHistory()
+    mods = [mod for mod in [None] + modanalyzer.getMods() if forceRescan or not modanalyzer.isAnalyzed(mod)]
+    expected = dict((mod, modanalyzer.getExpectedSeconds(mod, runHistory)) for mod in mods)
+    critical = modanalyzer.session.getCriticalPathSeconds(mods, expected)
+    for mod in mods:
+        queue.publish(mod, modanalyzer.getRecursiveDepsFilenames(mod), modanalyzer.getAllDepsFilenames(mod), modanalyzer.getHeapMB(mod, history),
+            modanalyzer.session.sections, critical[mod])
+    print "Published %s jobs to %s, about %s of analysis" % (len(mods), queue.queueDir, modanalyzer.formatDuration(sum(expected.values())))
+
+"""Touches the lock of a running job, so it isn't requeued."""
+class Heartbeat(threading.Thread):
+    def __init__(self, queue, jobName):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue
+        self.jobName = jobName
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.queue.heartbeat(self.jobName)
+            except OSError:
+                pass  # requeued after all, the result still counts
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+"""Analyze a claimed job in serverRoot and publish its results."""
+def runJob(queue, name, job, serverRoot, worker):
+    mod = job["mod"]
+    heartbeat = Heartbeat(queue, name)
+    heartbeat.start()
+    start = time.time()
+    try:
+        modanalyzer.prepareServerCopy(serverRoot)
+        unfilteredInfo, peakMB, heapMB, runs = modanalyzer.runAnalysis(mod, set(job["deps"]), serverRoot, job["heapMB"], job.get("sections"))
+
+        allDeps = job["allDeps"]
+        depsAnalyzed = [file(modanalyzer.getInfoFilename(dep)).readlines() for dep in allDeps]
+        modanalyzer.saveModInfo(mod, unfilteredInfo, depsAnalyzed, allDeps, serverRoot)
+    except Exception as e:
+        heartbeat.stop()
+        print "Job %s failed: %s" % (name, e)
+        queue.fail(name, {"worker": worker, "error": str(e), "seconds": time.time() - start}, worker)
+        return
+
+    heartbeat.stop()
+    queue.finish(name, {"worker": worker, "peakMB": peakMB, "heapMB": heapMB, "runs": runs, "seconds": time.time() - start}, worker)
+    print "Job %s done by %s in %.1f s" % (name, worker, time.time() - start)
+
+"""Claim and run jobs until there are none left to run (or forever, to wait for more)."""
+def work(queue, forever=False):
+    worker = "%s:%s" % (socket.gethostname(), os.getpid())
+    serverRoot = tempfile.mkdtemp(prefix="modanalyzer-worker-")
+    print "Worker %s analyzing in %s" % (worker, serverRoot)
+    try:
+        while True:
+            for name in queue.requeueStale():
+                print "Requeued %s, its worker stopped responding" % (name,)
+
+            claimed = False
+            for name, job in queue.getClaimable():
+                if queue.claim(name, worker):
+                    runJob(queue, name, job, serverRoot, worker)
+                    claimed = True
+                    break
+
+            if claimed:
+                continue
+
+            states = queue.getStates()
+            if not forever and "running" not in states.values() and "pending" not in states.values():
+                break
+            time.sleep(IDLE_INTERVAL)  # waiting for dependencies analyzed elsewhere
+    finally:
+        shutil.rmtree(serverRoot, ignore_errors=True)
+    print "Worker %s finished, nothing left to do" % (worker,)
+
+def status(queue):
+    states = queue.getStates()
+
+    # memory and durations measured by the workers, for sizing and scheduling later runs
+    modanalyzer.loadDependencies()
+    history = modanalyzer.loadMemoryHistory()
+    runHistory = modanalyzer.loadRunHistory()
+    for name, state in sorted(states.iteritems()):
+        if state != "done": continue
+        job = readJSON(queue.path("jobs", name))
+        result = readJSON(queue.path("done", name))
+        if modanalyzer.session.fn2depsfn.has_key(job["mod"]):
+            modanalyzer.recordMemory(history, job["mod"], result["peakMB"], result["heapMB"])
+        modanalyzer.recordRuns(runHistory, job["mod"], result.get("runs", []))
+    modanalyzer.saveMemoryHistory(history)
+    modanalyzer.saveRunHistory(runHistory)
+
+    counts = {}
+    for name, state in sorted(states.iteritems()):
+        counts[state] = counts.get(state, 0) + 1
+        if state in ("running", "failed", "blocked"):
+            print "%s\t%s" % (state, name)
+    print ", ".join("%s %s" % (counts.get(state, 0), state) for state in ("done", "running", "pending", "blocked", "failed"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Distribute mod analysis over workers sharing this directory")
+    parser.add_argument("command", choices=("publish", "work", "status"))
+    parser.add_argument("--queue", default=QUEUE_DIR, help="shared queue directory")
+    parser.add_argument("--force-rescan", action="store_true", help="publish: queue all mods, even if analyzed before")
+    parser.add_argument("--profile", choices=sorted(modanalyzer.ANALYSIS_PROFILES.keys()), default=modanalyzer.DEFAULT_PROFILE, help="publish: sections to analyze")
+    parser.add_argument("--processes", type=int, default=1, help="work: worker processes to run on this host")
+    parser.add_argument("--forever", action="store_true", help="work: keep waiting for new jobs")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    if args.command == "publish":
+        publish(queue, args.force_rescan, args.profile)
+    elif args.command == "work":
+        if args.processes > 1:
+            command = [sys.executable, os.path.abspath(__file__), "work", "--queue", args.queue]
+            if args.forever: command.append("--forever")
+            processes = [subprocess.Popen(command) for i in range(args.processes)]
+            for process in processes:
+                process.wait()
+        else:
+            work(queue, args.forever)
+    elif args.command == "status":
+        status(queue)
+
+if __name__ == "__main__":
+    main()
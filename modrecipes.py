@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+# Recipe conflict detection by canonical input fingerprints
+#
+# Recipes are keyed in the analysis data by the global item names ModAnalyzer.java
+# emits, which differ between recipes using an ore dictionary name and recipes using
+# an item registered under it, so recipes with the same inputs and different outputs
+# slip through. Here each recipe is reduced to an order-normalized fingerprint of its
+# inputs, with items replaced by their ore dictionary names, and hashed into an index.
+
+import sys
+
+import modanalyzer
+
+RECIPE_KINDS = ("recipes/smelting", "recipes/crafting/shapeless", "recipes/crafting/shaped")
+
+WILDCARD_META = "32767"  # OreDictionary.WILDCARD_VALUE
+
+"""Get the global item name of an item, given its name with meta ("Mod/item.foo:0") or without (any meta)."""
+def normalizeItem(name):
+    if name == "null" or name == "":
+        return "null"
+    if ":" not in name:
+        return name + ":*"
+    gid, meta = name.rsplit(":", 1)
+    if meta == WILDCARD_META:
+        meta = "*"
+    return gid + ":" + meta
+
+"""Get numeric item ID -> global item name (without meta) lookups, per mod and for all mods."""
+def getGlobalItemNames(contents):
+    byMod = {}
+    anyMod = {}
+    for mod, content in contents.iteritems():
+        byMod[mod] = {}
+        for id, data in content.get("item", {}).iteritems():
+            if not data.has_key("gid"): continue
+            byMod[mod][id] = data["gid"]
+            anyMod.setdefault(id, data["gid"])
+    return byMod, anyMod
+
+"""Convert a numeric "id:meta" item string, as in oredict records and recipe outputs, to a global item name."""
+def numericToGlobal(mod, item, byMod, anyMod):
+    if ":" in item:
+        id, meta = item.split(":", 1)
+    else:
+        id, meta = item, "*"
+    gid = byMod.get(mod, {}).get(id) or anyMod.get(id)
+    if gid is None:
+        return "id" + item  # unknown, but still consistent
+    return normalizeItem(gid + ":" + meta)
+
+"""Get global item name -> sorted ore dictionary names from the 'oredict' records."""
+def getOreNames(contents, byMod, anyMod):
+    item2ores = {}
+    for mod, content in contents.iteritems():
+        for item, data in content.get("oredict", {}).iteritems():
+            if not data.has_key("name"): continue
+            name = numericToGlobal(mod, item, byMod, anyMod)
+            item2ores.setdefault(name, set()).add(data["name"])
+
+    return dict((item, sorted(ores)) for item, ores in item2ores.iteritems())
+
+"""Get the canonical token for one recipe ingredient, a global item name or a comma-separated list of alternatives."""
+def canonicalIngredient(ingredient, item2ores):
+    alternatives = [normalizeItem(x) for x in ingredient.split(",") if x != ""]
+    if len(alternatives) == 0:
+        return "null"
+
+    tokens = set()
+    for item in alternatives:
+        ores = item2ores.get(item)
+        if ores is None and not item.endswith(":*"):
+            ores = item2ores.get(item.rsplit(":", 1)[0] + ":*")  # an ore registered for any meta matches each specific meta, too
+        if ores is not None:
+            tokens.add("ore:" + min(ores))  # the first name in sorted order, whatever order ores are in
+        else:
+            tokens.add(item)
+
+    return ",".join(sorted(tokens))
+
+"""Get the canonical input fingerprint of a recipe record, or None if it cannot be parsed."""
+def getFingerprint(kind, id, item2ores):
+    if kind == "recipes/smelting":
+        return "smelting:" + canonicalIngredient(id, item2ores)
+
+    elif kind == "recipes/crafting/shapeless":
+        # order doesn't matter
+        tokens = [canonicalIngredient(x, item2ores) for x in id.split(";")]
+        return "shapeless:" + ";".join(sorted(tokens))
+
+    elif kind == "recipes/crafting/shaped":
+        if not id.startswith("W="): return None
+        width, rest = id[len("W="):].split(";", 1)
+        width = int(width)
+        tokens = [canonicalIngredient(x, item2ores) for x in rest.split(";")]
+        if width <= 0 or len(tokens) % width != 0:
+            return None  # older dumps joined ore alternatives with ';', ambiguous
+
+        # mirrored shapes match the same grid
+        rows = [tokens[i:i + width] for i in range(0, len(tokens), width)]
+        mirrored = [list(reversed(row)) for row in rows]
+        grid = min(rows, mirrored)
+        return "shaped:W=%s;%s" % (width, ";".join(";".join(row) for row in grid))
+
+    return None
+
+"""Build the fingerprint index: fingerprint -> list of (mod, kind, id, output)."""
+def buildRecipeIndex(contents):
+    byMod, anyMod = getGlobalItemNames(contents)
+    item2ores = getOreNames(contents, byMod, anyMod)
+
+    index = {}
+    unparseable = 0
+    for mod, content in contents.iteritems():
+        for kind in RECIPE_KINDS:
+            for id, data in content.get(kind, {}).iteritems():
+                fingerprint = getFingerprint(kind, id, item2ores)
+                if fingerprint is None:
+                    unparseable += 1
+                    fingerprint = kind + ":" + id  # fall back to the raw key
+
+                output = numericToGlobal(mod, data.get("output", "null"), byMod, anyMod)
+                index.setdefault(fingerprint, []).append((mod, kind, id, output))
+
+    if unparseable > 0:
+        print "NOTICE: %s recipes could not be fingerprinted, re-analyze with a newer ModAnalyzer" % (unparseable,)
+
+    return index
+
+"""Get recipe collisions: fingerprint -> recipes, where the same inputs give different outputs."""
+def getRecipeConflicts(contents):
+    conflicts = {}
+    for fingerprint, recipes in buildRecipeIndex(contents).iteritems():
+        outputs = set(output for mod, kind, id, output in recipes)
+        if len(outputs) > 1:
+            conflicts[fingerprint] = recipes
+    return conflicts
+
+def showRecipeConflicts(conflicts):
+    for fingerprint in sorted(conflicts.keys()):
+        print "Recipe conflict on %s" % (fingerprint,)
+        for mod, kind, id, output in sorted(conflicts[fingerprint]):
+            print "\t%s\t%s -> %s" % (mod, kind, output)
+
+def main():
+    contents = modanalyzer.load()
+    if len(sys.argv) > 1:
+        wanted = set(name + ".csv" for name in sys.argv[1:])
+        contents = dict((mod, content) for mod, content in contents.iteritems() if mod in wanted or mod.startswith("Minecraft"))
+
+    conflicts = getRecipeConflicts(contents)
+    showRecipeConflicts(conflicts)
+    print "%s recipe conflicts" % (len(conflicts),)
+
+if __name__ == "__main__":
+    main()
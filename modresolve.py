@@ -5,16 +5,34 @@ import sys
 import pprint
 import re
 import glob
+import argparse
+import json
+import bisect
 
 import modanalyzer
 import modlist
 import mcmodfixes
+import modsolver
+import modrecipes
+import modprofile
+import modpack
+import modmanifest
 
-CHECK_CONFLICT_KINDS = ("block", "item", "biome", "recipes/smelting", "recipes/crafting/shapeless", "recipes/crafting/shaped")  # check for conflicts on these
+CHECK_CONFLICT_KINDS = ("block", "item", "biome")  # check for ID conflicts on these, recipes are checked by modrecipes
 RESOLVE_CONFLICT_KINDS = ("block", "item", "biome")
 
 WANTED_MODS_FILENAME = "include.txt"
 
+# weights of the default mod priority, per ID or block of a mod with the feature: mods scoring higher keep their IDs
+PRIORITY_WEIGHTS = {
+    "block": 1000,      # block IDs are the scarcest
+    "item": 10,
+    "biome": 10,
+    "tileEntity": 100,  # blocks with tile entities, which keep their data in worlds by ID
+    "immobile": 50,     # blocks which can't be pushed (mobility flag 2), often parts of larger structures
+    "manualEdit": 200,  # IDs which can't be changed in the mod's configs automatically
+    }
+
 ID_RANGES = {
     "block": range(500, 4096),  # >256 for future vanilla block expansion, >408 for future itemblocks -- maximum, 12-bit
     "blocktg": range(1, 256),   # terrain generation blocks
@@ -31,12 +49,9 @@ def findAvailable(used, kind, current):
     print used
     assert False, "all %s are used!" % (kind,)        # if you manage to max out the blocks in legitimate usage, I'd be very interested in your mod collection
 
-def sortModsByPriority(mods, sortedMods):
-    def getPriority(m):
-        if m.startswith("Minecraft"): return -1
-        return sortedMods.index(modanalyzer.getModName(m.replace(".csv", "")))
-
-    mods.sort(cmp=lambda a, b: cmp(getPriority(b[0]), getPriority(a[0])))
+"""Sort conflicting (mod, defaultId) by priority, highest last."""
+def sortModsByPriority(mods, priority):
+    mods.sort(key=lambda m: priority.getRank(m[0]), reverse=True)
 
 """Get whether this mod list contains a vanilla override, which should not be resolved."""
 def vanillaOverride(mods):
@@ -67,15 +82,14 @@ def getConflicts(resolutions):
 
     return sliced
 
-"""Get a list of edits of tuples (mod,kind,id,newId) to resolve ID conflicts of 'kind'."""
-def getConflictResolutions(contents, kind, allSortedMods, preferredIDs):
-
+"""Get initial resolutions (mod, defaultId) -> None, or the stable/preferred ID if any, for all 'kind' IDs of the mods in priority."""
+def getInitialResolutions(contents, kind, priority, preferredIDs, stableAssignments={}, verbose=True):
     # initialize 'resolutions' to (mod, defaultId) -> None (no change)
     # -- this data structure is used to keep track of the assigned IDs being resolved
     resolutions = {}
     unlocalizedName2ID = {}
     for mod, content in contents.iteritems():
-        if mod.replace(".csv","") not in allSortedMods: continue
+        if mod not in priority: continue
         for defaultId, data in content.get(kind, {}).iteritems():
             resolutions[(mod, modlist.intIfInt(defaultId))] = None
 
@@ -95,6 +109,13 @@ def getConflictResolutions(contents, kind, allSortedMods, preferredIDs):
     #print "INITIAL RESOLUTIONS"
     #pprint.pprint(resolutions)
 
+    # Keep IDs assigned by a previous run, so existing worlds don't break
+    stableIds = set()
+    for key, assignedId in stableAssignments.iteritems():
+        if resolutions.has_key(key):
+            resolutions[key] = assignedId
+            stableIds.add(assignedId)
+
     # Load preferred IDs from NEI dump, pre-populating resolutions
     for name, newId in preferredIDs.iteritems():
         m = unlocalizedName2ID.get(name)
@@ -105,7 +126,8 @@ def getConflictResolutions(contents, kind, allSortedMods, preferredIDs):
             mod, defaultId = m
             defaultId = modlist.intIfInt(defaultId)
             if mod.startswith("Minecraft-"): continue # vanilla, uninteresting
-            print "Matched preferred ID:",name,"is",(mod, defaultId),"->",newId
+            if stableAssignments.has_key((mod, defaultId)) or newId in stableIds: continue # previous run takes precedence
+            if verbose: print "Matched preferred ID:",name,"is",(mod, defaultId),"->",newId
 
             assert resolutions[(mod, defaultId)] is None, "attempted to load preferred ID for %s,%s -> %s but already %s?" % (mod, defaultId, newId, resolutions[(mod, defaultId)])
 
@@ -114,6 +136,12 @@ def getConflictResolutions(contents, kind, allSortedMods, preferredIDs):
     #print "PRE-POPULATED RESOLUTIONS"
     #pprint.pprint(resolutions)
 
+    return resolutions
+
+"""Get a list of edits of tuples (mod,kind,id,newId) to resolve ID conflicts of 'kind'."""
+def getConflictResolutions(contents, kind, priority, preferredIDs, stableAssignments={}, verbose=True):
+    resolutions = getInitialResolutions(contents, kind, priority, preferredIDs, stableAssignments, verbose)
+
     conflicts = getConflicts(resolutions)
     #print "SLICED",
     #pprint.pprint(conflicts)
@@ -124,12 +152,12 @@ def getConflictResolutions(contents, kind, allSortedMods, preferredIDs):
         if len(usingMods) > 1:
             # sort by priority, highest mods last
             sortedMods = usingMods
-            sortModsByPriority(sortedMods, allSortedMods)
+            sortModsByPriority(sortedMods, priority)
 
             if vanillaOverride(sortedMods):
                 continue
 
-            print "Conflict on %s at %s" % (kind, id)
+            if verbose: print "Conflict on %s at %s" % (kind, id)
 
             # move already-resolved IDs to front of the queue, cut in line, ultimate highest priority
             alreadyAssigned = []
@@ -140,16 +168,17 @@ def getConflictResolutions(contents, kind, allSortedMods, preferredIDs):
 
             if len(alreadyAssigned) > 0:
                 priorityMod = alreadyAssigned.pop()
-                print "\t(using preference %s)" % (priorityMod,)
+                if verbose: print "\t(using preference %s)" % (priorityMod,)
                 del sortedMods[sortedMods.index(priorityMod)]
                 sortedMods.append(priorityMod)  # last = highest
 
-            print "\tkeeping %s %s:%s" % (sortedMods.pop(), kind, id)  # it gets the ID
+            keeping = sortedMods.pop()  # it gets the ID
+            if verbose: print "\tkeeping %s %s:%s" % (keeping, kind, id)
 
             if kind not in RESOLVE_CONFLICT_KINDS:
                 # some conflicts we can't do much about, just alert them
                 for conflictingMod in sortedMods:
-                    print "\tkeeping %s %s:%s" % (conflictingMod, kind, id)
+                    if verbose: print "\tkeeping %s %s:%s" % (conflictingMod, kind, id)
                 continue
 
             # Move other mods out of the way
@@ -163,34 +192,31 @@ def getConflictResolutions(contents, kind, allSortedMods, preferredIDs):
                 assert resolutions.has_key(key), "resolution missing key? %s" % (key,)
                 assert resolutions[key] is None, "attempted to resolve already-resolved? %s -> %s but already %s" % (key, resolutions[key], newId)
                 resolutions[key] = newId
-                print "\tmoving %s %s -> %s" % (conflictingMod, id, newId)
+                if verbose: print "\tmoving %s %s -> %s" % (conflictingMod, id, newId)
 
     return resolutions
 
 CONFIG_IGNORE = ["forge.cfg", "forgeChunkLoading.cfg"]  # TODO: exclude from deps in mod analysis
 
-"""Get list of source and target paths for config files of a given mod."""
-def getConfigFiles(mod):
-    configDir = modanalyzer.getConfigsDir(mod)
-
+"""Get list of source and target paths for config files of a given mod, analyzed and installed by analyzer."""
+def getConfigFiles(mod, analyzer=modanalyzer.session):
     configs = []
-    for name in modanalyzer.recursiveListdir(configDir):
+    for name, sourcePath in analyzer.getConfigEntries(mod):
         if name in CONFIG_IGNORE: 
             continue
-        sourcePath = os.path.join(configDir, name)
-        targetPath = os.path.join(modanalyzer.TEST_SERVER_ROOT, "config", name)
+        targetPath = os.path.join(analyzer.serverRoot, "config", name)
 
         configs.append((sourcePath, targetPath))
 
     return configs
 
 """Install mod configuration. Returns any needed manual edits."""
-def installModConfigs(mod, modEdits):
+def installModConfigs(mod, modEdits, analyzer=modanalyzer.session):
     pendingEdits = []
 
     # read default configs
     editingConfigs = {}
-    for sourcePath, targetPath in getConfigFiles(mod):
+    for sourcePath, targetPath in getConfigFiles(mod, analyzer):
         data = file(sourcePath).read()
         editingConfigs[targetPath] = data
 
@@ -225,7 +251,7 @@ def installModConfigs(mod, modEdits):
 
         if os.path.exists(targetPath):
             print "NOTICE: Mod reuses config: installing configs for %s from %s but %s already exists - needs merge" % (mod, sourcePath, targetPath)
-            readme = "\n" + ("#" * 70) + "\n# TODO: Merge from " + modanalyzer.getModName(mod) + "\n" + ("#" * 70) + "\n"
+            readme = "\n" + ("#" * 70) + "\n# TODO: Merge from " + analyzer.getModName(mod) + "\n" + ("#" * 70) + "\n"
             data = readme + data
 
             needsMerge = True
@@ -249,7 +275,7 @@ def applyConfigEdit(mod, data, kind, oldId, newId, excludeLineTexts):
             newId -= 256
 
     # id kinds which might collide with other kinds, restrict ourselves to Forge sections
-    mustMatchSection = kind in ("biome")
+    mustMatchSection = kind == "biome"
 
     # Find possibly matching lines
     hits = {}
@@ -294,38 +320,151 @@ def applyConfigEdit(mod, data, kind, oldId, newId, excludeLineTexts):
     data = "\n".join(lines + comments)
     return data, requiresManual, editedLineText
 
-"""Get an estimate of the relative amount of the content in a mod."""
-def getModGirth(contents, mod):
-    key = modanalyzer.getModName(mod) + ".csv"
+configIdIndexCache = {}  # (analyzer, mod) -> index
+
+"""Get an index of ID-like config values of a mod, for predicting applyConfigEdit() results: path -> value -> [hits, hits in a biome section]."""
+def getConfigIdIndex(mod, analyzer=modanalyzer.session):
+    if configIdIndexCache.has_key((analyzer, mod)):
+        return configIdIndexCache[(analyzer, mod)]
+
+    index = {}
+    for sourcePath, targetPath in getConfigFiles(mod, analyzer):
+        values = {}
+        inBiomeSection = False
+        for line in file(sourcePath).read().split("\n"):
+            if line.startswith("#"): continue
+            if line.startswith("biome {"):
+                inBiomeSection = True
+            if "=" not in line: continue
+
+            value = line.rsplit("=", 1)[1]
+            counts = values.setdefault(value, [0, 0])
+            counts[0] += 1
+            if inBiomeSection:
+                counts[1] += 1
+        index[sourcePath] = values
+
+    configIdIndexCache[(analyzer, mod)] = index
+    return index
+
+"""Get whether changing the given ID of a mod ("foo.jar.csv") could be done automatically by applyConfigEdit()."""
+def isAutoEditable(mod, kind, oldId, analyzer=modanalyzer.session):
+    if kind not in RESOLVE_CONFLICT_KINDS:
+        return False
+
+    modName = mod.replace(".csv", "")
+    if kind == "item" and not mcmodfixes.usesUnshiftedItemIDs(modName):
+        oldId -= 256
+
+    mustMatchSection = kind == "biome"
+
+    for values in getConfigIdIndex(modName, analyzer).itervalues():
+        counts = values.get(str(oldId))
+        if counts is None: continue
+
+        if mustMatchSection:
+            hits = counts[1]
+        else:
+            hits = counts[0]
+
+        if hits == 1:
+            return True  # unambiguous in this file
+
+    return False
+
+"""Get resolutions like getConflictResolutions(), but solved globally with modsolver, minimizing moves and manual edits."""
+def getOptimizedConflictResolutions(contents, kind, priority, preferredIDs, stableAssignments={}, timeBudget=modsolver.DEFAULT_TIME_BUDGET, verbose=True, analyzer=modanalyzer.session):
+    if kind not in RESOLVE_CONFLICT_KINDS:
+        # nothing to optimize, only reporting
+        return getConflictResolutions(contents, kind, priority, preferredIDs, stableAssignments, verbose)
+
+    resolutions = getInitialResolutions(contents, kind, priority, preferredIDs, stableAssignments, verbose)
+
+    def getRangeKind(defaultId):
+        if kind == "block" and defaultId < 256: return "blocktg" # preserve <256 requirement for likely terrain gen blocks
+        return kind
+
+    def isEditable(mod, kind, defaultId):
+        return isAutoEditable(mod, kind, defaultId, analyzer)
+
+    return modsolver.solve(resolutions, kind, ID_RANGES, getRangeKind, priority.getPriority, isEditable, timeBudget, verbose)
+
+"""Get the features of a mod weighed in its default priority: feature -> count, like PRIORITY_WEIGHTS."""
+def getPriorityFeatures(contents, mod, analyzer=modanalyzer.session):
+    key = analyzer.getModName(mod) + ".csv"
     if not contents.has_key(key):
         print "No mod analysis found for %s, please analyze" % (mod,)
         sys.exit(-1)
 
     content = contents[key]
 
-    blocks = content.get("block", [])
-
-    girth = len(blocks) * 1000 + len(content) 
-    # TODO: more in-depth analysis, weights for different content types? (blocks > item?)
-    # TODO: also factor in id 'immobility', higher priority if can't move?
-
-    return girth
+    features = dict((feature, 0) for feature in PRIORITY_WEIGHTS)
+    for kind in CHECK_CONFLICT_KINDS:
+        for defaultId in content.get(kind, {}).iterkeys():
+            features[kind] += 1
+            if not isAutoEditable(key, kind, modlist.intIfInt(defaultId), analyzer):
+                features["manualEdit"] += 1
+
+    for data in content.get("block", {}).itervalues():
+        if data.get("hasTileEntity"):
+            features["tileEntity"] += 1
+        if data.get("mobilityFlag") == 2:
+            features["immobile"] += 1
+
+    return features
+
+"""Get the default priority score of a mod, the weighted sum of its features, higher first."""
+def getModScore(contents, mod, weights=PRIORITY_WEIGHTS, analyzer=modanalyzer.session):
+    features = getPriorityFeatures(contents, mod, analyzer)
+    return sum(weights.get(feature, 0) * count for feature, count in features.iteritems())
+
+"""Mod priority computed once, for constant-time lookups while resolving conflicts.
+
+sortedMods are mod filenames, highest priority first, including the vanilla Minecraft-* baseline, which
+outranks all mods since its IDs can't be moved. Mods can be looked up by filename or contents key (foo.jar.csv)."""
+class ModPriority(object):
+    def __init__(self, sortedMods):
+        self.sortedMods = list(sortedMods)
+        self.ranks = {}
+        for i, modName in enumerate(self.sortedMods):
+            self.ranks[modName] = i
+            self.ranks[modName + ".csv"] = i
+
+    def __contains__(self, mod):
+        return self.ranks.has_key(mod)
+
+    """Get the rank of a mod, 0 for the highest priority mod, -1 for vanilla."""
+    def getRank(self, mod):
+        if mod.startswith("Minecraft"): return -1
+        return self.ranks[mod]
+
+    """Get the priority of a mod as a number, higher is more important, for modsolver."""
+    def getPriority(self, mod):
+        return -self.getRank(mod)
 
 PRIORITY_FILE = "priority.txt"
 
-"""Sort all mods by priority."""
-def sortAllMods(contents):
-    mods = os.listdir(modanalyzer.ALL_MODS_DIR) 
+"""Read the mod priority list saved by sortAllMods(), highest priority first, or None if there is none."""
+def readPriorityFile():
+    if not os.path.exists(PRIORITY_FILE):
+        return None
+    return [x.strip() for x in file(PRIORITY_FILE).readlines()]
 
-    # default priority
-    mods.sort(cmp=lambda a, b: cmp(getModGirth(contents, b), getModGirth(contents, a)))
+"""Sort all mods by priority: as in PRIORITY_FILE, then any others by their score with weights."""
+def sortAllMods(contents, weights=PRIORITY_WEIGHTS, analyzer=modanalyzer.session):
+    mods = os.listdir(modanalyzer.ALL_MODS_DIR)
 
-    if os.path.exists(PRIORITY_FILE):
-        existingPriority = [x.strip() for x in file(PRIORITY_FILE).readlines()]
-        missing = set(mods) - set(existingPriority) 
+    # default priority, scored once per mod
+    scores = dict((mod, getModScore(contents, mod, weights, analyzer)) for mod in mods)
+    mods.sort(key=lambda mod: (-scores[mod], mod))
+
+    existingPriority = readPriorityFile()
+    if existingPriority is not None:
+        existing = set(existingPriority)
+        missing = [mod for mod in mods if mod not in existing]
         if len(missing) != 0:
-            # just add to the end
-            mods = existingPriority + list(missing)
+            # just add to the end, in default priority order
+            mods = existingPriority + missing
             print "NOTICE: Adding %s mods to end of priority list %s" % (missing, PRIORITY_FILE)
             file(PRIORITY_FILE, "w").write("\n".join(mods))
         else:
@@ -368,41 +507,39 @@ def loadNEIDump():
 
     return parseNEIDump(filename)
 
+"""Get views of contents without itemblocks (items) - because they're handled as blocks."""
 def filterItemBlocks(contents):
     newContents = {}
 
     for mod, content in contents.iteritems():
         newContent = {}
         for kind, datas in content.iteritems():
-            newDatas = {}
-            for defaultId, data in datas.iteritems():
-                skip = False
-                if data.get("isItemBlock", "false") == "true":
-                    skip = True # skip itemblocks (items) - because they're handled as blocks
-        
-                if not skip:
-                    newDatas[defaultId] = data
-
-            newContent[kind] = newDatas
+            newContent[kind] = datas.without("isItemBlock", True)
         newContents[mod] = newContent
 
     return newContents
 
+WANTED_MODS_TAG = "# Remove this line to edit your desired mod selection list below\n"
+
+"""Read the list of mods to include, without writing it: as edited in WANTED_MODS_FILENAME, or None if it wasn't edited."""
+def readWantedMods():
+    if not os.path.exists(WANTED_MODS_FILENAME) or file(WANTED_MODS_FILENAME).read().startswith(WANTED_MODS_TAG[:-1]):
+        return None
+
+    wanted = [line.strip() for line in file(WANTED_MODS_FILENAME).readlines()]
+    return [want for want in wanted if want != "" and not want.startswith("#")]
+
 """Get list of all mods to include."""
 def getWantedMods():
-    everything = os.listdir(modanalyzer.ALL_MODS_DIR)
-
-    tag = "# Remove this line to edit your desired mod selection list below\n"
-    if os.path.exists(WANTED_MODS_FILENAME) and not file(WANTED_MODS_FILENAME).read().startswith(tag[:-1]):
+    wanted = readWantedMods()
+    if wanted is not None:
         # user-selected list found, and edited, use it
-        wanted = [line.strip() for line in file(WANTED_MODS_FILENAME).readlines()]
-        wanted = [want for want in wanted if not want.startswith("#")]
         print "Using wanted list",WANTED_MODS_FILENAME
     else:
         # assume wants everything, but write out list for customizing mod selection on subsequent runs
-        wanted = sorted(everything)
+        wanted = sorted(os.listdir(modanalyzer.ALL_MODS_DIR))
         f = file(WANTED_MODS_FILENAME, "wt")
-        f.write(tag)
+        f.write(WANTED_MODS_TAG)
         for w in wanted:
             f.write(w + "\n")
         f.close()
@@ -411,58 +548,245 @@ def getWantedMods():
     return wanted
 
 
+RESOLUTION_STATE_FILE = "resolution-state.json"
+PACK_MANIFEST_FILE = "pack-manifest.json"
+
+"""Get the path of a file kept for the server of the version being resolved, such as RESOLUTION_STATE_FILE."""
+def getVersionPath(filename, analyzer=modanalyzer.session):
+    return os.path.join(analyzer.root, filename)
+
+"""Load the resolution plan saved by the previous run, or None if there is none."""
+def loadResolutionState(analyzer=modanalyzer.session):
+    if not os.path.exists(getVersionPath(RESOLUTION_STATE_FILE, analyzer)):
+        return None
+    return json.loads(file(getVersionPath(RESOLUTION_STATE_FILE, analyzer)).read())
+
+"""Save the resolution plan for the next run: mod priority, assigned IDs and what was installed."""
+def saveResolutionState(sortedMods, resolutionsByKind, installed, analyzer=modanalyzer.session):
+    assignments = {}
+    for kind in RESOLVE_CONFLICT_KINDS:
+        assignments[kind] = {}
+        for (mod, defaultId), assignedId in resolutionsByKind[kind].iteritems():
+            if mod.startswith("Minecraft"): continue
+            if assignedId is None: assignedId = defaultId
+            assignments[kind].setdefault(mod, {})[str(defaultId)] = assignedId
+
+    state = {"sortedMods": sortedMods, "assignments": assignments, "installed": installed}
+    file(getVersionPath(RESOLUTION_STATE_FILE, analyzer), "w").write(json.dumps(state, sort_keys=True, indent=1))
+
+"""Get mods whose relative priority changed, as those outside the longest sequence of mods still in the same order."""
+def getReprioritizedMods(oldSortedMods, newSortedMods):
+    oldRank = dict((m, i) for i, m in enumerate(oldSortedMods))
+    common = [m for m in newSortedMods if oldRank.has_key(m)]
+
+    # longest increasing subsequence of old ranks, patience sorting
+    tailRanks = []
+    tails = []
+    parents = [None] * len(common)
+    for i, m in enumerate(common):
+        j = bisect.bisect_left(tailRanks, oldRank[m])
+        if j > 0:
+            parents[i] = tails[j - 1]
+        if j == len(tails):
+            tailRanks.append(oldRank[m])
+            tails.append(i)
+        else:
+            tailRanks[j] = oldRank[m]
+            tails[j] = i
+
+    inOrder = set()
+    i = tails[-1] if len(tails) > 0 else None
+    while i is not None:
+        inOrder.add(common[i])
+        i = parents[i]
+
+    return set(common) - inOrder
+
+"""Get IDs assigned by the previous run to keep, (mod, defaultId) -> assignedId, skipping reprioritized mods."""
+def getStableAssignments(state, kind, reprioritized):
+    stable = {}
+    if state is None:
+        return stable
+
+    for mod, ids in state["assignments"].get(kind, {}).iteritems():
+        if mod.replace(".csv", "") in reprioritized: continue
+        for defaultId, assignedId in ids.iteritems():
+            stable[(mod, modlist.intIfInt(defaultId))] = assignedId
+    return stable
+
+"""Get a cheap signature of a mod file to detect changes, without hashing it."""
+def getModSignature(mod):
+    st = os.stat(mod)
+    return [st.st_size, int(st.st_mtime)]
+
+"""Remove files installed for a mod by a previous run."""
+def uninstallMod(modName, installedMod):
+    print "Uninstalling",modName
+    for path in installedMod["files"] + installedMod["configs"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+"""Get mods which need (re)installing: new, changed, or with missing files. Mods sharing configs with them are included, since shared configs are rewritten."""
+def getDirtyMods(sortedMods, installed, modEditsByMod):
+    dirty = set()
+    for modName in sortedMods:
+        mod = os.path.join(modanalyzer.ALL_MODS_DIR, modName)
+        old = installed.get(modName)
+        if old is None or \
+            old["signature"] != getModSignature(mod) or \
+            old["edits"] != modEditsByMod[modName] or \
+            not all(os.path.exists(path) for path in old["files"] + old["configs"]):
+            dirty.add(modName)
+
+    removed = set(installed.keys()) - set(sortedMods)
+
+    configOwners = {}
+    for modName, old in installed.iteritems():
+        for path in old["configs"]:
+            configOwners.setdefault(path, set()).add(modName)
+
+    pending = list(dirty | removed)
+    while len(pending) > 0:
+        modName = pending.pop()
+        for path in installed.get(modName, {}).get("configs", []):
+            for other in configOwners[path]:
+                if other not in dirty and other in sortedMods:
+                    print "NOTICE: Reinstalling %s, shares config %s with %s" % (other, path, modName)
+                    dirty.add(other)
+                    pending.append(other)
+
+    return dirty, removed
+
 def main():
+    parser = argparse.ArgumentParser(description="Install analyzed mods into %s, resolving ID conflicts" % (modanalyzer.TEST_SERVER_ROOT,))
+    parser.add_argument("--optimize", action="store_true", help="solve ID conflicts globally, minimizing moved IDs and manual edits")
+    parser.add_argument("--time-budget", type=float, default=modsolver.DEFAULT_TIME_BUDGET, help="seconds to spend placing moved IDs with --optimize")
+    parser.add_argument("--pack", metavar="FILE", help="also write the installed mods and configs to a deterministic zip archive")
+    parser.add_argument("--clean", action="store_true", help="ignore %s, reassign all IDs and reinstall everything from scratch" % (RESOLUTION_STATE_FILE,))
+    modanalyzer.addVersionArgument(parser)
+    args = parser.parse_args()
+    analyzer = modanalyzer.useVersionArgument(args)
+    serverRoot = analyzer.serverRoot
+
     preferredIDs = loadNEIDump()
 
-    contents = modanalyzer.load()
-    contents = filterItemBlocks(contents)
+    allContents = analyzer.load()
+    contents = filterItemBlocks(allContents)
 
     wantedMods = getWantedMods()
-    sortedMods = [x for x in sortAllMods(contents) if x in wantedMods]
+    sortedMods = [x for x in sortAllMods(contents, analyzer=analyzer) if x in wantedMods]
+
+    # recipes can't be moved like IDs, only reported
+    wantedContents = dict((mod, content) for mod, content in allContents.iteritems() if mod.replace(".csv", "") in sortedMods or mod.startswith("Minecraft"))
+    modrecipes.showRecipeConflicts(modrecipes.getRecipeConflicts(wantedContents))
+    modprofile.showPackCost(wantedContents)
+
+    state = None
+    if not args.clean:
+        state = loadResolutionState(analyzer)
+
+    reprioritized = set()
+    if state is not None:
+        print "Reusing resolution state %s" % (getVersionPath(RESOLUTION_STATE_FILE, analyzer),)
+        reprioritized = getReprioritizedMods(state["sortedMods"], sortedMods)
+        if len(reprioritized) > 0:
+            print "NOTICE: Reassigning IDs of reprioritized mods %s" % (sorted(reprioritized),)
 
     resolutionsByKind = {}
-    vanilla = "Minecraft-" + modanalyzer.MC_VERSION
+    priority = ModPriority(sortedMods + [analyzer.getModName(None)])
     for kind in CHECK_CONFLICT_KINDS:
-        resolutionsByKind[kind] = getConflictResolutions(contents, kind, sortedMods+[vanilla], preferredIDs)
+        stableAssignments = getStableAssignments(state, kind, reprioritized)
+        if args.optimize:
+            resolutionsByKind[kind] = getOptimizedConflictResolutions(contents, kind, priority, preferredIDs, stableAssignments, args.time_budget, analyzer=analyzer)
+        else:
+            resolutionsByKind[kind] = getConflictResolutions(contents, kind, priority, preferredIDs, stableAssignments)
     #print "FINAL RES",
     #pprint.pprint(resolutionsByKind)
 
-    modsFolder, coremodsFolder, configFolder = modanalyzer.prepareCleanServerFolders(modanalyzer.TEST_SERVER_ROOT)
+    # extract the resolutions we care about, for editing the config
+    modEditsByMod = {}
+    for modName in sortedMods:
+        if not contents.has_key(modName+".csv"):
+            print "No mod analysis found for %s, please analyze" % (modName,)
+            sys.exit(-1)
+        modEditsByMod[modName] = []
+    for kind, resolutions in resolutionsByKind.iteritems():
+        for (thisMod, defaultId), assignedId in resolutions.iteritems():
+            modName = thisMod.replace(".csv", "")
+            if modEditsByMod.has_key(modName):
+                if assignedId is not None and assignedId != defaultId: # only if changed
+                    modEditsByMod[modName].append([kind, defaultId, assignedId])
+    for edits in modEditsByMod.itervalues():
+        edits.sort()
+    #print "MODEDITS=",modEditsByMod
+
+    if state is None:
+        modsFolder, coremodsFolder, configFolder = modanalyzer.prepareCleanServerFolders(serverRoot)
+        installed = {}
+    else:
+        modsFolder = os.path.join(serverRoot, "mods")
+        coremodsFolder = os.path.join(serverRoot, "coremods")
+        modanalyzer._mkdir(modsFolder)
+        modanalyzer._mkdir(coremodsFolder)
+        installed = state["installed"]
+
+    dirty, removed = getDirtyMods(sortedMods, installed, modEditsByMod)
+    for modName in sorted(removed | (dirty & set(installed.keys()))):
+        uninstallMod(modName, installed[modName])
+        del installed[modName]
+    print "%s mods to install, %s unchanged, %s removed" % (len(dirty), len(sortedMods) - len(dirty), len(removed))
 
     requiresManual = {}
     for modName in sortedMods:
         mod = os.path.join(modanalyzer.ALL_MODS_DIR, modName)
 
-        if not contents.has_key(os.path.basename(mod)+".csv"):
-            print "No mod analysis found for %s, please analyze" % (mod,)
-            sys.exit(-1)
+        if modName not in dirty:
+            # unchanged since last run, but still remind about its manual edits
+            if len(installed[modName]["pendingEdits"]) > 0:
+                requiresManual[mod] = installed[modName]["pendingEdits"]
+            continue
 
         print "Installing",mod
-        modanalyzer.installMod(mod, modsFolder, coremodsFolder)
-
-        # extract the resolutions we care about, for editing the config
-        modEdits = []
-        for kind, resolutions in resolutionsByKind.iteritems():
-            for (thisMod, defaultId), assignedId in resolutions.iteritems():
-                if os.path.basename(mod)+".csv" == thisMod:
-                    if assignedId is not None and assignedId != defaultId: # only if changed
-                        modEdits.append((mod, kind, defaultId, assignedId))
-        #print "MODEDITS=",modEdits 
-
-        pendingEdits = installModConfigs(mod, modEdits)
+        files = modanalyzer.installMod(mod, modsFolder, coremodsFolder)
+
+        modEdits = [(mod, kind, defaultId, assignedId) for kind, defaultId, assignedId in modEditsByMod[modName]]
+        pendingEdits = installModConfigs(mod, modEdits, analyzer)
         if len(pendingEdits) > 0:
             requiresManual[mod] = pendingEdits
 
+        installed[modName] = {
+            "signature": getModSignature(mod),
+            "edits": modEditsByMod[modName],
+            "files": files,
+            "configs": [targetPath for sourcePath, targetPath in getConfigFiles(mod, analyzer)],
+            "pendingEdits": pendingEdits,
+            }
+
+    saveResolutionState(sortedMods, resolutionsByKind, installed, analyzer)
+
+    # show what changed since the last run, for rolling out only that
+    previousManifest = {}
+    if os.path.exists(getVersionPath(PACK_MANIFEST_FILE, analyzer)):
+        previousManifest = modmanifest.loadManifest(getVersionPath(PACK_MANIFEST_FILE, analyzer))
+    manifest = modmanifest.getFolderManifest(serverRoot, previousManifest)
+    modmanifest.showDelta(modmanifest.diffManifests(previousManifest, manifest))
+    modmanifest.saveManifest(manifest, getVersionPath(PACK_MANIFEST_FILE, analyzer))
+
+    if args.pack is not None:
+        if len(requiresManual) > 0:
+            print "NOTICE: pack %s includes configs still needing manual edits" % (args.pack,)
+        modpack.buildPackArchive(serverRoot, args.pack)
+
     if len(requiresManual) > 0:
         print "=" * 70
         for m, edits in requiresManual.iteritems():
-            print m, "\t", " ".join([x[1] for x in getConfigFiles(m)]), "\t", edits
+            print m, "\t", " ".join([x[1] for x in getConfigFiles(m, analyzer)]), "\t", edits
         print "=" * 70
         print "The above mods require manual configuration file editing to continue."
-        print "Edit their configs appropriately (search for 'TODO'), then start the server."
+        print "Edit their configs appropriately (search for 'TODO'), then start the server, or run modverify.py to check them."
     else:
         print "Ready to go..."
-        modanalyzer.runServer()
+        modanalyzer.runServer(serverRoot)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+# Report of the analysis runs recorded in run-history.json
+#
+# Every analysis run records how long the server took, its exit status and how much it dumped.
+# Shows mods slowest first with the trend of their last run against the earlier ones, then the
+# outliers: mods much slower than the rest, runs much slower than usual for their mod, failed
+# runs, and runs which dumped much less than before (a mod which didn't load right, perhaps).
+#
+# Usage: modruns.py [mod...]
+
+OUTLIER_FACTOR = 2.0        # a run this many times slower than its mod's earlier runs is an outlier
+SHRUNK_FACTOR = 0.5         # as is output this much smaller than the previous run's
+MIN_OUTLIER_SECONDS = 5     # differences of less are noise
+
+import sys
+
+import modanalyzer
+
+def isFailed(run):
+    return run["exitStatus"] != 0 or run["outputBytes"] == 0
+
+"""Get the statistics of a mod's runs: {"runs", "medianSeconds", "earlierSeconds" (median of earlier successful runs), "lastSeconds", "trend" (last / earlierSeconds, or None), "last"}."""
+def getModStats(runs):
+    last = runs[-1]
+    earlier = modanalyzer.median([run["seconds"] for run in runs[:-1] if not isFailed(run)])
+
+    trend = None
+    if earlier:
+        trend = last["seconds"] / earlier
+
+    return {
+        "runs": len(runs),
+        "medianSeconds": modanalyzer.median([run["seconds"] for run in runs]),
+        "earlierSeconds": earlier,
+        "lastSeconds": last["seconds"],
+        "trend": trend,
+        "last": last,
+        }
+
+"""Get values above the upper fence of the interquartile range (Tukey's outliers), from mod -> value."""
+def getHighOutliers(values):
+    ordered = sorted(values.itervalues())
+    if len(ordered) < 4:
+        return []
+    q1 = ordered[len(ordered) / 4]
+    q3 = ordered[len(ordered) * 3 / 4]
+    fence = q3 + 1.5 * (q3 - q1)
+    return sorted((mod for mod, value in values.iteritems() if value > fence and value - q3 >= MIN_OUTLIER_SECONDS), key=lambda mod: -values[mod])
+
+"""Get (mod, reason) of notable runs."""
+def getOutliers(history, stats):
+    outliers = []
+    for mod in getHighOutliers(dict((mod, stat["medianSeconds"]) for mod, stat in stats.iteritems())):
+        outliers.append((mod, "slow, %s per run while most take up to %s" % (modanalyzer.formatDuration(stats[mod]["medianSeconds"]),
+            modanalyzer.formatDuration(sorted(stat["medianSeconds"] for stat in stats.itervalues())[len(stats) * 3 / 4]))))
+
+    for mod, stat in sorted(stats.iteritems()):
+        last = stat["last"]
+        if isFailed(last):
+            outliers.append((mod, "last run failed, exit status %s, %s bytes dumped" % (last["exitStatus"], last["outputBytes"])))
+        elif stat["trend"] is not None and stat["trend"] >= OUTLIER_FACTOR and stat["lastSeconds"] - stat["earlierSeconds"] >= MIN_OUTLIER_SECONDS:
+            outliers.append((mod, "last run %.1fx slower than usual, %s instead of %s" % (stat["trend"],
+                modanalyzer.formatDuration(stat["lastSeconds"]), modanalyzer.formatDuration(stat["earlierSeconds"]))))
+
+        successful = [run for run in history[mod] if not isFailed(run)]
+        if len(successful) >= 2 and successful[-1]["sections"] == successful[-2]["sections"] and \
+            successful[-1]["outputBytes"] < successful[-2]["outputBytes"] * SHRUNK_FACTOR:
+            outliers.append((mod, "dumped %s bytes, down from %s" % (successful[-1]["outputBytes"], successful[-2]["outputBytes"])))
+    return outliers
+
+def showReport(history):
+    stats = dict((mod, getModStats(runs)) for mod, runs in history.iteritems() if len(runs) > 0)
+
+    print "\t".join(["median", "last", "trend", "runs", "exit", "output KB", "mod"])
+    for mod, stat in sorted(stats.iteritems(), key=lambda entry: -entry[1]["medianSeconds"]):
+        trend = "-"
+        if stat["trend"] is not None:
+            trend = "%+.0f%%" % ((stat["trend"] - 1) * 100,)
+        print "\t".join([modanalyzer.formatDuration(stat["medianSeconds"]), modanalyzer.formatDuration(stat["lastSeconds"]), trend,
+            str(stat["runs"]), str(stat["last"]["exitStatus"]), "%.1f" % (stat["last"]["outputBytes"] / 1024.0,), mod])
+
+    print "Analyzing all %s mods one at a time takes about %s" % (len(stats), modanalyzer.formatDuration(sum(stat["medianSeconds"] for stat in stats.itervalues())))
+
+    outliers = getOutliers(history, stats)
+    if len(outliers) > 0:
+        print "=" * 70
+        for mod, reason in outliers:
+            print "%s: %s" % (mod, reason)
+
+def main():
+    history = modanalyzer.loadRunHistory()
+    if len(sys.argv) > 1:
+        history = dict((mod, runs) for mod, runs in history.iteritems() if mod in sys.argv[1:])
+
+    if len(history) == 0:
+        print "No analysis runs recorded in %s yet" % (modanalyzer.RUN_HISTORY_FILE,)
+        raise SystemExit
+
+    showReport(history)
+
+if __name__ == "__main__":
+    main()
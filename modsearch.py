@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# Full-text and prefix search over the names of analyzed content
+#
+# Indexes localizedName, unlocalizedName, itemDisplayName, biome and ore dictionary names
+# from data/ in an inverted index (token -> documents), with a sorted token list for prefix
+# queries and a trigram index for substring queries. Tokenized documents are persisted per
+# mod in search-index.json, and only mods whose analysis changed are re-read.
+#
+# Usage: modsearch.py copper ore
+
+SEARCH_INDEX_FILE = "search-index.json"
+
+# searched fields, and how much a match in each counts
+FIELD_WEIGHTS = {
+    "localizedName": 3,
+    "itemDisplayName": 3,
+    "name": 3,              # biomes, oredict
+    "unlocalizedName": 2,
+    }
+
+# how much a query term counts when it matches a token exactly, as a prefix, or as a substring
+EXACT_SCORE = 3
+PREFIX_SCORE = 2
+SUBSTRING_SCORE = 1
+
+import os, sys, re, json, bisect
+
+import modanalyzer
+
+"""Split text into lowercase word tokens, also at camelCase boundaries ("tile.blockOre" -> tile, blockore, block, ore)."""
+def tokenize(text):
+    camelSplit = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    tokens = []
+    for token in re.split(r"[^a-z0-9]+", text.lower()) + re.split(r"[^a-z0-9]+", camelSplit.lower()):
+        if token != "" and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+def getTrigrams(token):
+    return set(token[i:i + 3] for i in range(len(token) - 2))
+
+"""Get searchable documents [kind, id, field, text, tokens] from a mod's loaded content."""
+def getDocuments(content):
+    docs = []
+    for kind, table in content.iteritems():
+        for id, record in table.iteritems():
+            for field in FIELD_WEIGHTS:
+                text = record.get(field)
+                if not isinstance(text, basestring) or text in ("tile.null", "item.null"): continue
+                docs.append([kind, id, field, text, tokenize(text)])
+    return docs
+
+class SearchIndex(object):
+    def __init__(self):
+        self.mods = {}          # mod -> {"mtime": analysis file mtime, "docs": documents}
+        self.docs = {}          # doc id -> (mod, kind, id, field, text)
+        self.modDocs = {}       # mod -> doc ids
+        self.postings = {}      # token -> set of doc ids
+        self.trigrams = {}      # trigram -> set of tokens
+        self.sortedTokens = []  # for prefix ranges, rebuilt after changes
+        self.tokensChanged = False
+        self.nextDocId = 0
+
+    """Add or replace the documents of a mod."""
+    def setMod(self, mod, mtime, docs):
+        if self.mods.has_key(mod):
+            self.removeMod(mod)
+
+        self.mods[mod] = {"mtime": mtime, "docs": docs}
+        self.modDocs[mod] = []
+        for kind, id, field, text, tokens in docs:
+            docId = self.nextDocId
+            self.nextDocId += 1
+            self.docs[docId] = (mod, kind, id, field, text)
+            self.modDocs[mod].append(docId)
+
+            for token in tokens:
+                if not self.postings.has_key(token):
+                    self.postings[token] = set()
+                    for trigram in getTrigrams(token):
+                        self.trigrams.setdefault(trigram, set()).add(token)
+                    self.tokensChanged = True
+                self.postings[token].add(docId)
+
+    def removeMod(self, mod):
+        for docId in self.modDocs.pop(mod):
+            mod, kind, id, field, text = self.docs.pop(docId)
+            for token in tokenize(text):
+                docIds = self.postings.get(token)
+                if docIds is None: continue
+                docIds.discard(docId)
+                if len(docIds) == 0:
+                    del self.postings[token]
+                    for trigram in getTrigrams(token):
+                        self.trigrams[trigram].discard(token)
+                    self.tokensChanged = True
+        del self.mods[mod]
+
+    """Re-read mods whose analysis files changed in dataDir, and drop removed ones. Returns number of mods updated."""
+    def refresh(self, dataDir):
+        mtimes = {}
+        for filename in os.listdir(dataDir):
+            if filename.startswith("."): continue
+            mtimes[filename] = os.path.getmtime(os.path.join(dataDir, filename))
+
+        updated = 0
+        for mod in set(self.mods.keys()) - set(mtimes.keys()):
+            self.removeMod(mod)
+            updated += 1
+
+        for mod, mtime in mtimes.iteritems():
+            if self.mods.has_key(mod) and self.mods[mod]["mtime"] == mtime:
+                continue
+            self.setMod(mod, mtime, getDocuments(modanalyzer.loadMod(os.path.join(dataDir, mod))))
+            updated += 1
+
+        return updated
+
+    def load(self, filename=SEARCH_INDEX_FILE):
+        if not os.path.exists(filename):
+            return
+        for mod, entry in json.loads(file(filename).read()).iteritems():
+            self.setMod(mod, entry["mtime"], entry["docs"])
+
+    def save(self, filename=SEARCH_INDEX_FILE):
+        tmp = filename + ".tmp"
+        file(tmp, "w").write(json.dumps(self.mods))
+        os.rename(tmp, filename)
+
+    """Get token -> score for tokens matching a query term exactly, by prefix or as a substring."""
+    def matchTerm(self, term):
+        if self.tokensChanged:
+            self.sortedTokens = sorted(self.postings.keys())
+            self.tokensChanged = False
+
+        matches = {}
+
+        if len(term) >= 3:
+            candidates = None
+            for trigram in getTrigrams(term):
+                tokens = self.trigrams.get(trigram, set())
+                candidates = tokens if candidates is None else candidates & tokens
+        else:
+            candidates = self.postings.iterkeys()
+        for token in candidates:
+            if term in token:
+                matches[token] = SUBSTRING_SCORE
+
+        i = bisect.bisect_left(self.sortedTokens, term)
+        while i < len(self.sortedTokens) and self.sortedTokens[i].startswith(term):
+            matches[self.sortedTokens[i]] = PREFIX_SCORE
+            i += 1
+
+        if self.postings.has_key(term):
+            matches[term] = EXACT_SCORE
+
+        return matches
+
+    """Search for content matching all query terms. Returns best-first list of (score, mod, kind, id, field, text), one per content."""
+    def search(self, query, limit=20):
+        terms = [term for term in re.split(r"[^a-z0-9]+", query.lower()) if term != ""]
+        if len(terms) == 0:
+            return []
+
+        docScores = None
+        for term in terms:
+            termScores = {}
+            for token, score in self.matchTerm(term).iteritems():
+                for docId in self.postings[token]:
+                    if termScores.get(docId, 0) < score:
+                        termScores[docId] = score
+
+            if docScores is None:
+                docScores = termScores
+            else:
+                docScores = dict((docId, docScores[docId] + score) for docId, score in termScores.iteritems() if docScores.has_key(docId))
+
+        # best field per content, shorter names first among equals
+        best = {}
+        for docId, score in docScores.iteritems():
+            mod, kind, id, field, text = self.docs[docId]
+            score *= FIELD_WEIGHTS[field]
+            key = (mod, kind, id)
+            if not best.has_key(key) or best[key][0] < score:
+                best[key] = (score, mod, kind, id, field, text)
+
+        results = sorted(best.values(), key=lambda r: (-r[0], len(r[5]), r[1], r[2], r[3]))
+        return results[:limit]
+
+def main():
+    if len(sys.argv) < 2:
+        print "Usage: %s query..." % (sys.argv[0],)
+        raise SystemExit
+
+    index = SearchIndex()
+    index.load()
+    if index.refresh(modanalyzer.DATA_DIR) > 0:
+        index.save()
+
+    for score, mod, kind, id, field, text in index.search(" ".join(sys.argv[1:])):
+        print "%s\t%s\t%s:%s\t%s=%s" % (score, mod, kind, id, field, text)
+
+if __name__ == "__main__":
+    main()
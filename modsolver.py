@@ -0,0 +1,162 @@
+#!/usr/bin/python
+
+# Global ID conflict solver - alternative to the greedy modresolve.getConflictResolutions()
+#
+# All claims on a kind's ID space are modeled together as an assignment problem: every
+# (mod, defaultId) either keeps its default ID or is assigned a free one. Moving an ID onto
+# a free ID never creates a new conflict, so the minimum-cost assignment decomposes per
+# contested ID: keep the claimant which is the most expensive to move, move the rest. The
+# expensive part is then placing the moved IDs, which is done per mod into contiguous free
+# runs (best fit) for ID locality, within a time budget.
+
+import time
+
+MOVE_COST = 10              # every moved ID costs something, minimize them
+MANUAL_EDIT_COST = 100      # moving an ID whose config we cannot edit automatically costs a manual edit
+
+DEFAULT_TIME_BUDGET = 5.0   # seconds
+
+"""Get the assigned ID from the resolution data structure (default if none is assigned)."""
+def getAssignedId(resolutions, claim):
+    newId = resolutions[claim]
+    if newId is None:
+        return claim[1]
+    else:
+        return newId
+
+def isVanilla(mod):
+    return mod.startswith("Minecraft")
+
+"""Get the cost of moving a (mod, defaultId) claim out of the way."""
+def getMoveCost(claim, kind, isAutoEditable):
+    mod, defaultId = claim
+    cost = MOVE_COST
+    if not isAutoEditable(mod, kind, defaultId):
+        cost += MANUAL_EDIT_COST
+    return cost
+
+"""Choose which claims on contested IDs to move. Returns list of claims, and number predicted to need manual edits."""
+def chooseMoves(resolutions, kind, getPriority, isAutoEditable, verbose=True):
+    sliced = {}
+    for claim in resolutions:
+        sliced.setdefault(getAssignedId(resolutions, claim), []).append(claim)
+
+    moves = []
+    manual = 0
+    for id, claims in sliced.iteritems():
+        if len(claims) < 2:
+            continue
+
+        if any(isVanilla(mod) for mod, defaultId in claims):
+            # vanilla overrides are intentional, not resolvable
+            continue
+
+        # preferred IDs (from NEI) were already assigned - they cut in line
+        pinned = [claim for claim in claims if resolutions[claim] is not None]
+        assert len(pinned) <= 1, "multiple IDs already resolved to same ID? %s on id %s" % (pinned, id)
+
+        costs = dict((claim, getMoveCost(claim, kind, isAutoEditable)) for claim in claims)
+        if len(pinned) > 0:
+            keeper = pinned[0]
+        else:
+            # keep the claim costliest to move, ties broken by mod priority
+            keeper = max(claims, key=lambda claim: (costs[claim], getPriority(claim[0])))
+
+        if verbose: print "Conflict on %s at %s" % (kind, id)
+        if verbose: print "\tkeeping %s %s:%s" % (keeper, kind, id)
+        for claim in claims:
+            if claim == keeper:
+                continue
+            moves.append(claim)
+            if costs[claim] >= MANUAL_EDIT_COST:
+                manual += 1
+
+    return moves, manual
+
+"""Get sorted list of free [start, length] runs in an ID range."""
+def getFreeRuns(idRange, used):
+    runs = []
+    for i in idRange:
+        if i in used:
+            continue
+        if len(runs) > 0 and runs[-1][0] + runs[-1][1] == i:
+            runs[-1][1] += 1
+        else:
+            runs.append([i, 1])
+    return runs
+
+"""Take n IDs from free runs, contiguously from the smallest run that fits if bestFit, else first-fit."""
+def allocate(runs, n, bestFit):
+    best = None
+    if bestFit:
+        for i, (start, length) in enumerate(runs):
+            if length >= n and (best is None or length < runs[best][1]):
+                best = i
+                if length == n: break  # can't do better
+    else:
+        for i, (start, length) in enumerate(runs):
+            if length >= n:
+                best = i
+                break
+
+    if best is not None:
+        start = runs[best][0]
+        runs[best][0] += n
+        runs[best][1] -= n
+        if runs[best][1] == 0:
+            del runs[best]
+        return range(start, start + n)
+
+    # fragmented, no run is long enough - take what we can, in order
+    ids = []
+    while len(ids) < n:
+        assert len(runs) > 0, "all IDs in range are used!"
+        take = min(n - len(ids), runs[0][1])
+        ids += range(runs[0][0], runs[0][0] + take)
+        runs[0][0] += take
+        runs[0][1] -= take
+        if runs[0][1] == 0:
+            del runs[0]
+    return ids
+
+"""Solve all ID conflicts of a kind at once, updating and returning the given resolutions.
+
+resolutions: (mod, defaultId) -> None, or preferred ID if pre-populated
+idRanges: rangeKind -> range of IDs to allocate from
+getRangeKind: defaultId -> rangeKind
+getPriority: mod -> number, higher is more important
+isAutoEditable: (mod, kind, defaultId) -> whether config can be edited automatically
+verbose: whether to print each conflict and move
+"""
+def solve(resolutions, kind, idRanges, getRangeKind, getPriority, isAutoEditable, timeBudget=DEFAULT_TIME_BUDGET, verbose=True):
+    deadline = time.time() + timeBudget
+
+    moves, manual = chooseMoves(resolutions, kind, getPriority, isAutoEditable, verbose)
+
+    used = set(getAssignedId(resolutions, claim) for claim in resolutions)
+    freeRuns = {}
+
+    # group by mod, so each mod's moved IDs can be kept together
+    byMod = {}
+    for mod, defaultId in moves:
+        byMod.setdefault((mod, getRangeKind(defaultId)), []).append(defaultId)
+
+    bestFit = True
+    for mod, rangeKind in sorted(byMod.keys(), key=lambda k: -getPriority(k[0])):
+        if bestFit and time.time() > deadline:
+            if verbose: print "NOTICE: time budget of %s seconds exceeded, falling back to first-fit placement" % (timeBudget,)
+            bestFit = False
+
+        if not freeRuns.has_key(rangeKind):
+            freeRuns[rangeKind] = getFreeRuns(idRanges[rangeKind], used)
+
+        defaultIds = sorted(byMod[(mod, rangeKind)])
+        newIds = allocate(freeRuns[rangeKind], len(defaultIds), bestFit)
+        for defaultId, newId in zip(defaultIds, newIds):
+            assert resolutions[(mod, defaultId)] is None, "attempted to resolve already-resolved? %s -> %s but already %s" % ((mod, defaultId), newId, resolutions[(mod, defaultId)])
+            resolutions[(mod, defaultId)] = newId
+            if verbose: print "\tmoving %s %s -> %s" % ((mod, defaultId), defaultId, newId)
+
+    if verbose: print "Solved %s: %s moved IDs, %s predicted manual edits" % (kind, len(moves), manual)
+
+    return resolutions
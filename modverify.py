@@ -0,0 +1,203 @@
+#!/usr/bin/python
+
+# Verify a resolved pack against its resolution plan, with a single boot
+#
+# Boots the server modresolve.py installed once, with the analyzer added for the boot, and
+# compares the blocks, items and biomes it actually registered with the IDs assigned in the
+# resolution state. Reports planned IDs which ended up empty or taken by something else, and
+# registrations which aren't in the plan at all (a mod not analyzed with its current configs,
+# or content added only along with other mods), each with the mod and config file to look at.
+#
+# Usage: modverify.py [--dump FILE]
+
+BOOT_TIMEOUT = 600  # seconds before a hanging server counts as failed
+SIGNATURE_KEYS = {"block": "unlocalizedName", "item": "unlocalizedName", "biome": "name"}  # identifies content across IDs
+USELESS_SIGNATURES = ("tile.null", "item.null", "")
+
+import os, sys, shutil, argparse
+
+import modanalyzer
+import modlist
+import mcmodfixes
+import modresolve
+
+"""Boot the server once with the analyzer, which dumps the IDs and quits. Returns the path of its dump, or None if it didn't get to run."""
+def bootWithAnalyzer(serverRoot, timeout=BOOT_TIMEOUT, analyzerPath=modanalyzer.session.analyzerPath):
+    dumpFile = os.path.join(serverRoot, "mod-analysis.csv")
+    if os.path.exists(dumpFile):
+        os.remove(dumpFile)  # don't mistake a previous boot's for this one's
+
+    analyzer = os.path.join(serverRoot, "mods", modanalyzer.ANALYZER_FILENAME)
+    shutil.copyfile(analyzerPath, analyzer)
+    try:
+        # plenty of heap, the whole pack is loaded
+        modanalyzer.runServer(serverRoot, modanalyzer.MAX_HEAP_MB, timeout, modanalyzer.ANALYSIS_PROFILES["ids"])
+    finally:
+        os.remove(analyzer)  # leave the pack as it was installed
+
+    if not os.path.exists(dumpFile):
+        return None
+    return dumpFile
+
+"""Get what identifies a block, item or biome record across IDs, or None if it has nothing usable."""
+def getSignature(kind, data):
+    if data is None:
+        return None
+    signature = data.get(SIGNATURE_KEYS[kind])
+    if signature is None or str(signature) in USELESS_SIGNATURES:
+        return None
+    return signature
+
+"""Get the planned IDs of a kind: assigned ID -> (mod, defaultId), vanilla IDs included unless a mod takes them."""
+def getPlan(contents, state, kind, analyzer=modanalyzer.session):
+    plan = {}
+    vanilla = analyzer.getModName(None) + ".csv"
+    for defaultId in contents.get(vanilla, {}).get(kind, {}).iterkeys():
+        plan[modlist.intIfInt(defaultId)] = (vanilla, modlist.intIfInt(defaultId))
+
+    for mod, ids in state["assignments"].get(kind, {}).iteritems():
+        for defaultId, assignedId in ids.iteritems():
+            plan[assignedId] = (mod, modlist.intIfInt(defaultId))
+    return plan
+
+"""Get analyzed content of a kind by signature: signature -> [(mod, defaultId)], to tell whose a registration is."""
+def getSignatureOwners(contents, kind):
+    owners = {}
+    for mod, content in contents.iteritems():
+        for defaultId, data in content.get(kind, {}).iteritems():
+            signature = getSignature(kind, data)
+            if signature is not None:
+                owners.setdefault(signature, []).append((mod, modlist.intIfInt(defaultId)))
+    return owners
+
+"""Get the installed config files of a mod ("foo.jar.csv") setting the given ID, as applyConfigEdit() would have edited them."""
+def getConfigFilesWithId(state, mod, kind, id):
+    modName = mod.replace(".csv", "")
+    installed = state["installed"].get(modName)
+    if installed is None:
+        return []
+
+    if kind == "item" and not mcmodfixes.usesUnshiftedItemIDs(modName):
+        id -= 256
+
+    found = []
+    for path in installed["configs"]:
+        if not os.path.exists(path): continue
+        for line in file(path).read().split("\n"):
+            if line.startswith("#"): continue
+            if line.endswith("=%s" % (id,)):
+                found.append(path)
+                break
+    return found
+
+"""Get whether an ID edit of a mod was left for the user to do by hand."""
+def isPendingEdit(state, mod, kind, defaultId, assignedId):
+    installed = state["installed"].get(mod.replace(".csv", ""))
+    if installed is None:
+        return False
+    return any(edit[1:] == [kind, defaultId, assignedId] for edit in installed["pendingEdits"])
+
+"""Compare the registrations in a dump with the resolution plan.
+
+contents and dump are filtered through modresolve.filterItemBlocks(). Returns (list of mismatches
+{"kind", "id", "mod", "defaultId", "problem", "configs"}, number of IDs checked)."""
+def verify(contents, state, dump, analyzer=modanalyzer.session):
+    mismatches = []
+    checked = 0
+    for kind in modresolve.CHECK_CONFLICT_KINDS:
+        plan = getPlan(contents, state, kind, analyzer)
+        owners = getSignatureOwners(contents, kind)
+
+        actual = dict((modlist.intIfInt(id), data) for id, data in dump.get(kind, {}).iteritems())
+        actualBySignature = {}
+        for id, data in actual.iteritems():
+            actualBySignature.setdefault(getSignature(kind, data), []).append(id)
+
+        explained = set()   # registrations already reported as misplaced planned content
+        for assignedId, (mod, defaultId) in sorted(plan.iteritems()):
+            checked += 1
+            signature = getSignature(kind, contents.get(mod, {}).get(kind, {}).get(str(defaultId)))
+            data = actual.get(assignedId)
+            if data is None:
+                problem = "not registered"
+                elsewhere = sorted(id for id in actualBySignature.get(signature, []) if id != assignedId)
+                if signature is not None and len(elsewhere) > 0:
+                    problem += ", found at %s instead" % (", ".join(map(str, elsewhere)),)
+                    explained.update(elsewhere)
+            elif signature is not None and getSignature(kind, data) not in (None, signature):
+                takenBy = sorted(set(owner for owner, ownerId in owners.get(getSignature(kind, data), [])))
+                problem = "taken by %s (%s)" % (getSignature(kind, data), ", ".join(takenBy) or "not analyzed")
+            else:
+                continue
+
+            configs = getConfigFilesWithId(state, mod, kind, assignedId)
+            if assignedId != defaultId and isPendingEdit(state, mod, kind, defaultId, assignedId):
+                problem += ", config edit still pending"
+            mismatches.append({"kind": kind, "id": assignedId, "mod": mod, "defaultId": defaultId, "problem": problem, "configs": configs})
+
+        for id, data in sorted(actual.iteritems()):
+            if plan.has_key(id) or id in explained: continue
+            signature = getSignature(kind, data)
+            guesses = owners.get(signature, [])
+            if len(guesses) == 0:
+                mismatches.append({"kind": kind, "id": id, "mod": None, "defaultId": None,
+                    "problem": "unplanned registration of %s, not in any analysis" % (signature,), "configs": []})
+            for mod, defaultId in guesses:
+                mismatches.append({"kind": kind, "id": id, "mod": mod, "defaultId": defaultId,
+                    "problem": "unplanned registration of %s" % (signature,), "configs": getConfigFilesWithId(state, mod, kind, id)})
+
+    return mismatches, checked
+
+def showMismatches(mismatches):
+    byMod = {}
+    for mismatch in mismatches:
+        byMod.setdefault(mismatch["mod"], []).append(mismatch)
+
+    for mod, modMismatches in sorted(byMod.iteritems()):
+        print "=" * 70
+        if mod is None:
+            print "Unknown mod"
+        else:
+            print mod.replace(".csv", "")
+        for mismatch in modMismatches:
+            planned = ""
+            if mismatch["defaultId"] is not None and mismatch["defaultId"] != mismatch["id"]:
+                planned = " (moved from %s)" % (mismatch["defaultId"],)
+            print "\t%s %s%s: %s\t%s" % (mismatch["kind"], mismatch["id"], planned, mismatch["problem"], " ".join(mismatch["configs"]) or "no config sets it")
+
+def main():
+    parser = argparse.ArgumentParser(description="Boot the resolved pack once and check its IDs against %s" % (modresolve.RESOLUTION_STATE_FILE,))
+    parser.add_argument("--dump", metavar="FILE", help="check an existing analyzer dump of the pack instead of booting")
+    parser.add_argument("--timeout", type=int, default=BOOT_TIMEOUT, help="seconds before a hanging server counts as failed")
+    modanalyzer.addVersionArgument(parser)
+    args = parser.parse_args()
+    analyzer = modanalyzer.useVersionArgument(args)
+
+    state = modresolve.loadResolutionState(analyzer)
+    if state is None:
+        print "No resolution state %s, run modresolve.py first" % (modresolve.getVersionPath(modresolve.RESOLUTION_STATE_FILE, analyzer),)
+        sys.exit(-1)
+
+    dumpFile = args.dump
+    if dumpFile is None:
+        analyzer.setupTestServer()
+        dumpFile = bootWithAnalyzer(analyzer.serverRoot, args.timeout, analyzer.analyzerPath)
+        if dumpFile is None:
+            print "The server failed to boot, see its logs in %s, or run modbisect.py --configs %s" % (analyzer.serverRoot,
+                os.path.join(analyzer.serverRoot, "config"))
+            sys.exit(-1)
+
+    contents = modresolve.filterItemBlocks(analyzer.load())
+    dump = modresolve.filterItemBlocks({"dump": modanalyzer.loadMod(dumpFile)})["dump"]
+
+    mismatches, checked = verify(contents, state, dump, analyzer)
+    if len(mismatches) > 0:
+        showMismatches(mismatches)
+        print "=" * 70
+        print "%s mismatches between the %s planned IDs and the registrations in %s" % (len(mismatches), checked, dumpFile)
+        sys.exit(-1)
+
+    print "All %s planned IDs match the registrations in %s" % (checked, dumpFile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+
+# Watch allmods/ and analyze mods as they land
+#
+# Waits for changes with inotify where available, or else polls. A file is picked up once its
+# size and modification time stayed the same for a while and it reads as a complete zip, so
+# mods still being downloaded or copied are left alone. Then only mods which are new, or newer
+# than their analysis, are analyzed, along with the mods depending on them (their analysis is
+# filtered by their dependencies'). Analyses of mods removed from allmods/ are removed too.
+
+DEBOUNCE_SECONDS = 2.0  # unchanged for this long to count as completely written
+POLL_INTERVAL = 2.0     # seconds between looks at allmods/ without inotify
+
+import os, sys, time, select, zipfile, ctypes, ctypes.util, argparse
+
+import modanalyzer
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+"""Waits for changes in a directory with Linux inotify."""
+class InotifyWatcher(object):
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init"):
+            raise OSError("inotify not supported")
+
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, path, mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    """Wait until something changed, or timeout seconds (None for no timeout)."""
+    def wait(self, timeout=None):
+        readable, writable, failed = select.select([self.fd], [], [], timeout)
+        if len(readable) > 0:
+            os.read(self.fd, 64 * 1024)  # which files changed doesn't matter, the directory is rescanned
+
+"""Waits for changes in a directory by not waiting long."""
+class PollingWatcher(object):
+    def wait(self, timeout=None):
+        if timeout is None or timeout > POLL_INTERVAL:
+            timeout = POLL_INTERVAL
+        time.sleep(timeout)
+
+def getWatcher(path):
+    try:
+        return InotifyWatcher(path)
+    except (OSError, AttributeError) as e:
+        print "Polling %s every %s seconds, no inotify: %s" % (path, POLL_INTERVAL, e)
+        return PollingWatcher()
+
+"""Get filename -> (size, mtime) of the mods in allmods/."""
+def getModSignatures():
+    signatures = {}
+    for name in os.listdir(modanalyzer.ALL_MODS_DIR):
+        if name.startswith("."): continue
+        path = os.path.join(modanalyzer.ALL_MODS_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue  # removed meanwhile
+        signatures[path] = (st.st_size, st.st_mtime)
+    return signatures
+
+"""Check if a mod is new or changed since its analysis, or its analysis lacks sections of the profile."""
+def needsAnalysis(mod):
+    if not modanalyzer.isAnalyzed(mod):
+        return True
+    return mod is not None and os.path.getmtime(mod) > os.path.getmtime(modanalyzer.getInfoFilename(mod))
+
+"""Get the mods depending on any of the given mods, directly or indirectly."""
+def getDependents(mods, allMods):
+    mods = set(mods)
+    return set(other for other in allMods if other not in mods and len(modanalyzer.getRecursiveDepsFilenames(other) & mods) > 0)
+
+"""Remove the analysis results and default configs of a mod."""
+def removeAnalysis(mod):
+    print "Removing analysis of",modanalyzer.getModName(mod)
+    for path in (modanalyzer.getInfoFilename(mod), modanalyzer.getConfigManifestFilename(mod), modanalyzer.getSectionsFilename(mod)):
+        if os.path.exists(path):
+            os.remove(path)
+
+"""Analyze what changed among the given complete mods, except those to skip. Returns mods which failed to analyze."""
+def update(mods, removed, skip, jobs, memoryMB):
+    for mod in removed:
+        removeAnalysis(mod)
+
+    missing = modanalyzer.loadDependencies(mods)
+    for mod, deps in sorted(missing.iteritems()):
+        print "NOTICE: Not analyzing %s until its missing dependencies are added: %s" % (mod, ", ".join(deps))
+
+    # not analyzable without what's missing, neither are their dependents
+    unanalyzable = set(missing.keys()) | set(skip)
+    unanalyzable |= getDependents(unanalyzable, mods)
+
+    stale = set(mod for mod in [None] + mods if mod not in unanalyzable and needsAnalysis(mod))
+    queue = stale | (getDependents(stale, mods) - unanalyzable)
+    if len(queue) == 0:
+        return set()
+
+    print "Analyzing %s changed mods and %s dependents" % (len(stale), len(queue) - len(stale))
+    try:
+        modanalyzer.analyzeAll(sorted(queue), jobs, memoryMB, rescan=True)
+    except modanalyzer.CircularDependencyError as e:
+        print "NOTICE: %s" % (e,)
+        return set(mod for mod in queue if needsAnalysis(mod))
+    except Exception as e:
+        print "Analysis failed: %s" % (e,)
+        return set(mod for mod in queue if needsAnalysis(mod))
+    return set()
+
+def watch(jobs=1, memoryMB=None):
+    watcher = getWatcher(modanalyzer.ALL_MODS_DIR)
+    print "Watching %s for mods to analyze" % (modanalyzer.ALL_MODS_DIR,)
+
+    firstSeen = {}      # filename -> ((size, mtime), time first seen with them)
+    processed = None    # filename -> (size, mtime) of the complete mods last updated for
+    failed = {}         # filename -> (size, mtime) it failed to analyze with, skipped until changed
+    while True:
+        now = time.time()
+        signatures = getModSignatures()
+        for path, signature in signatures.iteritems():
+            if firstSeen.get(path, (None,))[0] != signature:
+                firstSeen[path] = (signature, now)
+        for path in set(firstSeen.keys()) - set(signatures.keys()):
+            del firstSeen[path]
+
+        complete = {}
+        settling = False
+        for path, signature in signatures.iteritems():
+            if now - firstSeen[path][1] < DEBOUNCE_SECONDS:
+                settling = True
+            elif zipfile.is_zipfile(path):
+                complete[path] = signature
+            elif processed is None or processed.get(path) != signature:
+                print "NOTICE: Ignoring %s, not a complete zip" % (path,)
+
+        # dependencies might be among the files being written, so wait for all
+        if not settling and complete != processed:
+            # renames mods named without versions, which are picked up again by their new names
+            mods = [mod for mod in modanalyzer.getMods() if complete.has_key(mod)]
+            skip = [mod for mod in mods if failed.get(mod) == complete[mod]]
+            removed = []
+            if processed is not None:
+                removed = sorted(set(processed.keys()) - set(signatures.keys()))
+
+            for mod in update(mods, removed, skip, jobs, memoryMB):
+                if complete.has_key(mod):
+                    failed[mod] = complete[mod]
+            processed = complete
+            print "Waiting for changes in %s" % (modanalyzer.ALL_MODS_DIR,)
+
+        watcher.wait(DEBOUNCE_SECONDS if settling else None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch %s and analyze new or changed mods" % (modanalyzer.ALL_MODS_DIR,))
+    parser.add_argument("--jobs", type=int, default=1, help="servers to run at once, each in its own folder")
+    parser.add_argument("--memory", type=int, help="MB of memory for the servers running at once (default: currently available)")
+    parser.add_argument("--profile", choices=sorted(modanalyzer.ANALYSIS_PROFILES.keys()), default=modanalyzer.DEFAULT_PROFILE, help="sections to analyze")
+    args = parser.parse_args()
+
+    modanalyzer.session.setProfile(args.profile)
+    modanalyzer.setupTestServer()
+    if not os.path.exists(modanalyzer.DATA_DIR): os.mkdir(modanalyzer.DATA_DIR)
+    if not os.path.exists(modanalyzer.CONFIGS_DIR): os.mkdir(modanalyzer.CONFIGS_DIR)
+    if not os.path.exists(modanalyzer.ALL_MODS_DIR): os.mkdir(modanalyzer.ALL_MODS_DIR)
+
+    memoryMB = args.memory
+    if memoryMB is None:
+        memoryMB = modanalyzer.getAvailableMemoryMB()
+
+    try:
+        watch(args.jobs, memoryMB)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
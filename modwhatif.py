@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+# Compare candidate packs without installing them
+#
+# Runs the conflict resolution of modresolve.py on the analyzed contents, loaded once, for each
+# candidate selection of mods, and reports how many ID conflicts it has, how many IDs would be
+# moved, how many of the moves would need manual config edits, and how full the ID ranges get.
+# Nothing is written: temp-server, include.txt, priority.txt and the resolution state are left
+# as they are, so many candidates can be compared in seconds before picking one for modresolve.
+#
+# Usage: modwhatif.py candidate1.txt candidate2.txt ...
+#
+# Each candidate file lists mods in allmods like include.txt. They are ordered by priority.txt
+# (or the default priority if there is none yet), or with --ordered by their order in the file,
+# highest priority first.
+
+import argparse
+
+import modanalyzer
+import modresolve
+
+"""Read a candidate selection of mod filenames, like include.txt."""
+def readCandidate(filename):
+    mods = [line.strip() for line in file(filename).readlines()]
+    return [mod for mod in mods if mod != "" and not mod.startswith("#")]
+
+"""Get wanted mods in priority order, highest first: as in priority, then any others by default priority."""
+def orderByPriority(contents, wantedMods, priority, analyzer=modanalyzer.session):
+    rank = dict((mod, i) for i, mod in enumerate(priority or []))
+    ranked = sorted([mod for mod in wantedMods if rank.has_key(mod)], key=lambda mod: rank[mod])
+    others = [mod for mod in wantedMods if not rank.has_key(mod)]
+    scores = dict((mod, modresolve.getModScore(contents, mod, analyzer=analyzer) if contents.has_key(mod + ".csv") else -1) for mod in others)
+    others.sort(key=lambda mod: (-scores[mod], mod))
+    return ranked + others
+
+"""Get used and available IDs in each ID range of a kind, from its resolutions: range kind -> (used, size)."""
+def getIdUsage(kind, resolutions):
+    assigned = set(modresolve.getAssignedId(resolutions, mod, defaultId) for mod, defaultId in resolutions)
+
+    usage = {}
+    for rangeKind, ids in modresolve.ID_RANGES.iteritems():
+        if rangeKind != kind and not (kind == "block" and rangeKind == "blocktg"): continue
+        used = len([id for id in assigned if ids[0] <= id <= ids[-1]])
+        usage[rangeKind] = (used, len(ids))
+    return usage
+
+"""Evaluate a candidate pack of analyzed mods in priority order, highest first, like modresolve.py would resolve it.
+
+contents are filtered through modresolve.filterItemBlocks(). Returns {"conflicts", "moved", "manualEdits": kind -> count,
+"usage": range kind -> (used, size), "unanalyzed": mods without analysis, left out}."""
+def evaluate(contents, sortedMods, preferredIDs={}, state=None, analyzer=modanalyzer.session):
+    unanalyzed = [mod for mod in sortedMods if not contents.has_key(mod + ".csv")]
+    sortedMods = [mod for mod in sortedMods if contents.has_key(mod + ".csv")]
+
+    reprioritized = set()
+    if state is not None:
+        reprioritized = modresolve.getReprioritizedMods(state["sortedMods"], sortedMods)
+
+    priority = modresolve.ModPriority(sortedMods + [analyzer.getModName(None)])
+    result = {"conflicts": {}, "moved": {}, "manualEdits": {}, "usage": {}, "unanalyzed": unanalyzed}
+    for kind in modresolve.CHECK_CONFLICT_KINDS:
+        stableAssignments = modresolve.getStableAssignments(state, kind, reprioritized)
+
+        initial = modresolve.getInitialResolutions(contents, kind, priority, preferredIDs, stableAssignments, verbose=False)
+        result["conflicts"][kind] = len([usingMods for usingMods in modresolve.getConflicts(initial).itervalues()
+            if len(usingMods) > 1 and not modresolve.vanillaOverride(usingMods)])
+
+        resolutions = modresolve.getConflictResolutions(contents, kind, priority, preferredIDs, stableAssignments, verbose=False)
+        moved = [(mod, defaultId) for (mod, defaultId), assignedId in resolutions.iteritems()
+            if assignedId is not None and assignedId != defaultId and not mod.startswith("Minecraft")]
+        result["moved"][kind] = len(moved)
+        result["manualEdits"][kind] = len([1 for mod, defaultId in moved if not modresolve.isAutoEditable(mod, kind, defaultId, analyzer)])
+
+        result["usage"].update(getIdUsage(kind, resolutions))
+
+    return result
+
+"""Evaluate many candidate packs against the same contents: list of (name, wanted mods). Returns list of (name, sortedMods, result)."""
+def evaluateAll(contents, candidates, priority=None, preferredIDs={}, state=None, analyzer=modanalyzer.session):
+    evaluated = []
+    for name, wantedMods in candidates:
+        if priority is None:
+            sortedMods = list(wantedMods)
+        else:
+            sortedMods = orderByPriority(contents, wantedMods, priority, analyzer)
+        evaluated.append((name, sortedMods, evaluate(contents, sortedMods, preferredIDs, state, analyzer)))
+    return evaluated
+
+def showEvaluations(evaluated):
+    kinds = modresolve.CHECK_CONFLICT_KINDS
+    rangeKinds = sorted(set(rangeKind for name, sortedMods, result in evaluated for rangeKind in result["usage"]))
+
+    print "\t".join(["mods", "conflicts", "moved", "manual edits"] + ["%s used" % (rangeKind,) for rangeKind in rangeKinds] + ["candidate"])
+    for name, sortedMods, result in evaluated:
+        row = [str(len(sortedMods) - len(result["unanalyzed"]))]
+        for key in ("conflicts", "moved", "manualEdits"):
+            row.append("%s (%s)" % (sum(result[key].values()), " ".join("%s %s" % (result[key][kind], kind) for kind in kinds)))
+        for rangeKind in rangeKinds:
+            used, size = result["usage"].get(rangeKind, (0, 1))
+            row.append("%s %.1f%%" % (used, 100.0 * used / size))
+        row.append(name)
+        print "\t".join(row)
+
+    for name, sortedMods, result in evaluated:
+        if len(result["unanalyzed"]) > 0:
+            print "NOTICE: %s includes mods not analyzed, left out: %s" % (name, " ".join(result["unanalyzed"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare candidate mod selections by their ID conflicts, without installing them")
+    parser.add_argument("candidates", nargs="+", metavar="FILE", help="mod selections, one mod per line like %s" % (modresolve.WANTED_MODS_FILENAME,))
+    parser.add_argument("--ordered", action="store_true", help="use the order of the mods in each file as their priority, instead of %s" % (modresolve.PRIORITY_FILE,))
+    parser.add_argument("--clean", action="store_true", help="ignore the IDs assigned in %s" % (modresolve.RESOLUTION_STATE_FILE,))
+    modanalyzer.addVersionArgument(parser)
+    args = parser.parse_args()
+    analyzer = modanalyzer.useVersionArgument(args)
+
+    contents = modresolve.filterItemBlocks(analyzer.load())
+    preferredIDs = modresolve.loadNEIDump()
+    state = None
+    if not args.clean:
+        state = modresolve.loadResolutionState(analyzer)
+
+    priority = None
+    if not args.ordered:
+        priority = modresolve.readPriorityFile() or []
+
+    candidates = [(filename, readCandidate(filename)) for filename in args.candidates]
+    showEvaluations(evaluateAll(contents, candidates, priority, preferredIDs, state, analyzer))
+
+if __name__ == "__main__":
+    main()
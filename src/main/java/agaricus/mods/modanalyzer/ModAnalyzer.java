@@ -3,13 +3,17 @@ package agaricus.mods.modanalyzer;
 import com.google.common.base.Joiner;
 import cpw.mods.fml.common.FMLLog;
 import cpw.mods.fml.common.ITickHandler;
+import cpw.mods.fml.common.Loader;
 import cpw.mods.fml.common.Mod;
 import cpw.mods.fml.common.Mod.PostInit;
 import cpw.mods.fml.common.Mod.PreInit;
+import cpw.mods.fml.common.Mod.ServerStarting;
+import cpw.mods.fml.common.ModContainer;
 import cpw.mods.fml.common.TickType;
 import cpw.mods.fml.common.event.FMLInitializationEvent;
 import cpw.mods.fml.common.event.FMLPostInitializationEvent;
 import cpw.mods.fml.common.event.FMLPreInitializationEvent;
+import cpw.mods.fml.common.event.FMLServerStartingEvent;
 import cpw.mods.fml.common.network.NetworkMod;
 import cpw.mods.fml.common.registry.GameData;
 import cpw.mods.fml.common.registry.ItemData;
@@ -29,35 +33,55 @@ import net.minecraftforge.oredict.OreDictionary;
 import net.minecraftforge.oredict.ShapedOreRecipe;
 import net.minecraftforge.oredict.ShapelessOreRecipe;
 
+import java.io.BufferedReader;
 import java.io.BufferedWriter;
+import java.io.FileReader;
 import java.io.FileWriter;
 import java.io.IOException;
 import java.io.InputStream;
 import java.util.*;
 import java.util.logging.Level;
 
-@Mod(modid = "ModAnalyzer", name = "ModAnalyzer", version = "1.0-SNAPSHOT") // TODO: version from resource
+// loaded before all other mods, so each of our handlers marks the start of a loading phase for the profiler
+@Mod(modid = "ModAnalyzer", name = "ModAnalyzer", version = "1.0-SNAPSHOT", dependencies = "before:*") // TODO: version from resource
 @NetworkMod(clientSideRequired = false, serverSideRequired = false)
 public class ModAnalyzer implements ITickHandler {
 
+    private static final String[] ALL_SECTIONS = { "profile", "block", "item", "biome", "enchantment", "entity", "smelting", "oredict", "crafting" };
+
     private boolean initialized = false;
 
+    private LoadProfiler loadProfiler = new LoadProfiler();
+
+    public ModAnalyzer() {
+        loadProfiler.start();
+    }
+
     @PreInit
     public void preInit(FMLPreInitializationEvent event) {
+        loadProfiler.setPhase("preInit");
     }
 
     @Mod.Init
     public void init(FMLInitializationEvent event) {
+        loadProfiler.setPhase("init");
     }
 
     @PostInit
     public void postInit(FMLPostInitializationEvent event) {
+        loadProfiler.setPhase("postInit");
+
         FMLLog.log(Level.FINE, "Loading ModAnalyzer...");
 
         TickRegistry.registerTickHandler(this, Side.SERVER);
         //TickRegistry.registerTickHandler(this, Side.CLIENT); // TODO
     }
 
+    @ServerStarting
+    public void serverStarting(FMLServerStartingEvent event) {
+        loadProfiler.setPhase("serverStart");
+    }
+
     @Override
     public void tickEnd(EnumSet<TickType> type, Object... tickData) {
         if (initialized) {
@@ -65,21 +89,30 @@ public class ModAnalyzer implements ITickHandler {
         }
         initialized = true;
 
+        loadProfiler.finish();
+
         FMLLog.log(Level.FINE, "ModAnalyzer analyzing...");
 
-        dumpBlocks();
-        dumpItems();
-        dumpBiomes();
-        dumpEnchantments();
-        dumpEntities();
-        dumpSmeltingRecipes();
-        dumpOreDict();
-        dumpCraftingRecipes();
+        Set<String> sections = getSections();
+        if (sections.contains("profile")) dumpProfile();
+        if (sections.contains("block")) dumpBlocks();
+        if (sections.contains("item")) dumpItems();
+        if (sections.contains("biome")) dumpBiomes();
+        if (sections.contains("enchantment")) dumpEnchantments();
+        if (sections.contains("entity")) dumpEntities();
+        if (sections.contains("smelting")) dumpSmeltingRecipes();
+        if (sections.contains("oredict")) dumpOreDict();
+        if (sections.contains("crafting")) dumpCraftingRecipes();
 
         try {
             BufferedWriter out = new BufferedWriter(new FileWriter("mod-analysis.csv"));
             out.write(stringBuilder.toString());
             out.close();
+
+            // which sections the analysis has, so results of a partial analysis aren't mistaken for complete ones
+            out = new BufferedWriter(new FileWriter("mod-analysis.sections"));
+            out.write(Joiner.on(',').join(sections) + "\n");
+            out.close();
         } catch (IOException ex) {
             throw new RuntimeException(ex);
         }
@@ -101,6 +134,171 @@ public class ModAnalyzer implements ITickHandler {
         return "ModAnalyzer";
     }
 
+    /**
+     * Get the sections to dump: from the modanalyzer.sections system property, or else the
+     * mod-analysis-sections.txt file in the server folder, comma-separated. Default all of them.
+     */
+    private static Set<String> getSections() {
+        String list = System.getProperty("modanalyzer.sections");
+        if (list == null) {
+            try {
+                BufferedReader in = new BufferedReader(new FileReader("mod-analysis-sections.txt"));
+                StringBuilder sb = new StringBuilder();
+                String line;
+                while ((line = in.readLine()) != null) {
+                    sb.append(line).append(',');
+                }
+                in.close();
+                list = sb.toString();
+            } catch (IOException ex) {
+                return new LinkedHashSet<String>(Arrays.asList(ALL_SECTIONS));
+            }
+        }
+
+        Set<String> sections = new LinkedHashSet<String>();
+        for (String section : list.split("[,\\s]+")) {
+            if (section.isEmpty()) {
+                continue;
+            }
+            if (!Arrays.asList(ALL_SECTIONS).contains(section)) {
+                FMLLog.log(Level.WARNING, "ModAnalyzer: unknown section %s, expected one of %s", section, Joiner.on(',').join(ALL_SECTIONS));
+                continue;
+            }
+            sections.add(section);
+        }
+        return sections;
+    }
+
+    /**
+     * Samples which mod container FML is currently sending events to, attributing the elapsed time
+     * and heap growth to that mod and loading phase. FML has no per-mod timing hooks, so this is
+     * accurate to about the sampling interval.
+     */
+    private static class LoadProfiler extends Thread {
+        private static final long SAMPLE_INTERVAL_MILLIS = 1;
+
+        private volatile String phase = "construct";
+        private volatile boolean running = true;
+
+        // mod ID -> phase -> {nanoseconds, heap growth bytes, heap used bytes at end of its last turn}
+        private final Map<String, Map<String, long[]>> modStats = new LinkedHashMap<String, Map<String, long[]>>();
+        // phase -> {nanoseconds, heap used bytes at end}
+        private final Map<String, long[]> phaseStats = new LinkedHashMap<String, long[]>();
+
+        public LoadProfiler() {
+            super("ModAnalyzer load profiler");
+            setDaemon(true);
+        }
+
+        public void setPhase(String phase) {
+            this.phase = phase;
+        }
+
+        public void finish() {
+            running = false;
+            try {
+                join();
+            } catch (InterruptedException ex) {
+                Thread.currentThread().interrupt();
+            }
+        }
+
+        @Override
+        public void run() {
+            String currentMod = null;
+            String currentPhase = phase;
+            long modStart = System.nanoTime(), phaseStart = modStart;
+            long heapStart = getUsedHeap();
+
+            while (true) {
+                boolean done = !running;
+
+                ModContainer container = Loader.instance().activeModContainer();
+                String mod = container != null ? container.getModId() : null;
+                String newPhase = phase;
+
+                if (done || !newPhase.equals(currentPhase) || (mod == null ? currentMod != null : !mod.equals(currentMod))) {
+                    long now = System.nanoTime();
+                    long heap = getUsedHeap();
+
+                    if (currentMod != null) {
+                        if (!modStats.containsKey(currentMod)) {
+                            modStats.put(currentMod, new LinkedHashMap<String, long[]>());
+                        }
+                        long[] stats = modStats.get(currentMod).get(currentPhase);
+                        if (stats == null) {
+                            stats = new long[3];
+                            modStats.get(currentMod).put(currentPhase, stats);
+                        }
+                        stats[0] += now - modStart;
+                        stats[1] += heap - heapStart;
+                        stats[2] = heap;
+                    }
+
+                    if (done || !newPhase.equals(currentPhase)) {
+                        phaseStats.put(currentPhase, new long[] { now - phaseStart, heap });
+                        phaseStart = now;
+                    }
+
+                    currentMod = mod;
+                    currentPhase = newPhase;
+                    modStart = now;
+                    heapStart = heap;
+                }
+
+                if (done) {
+                    break;
+                }
+
+                try {
+                    Thread.sleep(SAMPLE_INTERVAL_MILLIS);
+                } catch (InterruptedException ex) {
+                    break;
+                }
+            }
+        }
+
+        private static long getUsedHeap() {
+            Runtime runtime = Runtime.getRuntime();
+            return runtime.totalMemory() - runtime.freeMemory();
+        }
+    }
+
+    private static double toMillis(long nanos) {
+        return Math.round(nanos / 1000.0) / 1000.0;
+    }
+
+    private static long toKilobytes(long bytes) {
+        return bytes / 1024;
+    }
+
+    private void dumpProfile() {
+        // per mod container, time and heap growth in each loading phase
+        for (Map.Entry<String, Map<String, long[]>> modEntry : loadProfiler.modStats.entrySet()) {
+            setObject("profile", modEntry.getKey());
+            for (Map.Entry<String, long[]> entry : modEntry.getValue().entrySet()) {
+                long[] stats = entry.getValue();
+                put(entry.getKey() + ".ms", toMillis(stats[0]));
+                put(entry.getKey() + ".heapGrowthKB", toKilobytes(stats[1]));
+                put(entry.getKey() + ".heapUsedKB", toKilobytes(stats[2]));
+            }
+        }
+
+        // whole server, including time outside of any mod
+        long totalNanos = 0, heapUsed = 0;
+        for (Map.Entry<String, long[]> entry : loadProfiler.phaseStats.entrySet()) {
+            setObject("profile/phase", entry.getKey());
+            put("ms", toMillis(entry.getValue()[0]));
+            put("heapUsedKB", toKilobytes(entry.getValue()[1]));
+            totalNanos += entry.getValue()[0];
+            heapUsed = entry.getValue()[1];
+        }
+        setObject("profile/phase", "total");
+        put("ms", toMillis(totalNanos));
+        put("heapUsedKB", toKilobytes(heapUsed));
+        put("heapMaxKB", toKilobytes(Runtime.getRuntime().maxMemory()));
+    }
+
     private void dumpBlocks() {
         Random random = new Random(0);
 
@@ -331,6 +529,21 @@ public class ModAnalyzer implements ITickHandler {
         return Joiner.on(";").join(strings);
     }
 
+    /**
+     * Get sorted names of the alternatives for one ingredient slot, e.g. items registered under an ore dictionary name
+     */
+    public String getGlobalItemNameAlternatives(List list) {
+        List<String> elements = new ArrayList<String>();
+
+        for (Object element : list) {
+            elements.add(getGlobalItemName((ItemStack) element));
+        }
+
+        Collections.sort(elements);
+
+        return Joiner.on(",").join(elements);
+    }
+
     public String getGlobalItemNames(ItemStack[] itemStacks) {
         List<String> strings = new ArrayList<String>();
 
@@ -389,7 +602,7 @@ public class ModAnalyzer implements ITickHandler {
                 for (Object input : inputs) {
                     // TODO: refactor
                     if (input instanceof List) {
-                        strings.add(getGlobalItemNamesSorted((List) input));
+                        strings.add(getGlobalItemNameAlternatives((List) input));
                     } else if (input instanceof ItemStack) {
                         strings.add(getGlobalItemName((ItemStack) input));
                     } else {